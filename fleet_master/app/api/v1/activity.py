@@ -1,19 +1,18 @@
-import asyncio
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import BaseModel
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
-from shared.db.session import get_db, async_session
+from shared.db.session import get_db
 from shared.models.user_activity_detection import UserActivityDetection
 from app.services.handle_sign_from_ws import handle_immediate_sign
+from app.services.batch_sign import batch_sign_for_activity
 from shared.utils.http import AsyncHttpClient, get_http_client
 from shared.utils.logger import DBLogger, get_logger
 from shared.models.user import User
 from app.api.deps import get_current_user
 from shared.schemas.sign_activity import UserActivityDetectionResponse
-from typing import List, Dict, Any
-import copy
+from typing import List
 
 router = APIRouter()
 
@@ -42,99 +41,22 @@ class qrcode_data(BaseModel):
 @router.post("/qr-code")
 async def qrcode_signin(
     data: qrcode_data,
+    response: Response,
     db: AsyncSession = Depends(get_db),
+    logger: DBLogger = Depends(get_logger),
 ):
-    # 步骤1: 先获取所有需要签到的用户检测记录
-    detections_query = await db.execute(
-        select(UserActivityDetection)
-        .where(UserActivityDetection.activity_id == data.activity_id)
-        .options(selectinload(UserActivityDetection.activity))
-        .options(selectinload(UserActivityDetection.user).selectinload(User.worker))
+    # 批量加载用户、节点和配置，按节点分组并发签到，最后一次性更新检测记录
+    batch = await batch_sign_for_activity(
+        db=db,
+        activity_id=data.activity_id,
+        enc=data.enc,
+        logger=logger,
     )
-    detections = detections_query.scalars().all()
-    
-    if not detections:
+    if not batch.results:
         raise HTTPException(status_code=400, detail="没有需要签到的记录")
-    # TODO: 优化已签到返回，错误返回，前端渲染字段更新，优化实现逻辑
-    # 步骤2: 创建签到函数，确保每个签到任务使用独立的数据库会话和HTTP客户端
-    async def sign_for_detection(detection) -> Dict[str, Any]:
-        async with async_session() as session:
-            try:
-                task_http_client = AsyncHttpClient()
-                task_logger = DBLogger(session)
-                
-                # 从数据库获取最新的用户和活动数据，避免使用过期数据
-                user_query = await session.execute(
-                    select(User)
-                    .where(User.id == detection.user_id)
-                    .options(selectinload(User.worker))
-                )
-                user = user_query.scalars().first()
-                
-                activity_query = await session.execute(
-                    select(UserActivityDetection)
-                    .where(UserActivityDetection.id == detection.id)
-                    .options(selectinload(UserActivityDetection.activity))
-                )
-                fresh_detection = activity_query.scalars().first()
-                
-                if not fresh_detection:
-                    return {
-                        user.person_name: {
-                            "status": "failed",
-                            "message": "未开启监控"
-                        }
-                    }
-                if fresh_detection.status == "success":
-                    return {
-                        user.person_name: {
-                            "status": "success",
-                            "message": "签到成功"
-                        }
-                    }
-                
-                # 执行签到
-                result = await handle_immediate_sign(
-                    user=user,
-                    activity=fresh_detection.activity,
-                    enc=data.enc,
-                    detection=fresh_detection,
-                    db=session,
-                    http_client=task_http_client,
-                    logger=task_logger
-                )
-                
-                # 成功时返回用户相关信息
-                if isinstance(result, dict) and result.get("result") == True:
-                    return {
-                        user.person_name: {
-                            "status": "success",
-                            "message": "签到成功"
-                        }
-                    }
-                
-                # 返回结果，包含错误信息（如果有）
-                return {
-                    user.person_name: {
-                        "status": "failed",
-                        "message": result.get('message', '未知错误')
-                    }
-                }
-                
-            except Exception as e:
-                # 捕获并记录所有异常，确保一个任务的失败不会影响其他任务
-                return {
-                    user.person_name: {
-                        "status": "failed",
-                        "message": str(e)
-                    }
-                }
     
-    # 步骤3: 并发执行所有签到任务
-    tasks = [sign_for_detection(detection) for detection in detections]
-    results = await asyncio.gather(*tasks)
-    
-    return results
+    response.headers["X-Batch-Sign-Elapsed"] = f"{batch.elapsed:.3f}"
+    return batch.results
 
 @router.get("/{uuid}")
 async def get_activity(
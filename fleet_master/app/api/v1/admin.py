@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import datetime
 import psutil
 from datetime import timezone
@@ -9,9 +9,27 @@ from sqlalchemy.future import select
 
 from app.api.deps import get_current_active_admin
 from shared.db.session import get_db, engine
+from shared.utils.log_sink import log_sink
+from shared.utils.http_pool import http_pool
+from shared.utils.http_metrics import http_metrics
+from shared.utils.circuit_breaker import circuit_breakers
+from shared.utils.retry_policy import retry_budget
+from shared.utils.pubsub import pubsub
+from shared.utils.log_policy import log_policy, reload_from_settings, update_log_policy
+from shared.schemas.log import LogPolicyConfig
 from shared.models.user import User
 from shared.schemas.user import UserResponse, UserUpdate, UserDetail, UserResponseForAdmin
 from app.core.security import get_password_hash
+from app.services import lookup_cache
+from app.services.job_queue import job_queue
+from shared.models.sign_job import JobStatus, SignJob
+from app.services.lookup_cache import invalidate_user
+from app.services.config_cache import sign_config_cache
+from app.services.heartbeat import heartbeats
+from app.services.notifier import notifier
+from app.services.placement import placement, rebalance
+from shared.models.worker import Worker
+from shared.utils.http import AsyncHttpClient, get_http_client
 from scheduler.jobs.jobs import measure_ws_connections
 import time
 import traceback
@@ -28,8 +46,8 @@ async def ws_connect_all(
     """
     连接所有节点
     """
-    await measure_ws_connections()
-    return {"message": "连接所有节点"}
+    metrics = await measure_ws_connections()
+    return {"message": "连接所有节点", "metrics": metrics}
 
 @router.get("/users", response_model=List[UserResponseForAdmin])
 async def read_users(
@@ -84,6 +102,7 @@ async def delete_user(
     
     await db.delete(user)
     await db.commit()
+    invalidate_user(user_id)
 
 
 
@@ -134,6 +153,217 @@ async def get_server_status(
     return convert_to_serializable(system_info)
 
 
+@router.get("/system/log-sink", response_model=Dict[str, Any])
+async def get_log_sink_status(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取日志批量写入器状态（管理员）
+    
+    返回当前进程中缓冲、丢弃、已写入的日志条数
+    """
+    return log_sink.stats()
+
+
+@router.get("/system/log-policy", response_model=Dict[str, Any])
+async def get_log_policy(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取数据库日志写入策略和当前进程被过滤的日志数（管理员）
+    """
+    return log_policy.stats()
+
+
+@router.put("/system/log-policy", response_model=Dict[str, Any])
+async def put_log_policy(
+    config: LogPolicyConfig,
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    更新数据库日志写入策略，所有进程立即生效，进程重启后恢复为配置中的 LOG_POLICY（管理员）
+    """
+    await update_log_policy(config)
+    return log_policy.stats()
+
+
+@router.post("/system/log-policy/reload", response_model=Dict[str, Any])
+async def reload_log_policy(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    重新读取配置中的 LOG_POLICY 并应用到所有进程（管理员）
+    """
+    try:
+        config = reload_from_settings()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"LOG_POLICY 配置无效: {e}")
+    await update_log_policy(config)
+    return log_policy.stats()
+
+
+@router.get("/system/http-pool", response_model=Dict[str, Any])
+async def get_http_pool_status(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取HTTP连接池状态（管理员）
+    
+    返回当前进程中每个上游的请求数、并发数和连接数
+    """
+    return http_pool.stats()
+
+
+@router.get("/system/http-metrics", response_model=Dict[str, Any])
+async def get_http_metrics(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取上游HTTP请求统计（管理员）
+    
+    按上游和主机汇总所有进程的请求数、状态码、重试次数、连接复用率和延迟分位数，
+    retry_budget 为当前进程最近的重试预算使用情况
+    """
+    return {**await http_metrics.summary(), "retry_budget": retry_budget.stats()}
+
+
+@router.get("/system/circuit-breakers", response_model=Dict[str, Any])
+async def get_circuit_breakers(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取上游熔断状态（管理员）
+    
+    返回当前进程中每个上游的熔断状态、最近的失败次数、被拒绝的请求数和各路由的自适应超时
+    """
+    return circuit_breakers.stats()
+
+
+@router.get("/system/notifier", response_model=Dict[str, Any])
+async def get_notifier_status(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取推送通知调度器状态（管理员）
+    
+    返回当前进程等待合并和发送的通知数、合并/限速/丢弃次数和各推送渠道的成功、失败次数
+    """
+    return notifier.stats()
+
+
+@router.get("/system/lookup-cache", response_model=Dict[str, Any])
+async def get_lookup_cache_status(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取活动上报查询缓存状态（管理员）
+    
+    返回当前进程中用户、活动、签到配置缓存的命中情况以及合并的并发请求数
+    """
+    return {**lookup_cache.stats(), "sign_configs": sign_config_cache.stats()}
+
+
+@router.get("/system/job-queue", response_model=Dict[str, Any])
+async def get_job_queue_status(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取签到任务队列状态（管理员）
+    
+    返回各状态的任务数、最早待执行任务的等待时间，以及最近一小时任务的等待、执行和端到端耗时分位数
+    """
+    return await job_queue.stats(db)
+
+
+@router.get("/system/job-queue/dead", response_model=List[Dict[str, Any]])
+async def read_dead_jobs(
+    skip: int = 0,
+    limit: int = 100,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取死信任务列表（管理员）
+    """
+    result = await db.execute(
+        select(SignJob)
+        .where(SignJob.status == JobStatus.DEAD)
+        .order_by(SignJob.finished_at.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+    return [job.model_dump() for job in result.scalars().all()]
+
+
+@router.post("/system/job-queue/dead/{job_id}/retry")
+async def retry_dead_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    将死信任务重新放回队列（管理员）
+    """
+    if not await job_queue.retry_dead(db, job_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="死信任务不存在"
+        )
+    return {"status": "ok"}
+
+
+@router.get("/system/pubsub", response_model=Dict[str, Any])
+async def get_pubsub_status(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取当前进程的缓存失效通知状态（管理员）
+    """
+    return pubsub.stats()
+
+
+@router.get("/system/heartbeats", response_model=Dict[str, Any])
+async def get_heartbeat_status(
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取当前进程心跳缓冲状态（管理员）
+    """
+    return heartbeats.stats()
+
+
+@router.get("/system/placement", response_model=List[Dict[str, Any]])
+async def get_placement(
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取各工作节点的负载评分（管理员）
+    
+    评分越低越优先分配新的监控用户
+    """
+    await placement.refresh(db)
+    workers = (await db.execute(select(Worker))).scalars().all()
+    return placement.snapshot(workers)
+
+
+@router.post("/system/placement/rebalance", response_model=Dict[str, Any])
+async def rebalance_workers(
+    dry_run: bool = True,
+    max_moves: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+    http_client: AsyncHttpClient = Depends(get_http_client),
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    把监控用户从过载节点迁移到负载较低的节点（管理员）
+    
+    默认只返回迁移计划，dry_run=false 时实际迁移
+    """
+    return await rebalance(db, http_client, dry_run=dry_run, max_moves=max_moves)
+
+
 @router.get("/system/processes", response_model=List[Dict[str, Any]])
 async def get_server_processes(
     limit: int = 20,
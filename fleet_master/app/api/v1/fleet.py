@@ -1,5 +1,4 @@
-import asyncio
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime, timezone
 from fastapi import APIRouter, Depends, HTTPException, Request, Response
 import orjson
@@ -12,12 +11,17 @@ from shared.models.sign_config import SignConfig
 from shared.models.user import User
 from shared.models.user_activity_detection import UserActivityDetection
 from shared.models.worker import Worker, WorkerStatus
-from shared.schemas.worker import WorkerCreate
+from shared.schemas.worker import WorkerCreate, WorkerLoad
 from shared.schemas.sign_activity import Activity, SignActivityFromWS
 from shared.models.sign_activity import SignActivity
-from app.services.handle_sign_from_ws import check_activity_exist, handle_sign_from_ws
+from app.services.handle_sign_from_ws import SIGN_FROM_WS_JOB, check_activity_exist
+from app.services.job_queue import job_queue
+from app.services.lookup_cache import invalidate_activity, invalidate_worker
+from app.services.heartbeat import heartbeats
+from app.services.ws_connections import handle_ws_report, ws_registry
 from shared.utils.http import AsyncHttpClient, get_http_client
 from shared.utils.logger import DBLogger, get_logger, LogCategory
+from shared.utils.pubsub import NODE_KEY_CHANGED, NodeKeyChanged, pubsub
 from shared.core.config import settings
 from app.utils.load_keys import save_node_public_key, load_private_key
 from pathlib import Path
@@ -64,6 +68,7 @@ async def register_key(
     
     if not save_node_public_key(payload.name, payload.public_key):
         raise HTTPException(status_code=500, detail="Failed to save public key")
+    await pubsub.publish(NODE_KEY_CHANGED, NodeKeyChanged(node_name=payload.name))
     
     return {"status": "ok", "message": f"节点 {payload.name} 的公钥已注册"}
 
@@ -71,15 +76,14 @@ async def register_key(
 @router.post("/ping/{name}")
 async def ping_fleet(
     name: str,
+    load: Optional[WorkerLoad] = None,
     db: AsyncSession = Depends(get_db),
 ):
-    result = await db.execute(select(Worker).where(Worker.name == name))
-    fleet = result.scalars().first()
+    # 心跳只写入内存，由后台任务批量更新 last_heartbeat
+    fleet = await heartbeats.get_worker(db, name=name)
     if not fleet:
         raise HTTPException(status_code=404, detail="Fleet not found")
-    fleet.last_heartbeat = datetime.now(timezone.utc)
-    fleet.status = WorkerStatus.ONLINE
-    await db.commit()
+    heartbeats.record(name, WorkerStatus.ONLINE, load)
     
     # Simulate a ping operation
     return {"fleet_id": fleet.id, "status": "pong"}
@@ -105,6 +109,7 @@ async def register_worker(
     worker.description = worker_in.description
     worker.endpoint = worker_in.endpoint
     await db.commit()
+    invalidate_worker(worker.name)
     return worker
 
 
@@ -117,9 +122,14 @@ async def activity(
     logger: DBLogger = Depends(get_logger),
 ):
     activity, user = await check_activity_exist(sign_activity, db, http_client)
-    asyncio.create_task(handle_sign_from_ws(user, activity))
+    # 只写入签到任务，由任务队列执行，进程重启不会丢失
+    await job_queue.enqueue(
+        db,
+        SIGN_FROM_WS_JOB,
+        {"user_id": user.id, "activity_id": activity.activity_id},
+        worker_name=user.worker_name,
+    )
     
-    # TODO 创建后台任务
     # 同步返回 Pydantic 模型，剔除 None 字段
     return Activity.model_validate(activity, from_attributes=True)
 
@@ -132,6 +142,18 @@ class UpdateDetectionStatus(BaseModel):
     signed_users: Optional[int] = None
     sign_percent: Optional[float] = None
 
+def _apply_detection_status(detection: UserActivityDetection, update_detection_status: UpdateDetectionStatus) -> None:
+    detection.status = update_detection_status.status
+    detection.message = update_detection_status.message
+    if update_detection_status.total_users != None:
+        detection.activity.total_users = update_detection_status.total_users
+    if update_detection_status.signed_users != None:
+        detection.activity.signed_users = update_detection_status.signed_users
+    if update_detection_status.sign_percent != None:
+        detection.activity.sign_percent = update_detection_status.sign_percent
+    invalidate_activity(detection.activity_id)
+
+
 @router.post("/update-detection-status")
 async def update_detection_status(
     update_detection_status: UpdateDetectionStatus,
@@ -145,21 +167,50 @@ async def update_detection_status(
     )  
     detection = result.scalars().first()
     if not detection:
-        logger.error(f"when update detection status, detection not found: {update_detection_status.uuid}")
+        await logger.error(f"when update detection status, detection not found: {update_detection_status.uuid}")
         raise HTTPException(status_code=404, detail="Detection not found")
     
-    detection.status = update_detection_status.status
-    detection.message = update_detection_status.message
-    if update_detection_status.total_users != None:
-        detection.activity.total_users = update_detection_status.total_users
-    if update_detection_status.signed_users != None:
-        detection.activity.signed_users = update_detection_status.signed_users
-    if update_detection_status.sign_percent != None:
-        detection.activity.sign_percent = update_detection_status.sign_percent
+    _apply_detection_status(detection, update_detection_status)
     await db.commit()
     return detection
 
 
+@router.post("/update-detection-status/batch")
+async def update_detection_status_batch(
+    updates: List[UpdateDetectionStatus],
+    db: AsyncSession = Depends(get_db),
+    logger: DBLogger = Depends(get_logger),
+):
+    """
+    批量回写检测状态
+
+    工作节点完成批量签到后一次性回调，所有记录在同一个查询和事务中更新。
+    """
+    uuids = [item.uuid for item in updates]
+    result = await db.execute(
+        select(UserActivityDetection)
+        .where(UserActivityDetection.uuid.in_(uuids))
+        .options(selectinload(UserActivityDetection.activity))
+    )
+    detections = {detection.uuid: detection for detection in result.scalars().all()}
+
+    not_found = []
+    for item in updates:
+        detection = detections.get(item.uuid)
+        if not detection:
+            not_found.append(item.uuid)
+            continue
+        _apply_detection_status(detection, item)
+    await db.commit()
+
+    if not_found:
+        await logger.error(
+            f"when update detection status, {len(not_found)} detections not found",
+            details={"uuids": not_found},
+        )
+    return {"updated": len(updates) - len(not_found), "not_found": not_found}
+
+
 class UpdateAttendInfo(BaseModel):
     activity_id: str
     total_users: Optional[int] = None
@@ -186,6 +237,7 @@ async def update_attend_info(
         activity.sign_percent = update_attend_info.sign_percent
     activity.attend_update_at = datetime.now(timezone.utc)
     await db.commit()
+    invalidate_activity(activity.activity_id)
     return activity
 
 class ReportWsError(BaseModel):
@@ -198,7 +250,7 @@ async def report_ws_error(
     db: AsyncSession = Depends(get_db),
     logger: DBLogger = Depends(get_logger),
 ):
-    logger.error(
+    await logger.error(
         message=report_ws_error.message,
         category=LogCategory.WORKER,
         details={
@@ -207,7 +259,7 @@ async def report_ws_error(
     )
     user = await db.execute(
         select(User)
-        .where(User.im_uname == report_ws_error.im_uname)
+        .where(User.im_username == report_ws_error.im_uname)
     )
     user = user.scalars().first()
     if not user:
@@ -215,3 +267,35 @@ async def report_ws_error(
     user.monitor_status = False
     await db.commit()
     return True
+
+
+class WsConnectionsReport(BaseModel):
+    worker_name: str
+    connected: List[str] = []
+    disconnected: List[str] = []
+
+# 节点推送 WebSocket 连接/断开增量
+@router.post("/ws-connections/report")
+async def report_ws_connections(
+    report: WsConnectionsReport,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
+    issuer = getattr(request.state, "jwt_issuer", None)
+    if issuer and issuer != report.worker_name:
+        raise HTTPException(status_code=403, detail="Worker name does not match token issuer")
+    reconnect_jobs = await handle_ws_report(db, report.worker_name, report.connected, report.disconnected)
+    return {
+        "connected": len(report.connected),
+        "disconnected": len(report.disconnected),
+        "reconnect_jobs": reconnect_jobs,
+    }
+
+# 主节点记录的连接校验和，节点可据此判断是否需要全量上报
+@router.get("/ws-connections/checksum/{name}")
+async def get_ws_connections_checksum(
+    name: str,
+    db: AsyncSession = Depends(get_db),
+):
+    await ws_registry.load(db)
+    return ws_registry.checksum(name)
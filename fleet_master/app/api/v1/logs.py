@@ -1,15 +1,20 @@
+from datetime import datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Query
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.api.deps import get_current_active_admin
+from app.services.job_queue import job_queue
+from app.services.log import (
+    BULK_DELETE_LOGS_JOB, delete_logs, estimate_log_count, fulltext_search_logs, query_logs_page, should_audit_log_query,
+)
 from shared.db.session import get_db
 from shared.models.log import Log, LogLevel, LogCategory
+from shared.models.sign_job import SignJob
 from shared.models.user import User
-from shared.schemas.log import LogResponse, LogFilter
+from shared.schemas.log import LogResponse, LogFilter, LogSearchResult
 from shared.utils.logger import get_logger, DBLogger
 
 router = APIRouter()
@@ -17,74 +22,115 @@ router = APIRouter()
 
 @router.get("", response_model=List[LogResponse])
 async def get_logs(
+    response: Response,
     level: Optional[LogLevel] = None,
     category: Optional[LogCategory] = None,
     user_id: Optional[int] = None,
     task_id: Optional[int] = None,
     worker_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
     search: Optional[str] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="上一页响应头 X-Next-Cursor 中的游标，传入时忽略 skip"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_admin),
     logger: DBLogger = Depends(get_logger)
 ):
     """
     获取日志列表（管理员）
+
+    按时间倒序返回。响应头 X-Next-Cursor 为下一页的游标（没有更多数据时不返回），
+    X-Total-Count 为符合条件的日志数量（数据量大时为估计值，只在第一次查询即不带游标时返回）。
     """
-    # 记录查询日志的操作
-    await logger.info(
-        f"管理员查询日志",
-        category=LogCategory.SYSTEM,
-        user_id=current_user.id,
-        details={
-            "filters": {
-                "level": level,
-                "category": category,
-                "user_id": user_id,
-                "task_id": task_id,
-                "worker_id": worker_id,
-                "search": search,
-                "skip": skip,
-                "limit": limit
-            }
-        }
+    filter = LogFilter(
+        level=level,
+        category=category,
+        user_id=user_id,
+        task_id=task_id,
+        worker_id=worker_id,
+        start_date=start_date,
+        end_date=end_date,
+        search=search,
     )
-    
-    # 构建查询
-    query = select(Log)
-    
-    # 添加筛选条件
-    if level:
-        query = query.where(Log.level == level)
-    if category:
-        query = query.where(Log.category == category)
-    if user_id:
-        query = query.where(Log.user_id == user_id)
-    if task_id:
-        query = query.where(Log.task_id == task_id)
-    if worker_id:
-        query = query.where(Log.worker_id == worker_id)
-    
-    # 搜索
-    if search:
-        query = query.where(
-            or_(
-                Log.message.contains(search),
-                Log.source.contains(search)
-            )
+
+    # 记录查询日志的操作，翻页不重复记录
+    if cursor is None and should_audit_log_query():
+        await logger.info(
+            f"管理员查询日志",
+            category=LogCategory.SYSTEM,
+            user_id=current_user.id,
+            details={"filters": {**filter.model_dump(mode="json"), "skip": skip, "limit": limit}}
         )
-    
-    # 分页和排序
-    query = query.order_by(Log.created_at.desc()).offset(skip).limit(limit)
-    
-    # 执行查询
-    result = await db.execute(query)
-    logs = result.scalars().all()
-    
+
+    try:
+        logs, next_cursor = await query_logs_page(db, filter, limit=limit, skip=skip, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if cursor is None:
+        response.headers["X-Total-Count"] = str(await estimate_log_count(db, filter))
+
     return logs
 
 
+@router.get("/search", response_model=List[LogSearchResult])
+async def search_logs(
+    q: str = Query(..., min_length=1, max_length=200, description="检索词，支持空格、or、\"短语\"、-排除"),
+    level: Optional[LogLevel] = None,
+    category: Optional[LogCategory] = None,
+    user_id: Optional[int] = None,
+    task_id: Optional[int] = None,
+    worker_id: Optional[int] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin),
+    logger: DBLogger = Depends(get_logger)
+):
+    """
+    全文检索日志（管理员）
+
+    按相关度排序，返回相关度和高亮片段。未指定时间范围时检索最近 LOG_SEARCH_DEFAULT_DAYS 天，
+    时间范围不能超过 LOG_SEARCH_MAX_DAYS 天。
+    """
+    filter = LogFilter(
+        level=level,
+        category=category,
+        user_id=user_id,
+        task_id=task_id,
+        worker_id=worker_id,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    try:
+        results = await fulltext_search_logs(db, q, filter, limit=limit, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if skip == 0 and should_audit_log_query():
+        await logger.info(
+            f"管理员检索日志",
+            category=LogCategory.SYSTEM,
+            user_id=current_user.id,
+            details={"q": q, "filters": filter.model_dump(mode="json", exclude_none=True), "results": len(results)}
+        )
+
+    return [
+        LogSearchResult(
+            **LogResponse.model_validate(item["log"]).model_dump(),
+            rank=item["rank"],
+            highlight=item["highlight"],
+        )
+        for item in results
+    ]
+
+
 @router.delete("/{log_id}")
 async def delete_log(
     log_id: int,
@@ -125,56 +171,68 @@ async def delete_log(
 @router.delete("")
 async def clear_logs(
     filter: LogFilter,
+    background: bool = Query(False, description="在后台分批删除，立即返回任务 ID"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_active_admin),
     logger: DBLogger = Depends(get_logger)
 ):
     """
     清空符合条件的日志（管理员）
+
+    分批删除，每批单独提交。数据量较大时可以指定 background=true 在后台执行，
+    通过 GET /logs/delete-jobs/{job_id} 查询进度。
     """
-    # 构建查询
-    query = select(Log)
-    
-    # 添加筛选条件
-    if filter.level:
-        query = query.where(Log.level == filter.level)
-    if filter.category:
-        query = query.where(Log.category == filter.category)
-    if filter.user_id:
-        query = query.where(Log.user_id == filter.user_id)
-    if filter.task_id:
-        query = query.where(Log.task_id == filter.task_id)
-    if filter.worker_id:
-        query = query.where(Log.worker_id == filter.worker_id)
-    if filter.start_date:
-        query = query.where(Log.created_at >= filter.start_date)
-    if filter.end_date:
-        query = query.where(Log.created_at <= filter.end_date)
-    if filter.search:
-        query = query.where(
-            or_(
-                Log.message.contains(filter.search),
-                Log.source.contains(filter.search)
-            )
+    if background:
+        job = await job_queue.enqueue(
+            db,
+            BULK_DELETE_LOGS_JOB,
+            {"filter": filter.model_dump(mode="json"), "user_id": current_user.id},
+            max_attempts=3,
         )
-    
-    # 执行查询以获取要删除的日志数量
-    result = await db.execute(query)
-    logs = result.scalars().all()
-    count = len(logs)
-    
-    # 删除日志
-    if count > 0:
-        for log in logs:
-            await db.delete(log)
-        await db.commit()
-    
+        await logger.warning(
+            f"提交后台清空日志任务 {job.id}",
+            category=LogCategory.SYSTEM,
+            user_id=current_user.id,
+            details={"filter": filter.model_dump(mode="json"), "job_id": job.id}
+        )
+        return {"message": "已提交后台清空任务", "job_id": job.id}
+
+    progress = await delete_logs(filter)
+    count = progress.deleted
+
     # 记录清空操作
     await logger.warning(
         f"清空 {count} 条日志",
         category=LogCategory.SYSTEM,
         user_id=current_user.id,
-        details={"filter": filter.dict(), "deleted_count": count}
+        details={"filter": filter.model_dump(mode="json"), "deleted_count": count, "chunks": progress.chunks}
     )
     
-    return {"message": f"已清空 {count} 条日志"} 
\ No newline at end of file
+    return {"message": f"已清空 {count} 条日志", "deleted_count": count}
+
+
+@router.get("/delete-jobs/{job_id}")
+async def get_delete_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    查询后台清空日志任务的状态和进度（管理员）
+    """
+    job = (await db.execute(
+        select(SignJob).where(SignJob.id == job_id).where(SignJob.kind == BULK_DELETE_LOGS_JOB)
+    )).scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "last_error": job.last_error,
+        "filter": job.payload.get("filter"),
+        "progress": job.payload.get("progress"),
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
@@ -6,6 +6,7 @@ from app.api.deps import get_current_user
 from app.core.security import create_fleet_jwt
 from shared.db.session import get_db
 from shared.models.user import User
+from app.services.lookup_cache import invalidate_user
 from app.services.worker import find_available_worker
 from shared.utils.http import AsyncHttpClient, get_http_client
 from shared.core.config import settings
@@ -39,6 +40,7 @@ async def ws_monitor(
         current_user.worker = worker
     else:
         worker = current_user.worker
+    invalidate_user(current_user.id)
     subdomain = worker.subdomain
 
     if settings.DEBUG:
@@ -5,6 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from shared.schemas.sign_config import SignConfigCreate, SignConfigResponse, SignConfigBase, SignConfigUpdate
 from app.api import deps
 from shared.models.user import User
+from app.services.config_cache import sign_config_cache
 from app.services.sign_config import clear_default_for_user, create_sign_config, get_multi_by_user, get_by_uuid, update_sign_config
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -101,4 +102,5 @@ async def delete_sign_config(
         )
     await db.delete(config)
     await db.commit()
+    sign_config_cache.invalidate(current_user.id)
     return config
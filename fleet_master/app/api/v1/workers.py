@@ -6,10 +6,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.api.deps import get_current_active_admin
 from shared.db.session import get_db
 from shared.models.user import User
+from shared.models.worker_metric import WorkerMetric
 from shared.schemas.worker import WorkerCreate, WorkerUpdate, WorkerResponse, WorkerHeartbeat
 from app.services.worker import (
     create_worker, get_worker, get_workers, update_worker,
-    delete_worker, update_worker_heartbeat
+    delete_worker, update_worker_heartbeat, get_worker_metrics
 )
 
 router = APIRouter()
@@ -58,6 +59,27 @@ async def read_worker(
     return worker
 
 
+@router.get("/{worker_id}/metrics", response_model=List[WorkerMetric])
+async def read_worker_metrics(
+    worker_id: int,
+    hours: int = 24,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_active_admin)
+):
+    """
+    获取工作节点最近的负载指标（管理员）
+    
+    指标来自节点心跳，每个采样周期一条
+    """
+    worker = await get_worker(db, worker_id)
+    if not worker:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="工作节点不存在"
+        )
+    return await get_worker_metrics(db, worker, hours)
+
+
 @router.put("/{worker_id}", response_model=WorkerResponse)
 async def update_worker_info(
     worker_id: int,
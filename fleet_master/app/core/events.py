@@ -11,6 +11,14 @@ from sqlalchemy.ext.asyncio import AsyncEngine
 
 from shared.core.config import settings
 from shared.db.session import engine
+from shared.utils.log_sink import log_sink
+from shared.utils.http_pool import http_pool
+from shared.utils.http_metrics import http_metrics
+from app.services.job_queue import job_queue
+from app.services.heartbeat import heartbeats
+from app.services.notifier import notifier
+from app.services.sign_coalescer import sign_coalescer
+from shared.utils.pubsub import pubsub
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +26,9 @@ logger = logging.getLogger(__name__)
 async def create_database_tables():
     """
     创建所有数据库表
+
+    只用于本地开发的空数据库，生产环境的表结构由 Alembic 迁移（alembic upgrade head）创建，
+    启动时不再调用：多个 gunicorn 进程同时 create_all 会竞争失败，且会抢先建出迁移要创建的表。
     """
     try:
         from sqlalchemy.schema import CreateSchema
@@ -32,7 +43,10 @@ async def create_database_tables():
             SignActivity,
             SignConfig,
             UserActivityDetection,
-            Announcement, AnnouncementStatus
+            Announcement, AnnouncementStatus,
+            SignJob, JobStatus,
+            WsConnection,
+            WorkerMetric
         )
         
         # 创建表
@@ -53,6 +67,8 @@ async def create_database_tables():
 async def create_initial_data():
     """
     创建初始数据
+
+    启动时不再调用，需要时手动执行一次: python -m app.core.events
     """
     try:
         from app.services.auth import create_user
@@ -64,17 +80,17 @@ async def create_initial_data():
         # 在生产环境中可以通过配置控制是否创建初始数据
         if settings.ALLOW_REGISTER or settings.DEBUG:
             async with async_session() as db:
-                result = await db.execute(select(User).where(User.username == "admin"))
+                admin_user = UserCreate(
+                    username="***REMOVED***",
+                    tel="***REMOVED***",
+                    password="***REMOVED***",
+                    is_active=True,
+                    is_admin=True,
+                )
+                result = await db.execute(select(User).where(User.username == admin_user.username))
                 admin = result.scalars().first()
                 
                 if not admin:
-                    admin_user = UserCreate(
-                        username="***REMOVED***",
-                        tel="***REMOVED***",
-                        password="***REMOVED***",
-                        is_active=True,
-                        is_admin=True,
-                    )
                     await create_user(db, admin_user)
                     logger.info("管理员用户创建完成")
     except Exception as e:
@@ -92,13 +108,28 @@ async def startup_event():
     logger.info(f"开始启动应用，环境: {'开发' if settings.DEBUG else '生产'}")
     
     try:
-        # 创建数据库表
-        await create_database_tables()
+        # 表结构由 Alembic 迁移创建，初始数据手动创建，启动时只启动后台服务
+        # 监听其他进程的缓存失效通知
+        pubsub.start()
+        
+        # 启动日志批量写入
+        log_sink.start()
+        
+        # 启动HTTP连接池
+        http_pool.start()
         
-        # 创建初始数据
-        await create_initial_data()
+        # 定期写入HTTP客户端指标快照，供 /metrics 汇总
+        http_metrics.start()
         
+        # 启动心跳批量写入
+        heartbeats.start()
         
+        # 启动推送通知调度
+        notifier.start()
+        
+        # 启动签到任务队列
+        if settings.JOB_QUEUE_ENABLED:
+            job_queue.start()
         
         elapsed = time.time() - start_time
         logger.info(f"应用启动完成，耗时 {elapsed:.2f} 秒")
@@ -112,5 +143,23 @@ async def shutdown_event():
     应用关闭时的事件处理
     """
     logger.info("应用关闭中...")
+    # 停止领取任务，未完成的任务放回队列
+    await job_queue.stop()
+    # 发送等待合并的签到批次
+    await sign_coalescer.close()
+    # 发送等待合并和限速的推送通知
+    await notifier.stop()
+    # 写入缓冲中的心跳
+    await heartbeats.stop()
+    await pubsub.stop()
+    # 关闭HTTP连接池
+    await http_pool.close()
+    await http_metrics.stop()
+    # 写入缓冲区中剩余的日志
+    await log_sink.stop()
     await asyncio.sleep(1)
-    logger.info("应用已关闭")
\ No newline at end of file
+    logger.info("应用已关闭")
+
+
+if __name__ == "__main__":
+    asyncio.run(create_initial_data())
@@ -1,15 +1,23 @@
 from datetime import datetime, timedelta, timezone
-from typing import Any, Optional, Union
+from typing import Any, Dict, Optional, Tuple, Union
+import time
 import uuid
 
 from jose import JWTError, jwt
 import bcrypt
 
-from app.utils.load_keys import load_private_key, load_public_key
+from app.utils.load_keys import key_manager
 from shared.core.config import settings
 
 ALGORITHM = "RS256"
 
+# fleet JWT 有效期，以及距离过期多久时重新签发
+FLEET_JWT_EXPIRE = timedelta(minutes=5)
+FLEET_JWT_REFRESH_MARGIN = 60
+
+# 已签发的 fleet JWT 缓存: (audience, issuer) -> (token, 过期时间戳)
+_fleet_token_cache: Dict[Tuple[str, str], Tuple[str, float]] = {}
+
 def create_access_token(
     subject: Union[str, Any], expires_delta: Optional[timedelta] = None
 ) -> str:
@@ -49,20 +57,32 @@ def get_password_hash(password: str) -> str:
 
 
 def create_fleet_jwt(audience: str, issuer: str = "fleet") -> str:
-    # 动态加载私钥，确保 setup_node_keys 执行后可以读取
+    """
+    签发 fleet JWT
+    
+    同一 audience 的令牌在过期前复用，距离过期不足 FLEET_JWT_REFRESH_MARGIN 秒时重新签发。
+    """
+    cached = _fleet_token_cache.get((audience, issuer))
+    if cached and cached[1] - time.time() > FLEET_JWT_REFRESH_MARGIN:
+        return cached[0]
+    
+    # 私钥对象常驻内存，setup_node_keys 执行后或文件变更时自动重新加载
     try:
-        private_key = load_private_key(f"config/{settings.CURRENT_NODE}/private.pem")
+        private_key = key_manager.get_private_key(f"config/{settings.CURRENT_NODE}/private.pem")
     except FileNotFoundError:
         raise RuntimeError("Private key not configured on this node")
-    now = datetime.utcnow()
+    now = datetime.now(timezone.utc)
+    expire = now + FLEET_JWT_EXPIRE
     payload = {
         "iss": issuer,
         "aud": audience,
         "iat": now,
-        "exp": now + timedelta(minutes=5),
+        "exp": expire,
         "jti": str(uuid.uuid4())
     }
-    return jwt.encode(payload, private_key, algorithm=ALGORITHM)
+    token = jwt.encode(payload, private_key, algorithm=ALGORITHM)
+    _fleet_token_cache[(audience, issuer)] = (token, expire.timestamp())
+    return token
 
 
 def verify_fleet_jwt(token: str, expected_audience: str) -> dict:
@@ -72,11 +92,11 @@ def verify_fleet_jwt(token: str, expected_audience: str) -> dict:
         if not issuer:
             raise ValueError("Token missing issuer claim")
         
-        # 动态加载公钥，不使用缓存的TRUSTED_KEYS
+        # 公钥对象常驻内存，注册新公钥或文件变更时自动重新加载
         try:
-            public_key = load_public_key(issuer)
+            public_key = key_manager.get_public_key(issuer)
             return jwt.decode(token, public_key, algorithms=[ALGORITHM], audience=expected_audience)
         except FileNotFoundError:
             raise ValueError(f"Issuer {issuer} not in trusted list")
     except JWTError as e:
-        raise ValueError(f"Token validation failed: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Token validation failed: {str(e)}")
@@ -6,6 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app.core.security import verify_password, get_password_hash, create_access_token
+from app.services.lookup_cache import invalidate_user
 from shared.models.user import User
 from shared.schemas.user import UserCreate, UserUpdate
 from shared.core.config import settings
@@ -47,6 +48,7 @@ async def update_cookies_by_uid(db: AsyncSession, uid: str, cookies: dict):
     user.updated_at = datetime.now(timezone.utc)
     await db.commit()
     await db.refresh(user)
+    invalidate_user(user.id)
     return user
 
 async def update_im_cookies_by_uid(db: AsyncSession, uid: str, user_update: UserUpdate):
@@ -60,6 +62,7 @@ async def update_im_cookies_by_uid(db: AsyncSession, uid: str, user_update: User
     user.updated_at = datetime.now(timezone.utc)
     await db.commit()
     await db.refresh(user)
+    invalidate_user(user.id)
     return user
 
 async def update_person_info_by_uid(db: AsyncSession, uid: str, user_update: UserUpdate):
@@ -74,6 +77,7 @@ async def update_person_info_by_uid(db: AsyncSession, uid: str, user_update: Use
     user.updated_at = datetime.now(timezone.utc)
     await db.commit()
     await db.refresh(user)
+    invalidate_user(user.id)
     return user
 
 async def create_user(db: AsyncSession, user_in: UserCreate) -> User:
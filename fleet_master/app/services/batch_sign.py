@@ -0,0 +1,167 @@
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
+
+from app.services.handle_sign_from_ws import _push_notice_when_sign, parse_sign_response
+from app.services.sign_coalescer import sign_coalescer
+from app.services.sign_config import pick_config_for_sign
+from shared.models.log import LogCategory, LogLevel
+from shared.models.sign_config import SignConfig
+from shared.models.user import User
+from shared.models.user_activity_detection import UserActivityDetection
+from shared.utils.logger import DBLogger
+
+
+class BatchSignResult:
+    """批量签到结果"""
+
+    def __init__(self):
+        # 与原 /activity/qr-code 接口一致：每个元素以用户姓名为键
+        self.results: List[Dict[str, Dict[str, Any]]] = []
+        self.elapsed: float = 0.0
+        self.signed: int = 0
+        self.failed: int = 0
+        self.skipped: int = 0
+
+    def add(self, name: str, status: str, message: str, elapsed: Optional[float] = None) -> None:
+        item: Dict[str, Any] = {"status": status, "message": message}
+        if elapsed is not None:
+            item["elapsed_ms"] = round(elapsed * 1000, 1)
+        self.results.append({name: item})
+
+
+async def batch_sign_for_activity(
+    *,
+    db: AsyncSession,
+    activity_id: str,
+    enc: Optional[str],
+    logger: DBLogger,
+) -> BatchSignResult:
+    """
+    为检测到同一活动的所有用户批量签到
+
+    一次查询加载检测记录、用户、工作节点和签到配置，按工作节点分组后由签到合并器
+    为每个节点发送批量签到请求，全部完成后用一条批量 UPDATE 写回所有检测记录的状态。
+    """
+    start_time = time.monotonic()
+    batch = BatchSignResult()
+
+    # 步骤1: 一次性加载检测记录、活动、用户及其工作节点
+    result = await db.execute(
+        select(UserActivityDetection)
+        .where(UserActivityDetection.activity_id == activity_id)
+        .options(selectinload(UserActivityDetection.activity))
+        .options(selectinload(UserActivityDetection.user).selectinload(User.worker))
+    )
+    detections = result.scalars().all()
+    if not detections:
+        return batch
+
+    # 步骤2: 一次性加载所有用户的签到配置
+    user_ids = {detection.user_id for detection in detections}
+    result = await db.execute(select(SignConfig).where(SignConfig.user_id.in_(user_ids)))
+    configs_by_user: Dict[int, List[SignConfig]] = defaultdict(list)
+    for config in result.scalars().all():
+        configs_by_user[config.user_id].append(config)
+
+    # 步骤3: 按工作节点分组，已签到或无节点的用户直接返回
+    groups: Dict[str, List[UserActivityDetection]] = defaultdict(list)
+    for detection in detections:
+        user = detection.user
+        if detection.status == "success":
+            batch.skipped += 1
+            batch.add(user.person_name, "success", "签到成功")
+        elif not user.worker:
+            batch.failed += 1
+            batch.add(user.person_name, "failed", "未开启监控")
+        else:
+            groups[user.worker.name].append(detection)
+
+    updates: List[Dict[str, Any]] = []
+    # 并发的签到协程不使用 db 和 logger：签到日志和推送通知在并发结束后统一处理，
+    # 避免多个协程同时使用请求的会话（log_sink 未启动时 logger 直接写入该会话）
+    sign_logs: List[Dict[str, Any]] = []
+    notices: List[Dict[str, Any]] = []
+
+    async def sign_one(detection: UserActivityDetection) -> None:
+        user = detection.user
+        activity = detection.activity
+        config = pick_config_for_sign(configs_by_user[user.id], activity.class_id)
+        sign_start = time.monotonic()
+        try:
+            # 同一节点的请求由合并器打包为一次批量请求，并限制每个节点的并发
+            response_data = await sign_coalescer.signin(user=user, activity=activity, config=config, key=detection.uuid, enc=enc)
+            status, message, error = parse_sign_response(response_data)
+            updates.append({
+                "id": detection.id,
+                "status": status,
+                "message": message,
+                "updated_at": datetime.now(timezone.utc),
+            })
+            if error:
+                message = error["message"]
+            notices.append(dict(user=user, activity=activity, config=config, response_data=response_data))
+        except Exception as e:
+            # 单个用户失败不影响其他用户
+            status, message = "failed", str(e)
+        elapsed = time.monotonic() - sign_start
+
+        if status == "success":
+            batch.signed += 1
+            batch.add(user.person_name, "success", "签到成功", elapsed)
+        else:
+            batch.failed += 1
+            batch.add(user.person_name, "failed", message or "未知错误", elapsed)
+        sign_logs.append(dict(
+            message="Batch sign activity succeeded" if status == "success" else "Batch sign activity failed",
+            level=LogLevel.INFO if status == "success" else LogLevel.ERROR,
+            category=LogCategory.TASK,
+            user_id=user.id,
+            details={
+                "user_name": user.person_name or user.username,
+                "activity_type": activity.other_id,
+                "worker": user.worker.name,
+                "message": message,
+                "elapsed_seconds": elapsed,
+            },
+            source="app.services.batch_sign.batch_sign_for_activity"
+        ))
+
+    # 步骤4: 按节点并发提交，合并器为每个节点发送批量请求
+    await asyncio.gather(*(
+        sign_one(detection)
+        for worker_detections in groups.values()
+        for detection in worker_detections
+    ))
+
+    # 步骤5: 一条批量 UPDATE 写回所有检测记录状态
+    if updates:
+        await db.execute(update(UserActivityDetection), updates)
+        await db.commit()
+
+    batch.elapsed = time.monotonic() - start_time
+    for notice in notices:
+        _push_notice_when_sign(**notice)
+    for entry in sign_logs:
+        await logger.log(**entry)
+    await logger.info(
+        f"批量签到完成: 活动 {activity_id}，成功 {batch.signed}，失败 {batch.failed}，跳过 {batch.skipped}，耗时 {batch.elapsed:.3f}s",
+        category=LogCategory.TASK,
+        details={
+            "activity_id": activity_id,
+            "workers": len(groups),
+            "signed": batch.signed,
+            "failed": batch.failed,
+            "skipped": batch.skipped,
+            "elapsed_seconds": batch.elapsed,
+        },
+        source="app.services.batch_sign.batch_sign_for_activity"
+    )
+    return batch
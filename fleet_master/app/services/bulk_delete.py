@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import delete, text, tuple_
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import Select
+
+from shared.core.config import settings
+from shared.db.session import async_session
+
+logger = logging.getLogger(__name__)
+
+# Postgres 等待锁超过 lock_timeout 时的错误码
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+class DeleteProgress:
+    """一次分批删除的进度"""
+
+    def __init__(self, table: str, chunk_size: int):
+        self.table = table
+        self.chunk_size = chunk_size
+        self.deleted = 0
+        self.chunks = 0
+        self.lock_timeouts = 0
+        self.started_at = time.time()
+        self.elapsed = 0.0
+        self.finished = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "table": self.table,
+            "deleted": self.deleted,
+            "chunks": self.chunks,
+            "chunk_size": self.chunk_size,
+            "lock_timeouts": self.lock_timeouts,
+            "started_at": self.started_at,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "finished": self.finished,
+        }
+
+
+ProgressCallback = Callable[[DeleteProgress], Awaitable[None]]
+
+
+async def bulk_delete(
+    model,
+    id_query: Select,
+    *,
+    chunk_size: Optional[int] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    progress_interval: float = 5.0,
+) -> DeleteProgress:
+    """
+    分批删除 id_query 选出的行，返回删除进度（包含删除总数）
+
+    每批执行一条 DELETE ... WHERE id IN (SELECT id ... LIMIT n) 并单独提交，不把行加载到内存，
+    id_query 选出多列时按多列匹配（分区表需要带上分区键才能在删除时裁剪分区）。
+    每个事务持有行锁的时间很短，删除期间日志写入不受影响。批大小按耗时自适应：
+    单批超过 BULK_DELETE_MAX_CHUNK_SECONDS 时减半，远低于时加倍（不超过初始值的 4 倍）。
+    Postgres 上每批设置 lock_timeout，等锁超时的批次缩小后重试，连续多次超时则放弃。
+
+    Args:
+        model: 要删除的表对应的模型
+        id_query: 选出待删除行主键的查询，如 select(Log.id, Log.created_at).where(...)
+        chunk_size: 初始批大小，默认 BULK_DELETE_CHUNK_SIZE
+        on_progress: 进度回调，至少间隔 progress_interval 秒调用一次，删除结束后再调用一次
+    """
+    chunk_size = chunk_size or settings.BULK_DELETE_CHUNK_SIZE
+    max_chunk_size = chunk_size * 4
+    target = settings.BULK_DELETE_MAX_CHUNK_SECONDS
+    progress = DeleteProgress(model.__tablename__, chunk_size)
+    start = time.monotonic()
+    last_report = start
+    failures = 0
+    columns = [model.__table__.c[column.name] for column in id_query.selected_columns]
+    key = columns[0] if len(columns) == 1 else tuple_(*columns)
+
+    while True:
+        ids = id_query.limit(progress.chunk_size)
+        if len(columns) == 1:
+            ids = ids.scalar_subquery()
+        chunk_start = time.monotonic()
+        try:
+            async with async_session() as db:
+                if db.get_bind().dialect.name == "postgresql":
+                    await db.execute(text(f"SET LOCAL lock_timeout = '{int(settings.BULK_DELETE_LOCK_TIMEOUT * 1000)}ms'"))
+                result = await db.execute(
+                    delete(model).where(key.in_(ids)).execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except DBAPIError as e:
+            if getattr(e.orig, "sqlstate", None) != LOCK_NOT_AVAILABLE:
+                raise
+            progress.lock_timeouts += 1
+            failures += 1
+            if failures >= 5:
+                raise
+            progress.chunk_size = max(progress.chunk_size // 2, 1)
+            logger.warning(f"分批删除 {progress.table} 等锁超时，批大小降为 {progress.chunk_size} 后重试")
+            await asyncio.sleep(settings.BULK_DELETE_PAUSE * 10)
+            continue
+
+        failures = 0
+        duration = time.monotonic() - chunk_start
+        progress.chunks += 1
+        progress.deleted += result.rowcount
+        progress.elapsed = time.monotonic() - start
+        if result.rowcount < progress.chunk_size:
+            break
+
+        if duration > target:
+            progress.chunk_size = max(progress.chunk_size // 2, 100)
+        elif duration < target / 4:
+            progress.chunk_size = min(progress.chunk_size * 2, max_chunk_size)
+        if on_progress and time.monotonic() - last_report >= progress_interval:
+            last_report = time.monotonic()
+            await on_progress(progress)
+        # 让出时间给其他写入
+        await asyncio.sleep(settings.BULK_DELETE_PAUSE)
+
+    progress.elapsed = time.monotonic() - start
+    progress.finished = True
+    if on_progress:
+        await on_progress(progress)
+    logger.info(f"分批删除 {progress.table} 完成: {progress.deleted} 行，{progress.chunks} 批，耗时 {progress.elapsed:.2f}s")
+    return progress
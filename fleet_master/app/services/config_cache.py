@@ -0,0 +1,86 @@
+from collections import defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from shared.core.config import settings
+from shared.models.sign_config import SignConfig
+from shared.schemas.sign_config import SignConfigSnapshot
+from shared.utils.cache import TTLCache
+from shared.utils.pubsub import SIGN_CONFIG_CHANGED, SignConfigChanged, pubsub
+
+# 没有班级配置和默认配置时使用手动签到
+MANUAL_CONFIG = SignConfigSnapshot(trigger_type="manual", use_random_photo=True)
+
+
+def pick_snapshot(configs, class_id: Optional[str] = None) -> SignConfigSnapshot:
+    """优先班级配置，其次默认配置，最后使用手动签到配置"""
+    if class_id:
+        for config in configs:
+            if config.class_id == class_id:
+                return SignConfigSnapshot.model_validate(config)
+    for config in configs:
+        if config.is_default:
+            return SignConfigSnapshot.model_validate(config)
+    return MANUAL_CONFIG
+
+
+class SignConfigCache:
+    """
+    签到配置解析缓存，按 (user_id, class_id) 缓存最终使用的配置快照
+
+    每个用户有一个版本号，缓存条目记录写入时的版本；用户的配置变更时只需把版本号加一，
+    该用户所有班级的条目立即失效。变更通过 pubsub 广播，其他进程收到后同样增加版本号。
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0):
+        self._entries: TTLCache[Tuple[int, SignConfigSnapshot]] = TTLCache(max_size=max_size, ttl=ttl)
+        self._versions: Dict[int, int] = defaultdict(int)
+        self.stale = 0  # 命中但版本已过期的条目数
+
+    async def resolve(self, db: AsyncSession, user_id: int, class_id: Optional[str] = None) -> SignConfigSnapshot:
+        """获取用户在该班级签到时使用的配置，未命中时一次查询同时取班级配置和默认配置"""
+        key = (user_id, class_id)
+        version = self._versions[user_id]
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == version:
+                return entry[1]
+            self.stale += 1
+
+        condition = SignConfig.is_default == True
+        if class_id:
+            condition = or_(SignConfig.class_id == class_id, condition)
+        result = await db.execute(select(SignConfig).where(SignConfig.user_id == user_id).where(condition))
+        snapshot = pick_snapshot(result.scalars().all(), class_id)
+        # 查询期间配置已变更时不写入，避免缓存旧配置
+        if self._versions[user_id] == version:
+            self._entries.set(key, (version, snapshot))
+        return snapshot
+
+    def bump(self, user_id: int) -> None:
+        """使该用户的所有缓存条目失效（仅当前进程）"""
+        self._versions[user_id] += 1
+
+    def invalidate(self, user_id: int) -> None:
+        """用户的签到配置已变更：本进程立即失效，并通知其他进程"""
+        pubsub.publish_nowait(SIGN_CONFIG_CHANGED, SignConfigChanged(user_id=user_id))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._entries.stats(), "stale": self.stale}
+
+
+sign_config_cache = SignConfigCache(max_size=settings.LOOKUP_CACHE_MAX_SIZE, ttl=settings.LOOKUP_CACHE_TTL)
+
+
+@pubsub.subscribe(SIGN_CONFIG_CHANGED)
+def _on_sign_config_changed(payload: SignConfigChanged) -> None:
+    sign_config_cache.bump(payload.user_id)
+
+
+pubsub.on_reconnect(sign_config_cache.clear)
@@ -1,6 +1,7 @@
 from fastapi import HTTPException
-from typing import Optional
-from sqlalchemy import select
+from typing import Optional, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 import json
@@ -8,86 +9,138 @@ import json
 from app.core.security import create_fleet_jwt
 from shared.models.user import User
 from shared.models.sign_activity import SignActivity
-from shared.models.sign_config import SignConfig
+from shared.schemas.sign_config import SignConfigSnapshot
 from shared.db.session import async_session
 
 from shared.core.config import settings
 from shared.models.user_activity_detection import UserActivityDetection
 from shared.schemas.sign_activity import SignActivityFromWS
 from app.services.sign_config import get_config_for_sign
+from app.services.job_queue import job_handler
+from app.services.lookup_cache import activity_cache, activity_flight, detach, get_activity, get_user_by_im_username
+from app.services.sign_coalescer import sign_coalescer
 from shared.utils.http import AsyncHttpClient
+from shared.utils.http_body import parse_json
 
 from shared.models.log import LogCategory, LogLevel
 from shared.utils.logger import DBLogger, get_logger
-from app.utils.push_notice import push_to_bark, push_to_ntfy
+from app.services.notifier import BARK, NTFY, notifier
 from shared.schemas.sign_activity import APIActivityResponse
 
 
 
 async def check_activity_exist(sign_activity: SignActivityFromWS, db: AsyncSession, http_client: AsyncHttpClient):
-    user = await db.execute(
-        select(User)
-        .where(User.im_username == sign_activity.detected_by)
-        .options(selectinload(User.worker))
-        .limit(1)
-    )
-    user = user.scalars().first()
+    # 同一班级的学生会在几秒内上报同一活动，用户和活动查询优先走缓存
+    user = await get_user_by_im_username(db, sign_activity.detected_by)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     worker = user.worker
     if not worker:
         raise HTTPException(status_code=404, detail="Worker not found")
-    result = await db.execute(
-        select(SignActivity)
-        .where(SignActivity.activity_id == sign_activity.activity_id)
-        .limit(1)
-    )
-    activity = result.scalars().first()
+    activity = await get_activity(db, sign_activity.activity_id)
     if not activity:
-        sign_activity.cookies = user.cookies
-        if settings.DEBUG:
-            result = await http_client.post(
-                "http://localhost:8001/api/v1/fleet/activity",
-                json=sign_activity.model_dump(by_alias=False),
-                headers={"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"}
-            )
-        else:
-            result = await http_client.post(
-                f"https://{worker.subdomain}.xiusmo.com/api/v1/fleet/activity",
-                json=sign_activity.model_dump(by_alias=False),
-                headers={"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"}
-            )
-        if result.status_code != 200:
-            raise HTTPException(status_code=400, detail="Failed to create activity")
-        response_data = result.json()
-        # 使用专门的 Pydantic 模型解析 API 返回值
-        api_response = APIActivityResponse.model_validate(response_data)
-        
-        # 将 API 响应转换为 SignActivity 模型需要的字典
-        activity_dict = api_response.to_sign_activity(
-            course_id=sign_activity.course_id,
-            class_id=sign_activity.class_id,
-            course_name=sign_activity.course_name,
-            teacher_name=sign_activity.teacher_name
+        # 并发的重复上报只由第一个请求创建活动，其余请求共享结果
+        activity = await activity_flight.do(
+            sign_activity.activity_id,
+            lambda: _create_activity(sign_activity, user, db, http_client),
         )
-        
-        # 创建 SignActivity 并存入数据库
-        activity = SignActivity(**activity_dict)
-        db.add(activity)
-        await db.commit()
     
     return activity, user
+
+
+async def _create_activity(sign_activity: SignActivityFromWS, user: User, db: AsyncSession, http_client: AsyncHttpClient) -> SignActivity:
+    # 等待期间可能已被其他请求创建
+    activity = await get_activity(db, sign_activity.activity_id)
+    if activity:
+        return activity
+    worker = user.worker
+    sign_activity.cookies = user.cookies
+    if settings.DEBUG:
+        result = await http_client.post(
+            "http://localhost:8001/api/v1/fleet/activity",
+            json=sign_activity.model_dump(by_alias=False),
+            headers={"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"}
+        )
+    else:
+        result = await http_client.post(
+            f"https://{worker.subdomain}.xiusmo.com/api/v1/fleet/activity",
+            json=sign_activity.model_dump(by_alias=False),
+            headers={"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"}
+        )
+    if result.status_code != 200:
+        raise HTTPException(status_code=400, detail="Failed to create activity")
+    response_data = parse_json(result)
+    # 使用专门的 Pydantic 模型解析 API 返回值
+    api_response = APIActivityResponse.model_validate(response_data)
+    
+    # 将 API 响应转换为 SignActivity 模型需要的字典
+    activity_dict = api_response.to_sign_activity(
+        course_id=sign_activity.course_id,
+        class_id=sign_activity.class_id,
+        course_name=sign_activity.course_name,
+        teacher_name=sign_activity.teacher_name
+    )
+    
+    # 创建 SignActivity 并存入数据库
+    activity = SignActivity(**activity_dict)
+    db.add(activity)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # 其他进程已创建同一活动，使用已存在的记录
+        await db.rollback()
+        activity = await get_activity(db, sign_activity.activity_id)
+        if not activity:
+            raise
+        return activity
+    detach(db, activity)
+    activity_cache.set(activity.activity_id, activity)
+    return activity
     
         
         
         
+SIGN_FROM_WS_JOB = "sign_from_ws"
+
+
+@job_handler(SIGN_FROM_WS_JOB)
+async def run_sign_from_ws_job(payload: dict):
+    """签到任务队列的处理函数，payload: {"user_id": ..., "activity_id": ...}"""
+    async with async_session() as db:
+        result = await db.execute(
+            select(User)
+            .where(User.id == payload["user_id"])
+            .options(selectinload(User.worker))
+        )
+        user = result.scalars().first()
+        result = await db.execute(
+            select(SignActivity).where(SignActivity.activity_id == payload["activity_id"])
+        )
+        activity = result.scalars().first()
+    if not user or not activity:
+        # 用户或活动已被删除，无需重试
+        return
+    await handle_sign_from_ws(user, activity)
+
+
 async def handle_sign_from_ws(user: User, activity: SignActivity):
     async with async_session() as db:
-        logger = DBLogger(db)
+        logger = DBLogger(db).bind(user_id=user.id)
         http_client = AsyncHttpClient(logger=logger)
         config = await get_config_for_sign(db, user, activity.class_id)
-        await _push_notice_when_detect(user=user, activity=activity, config=config, logger=logger, http_client=http_client)
-        user_activity_detection = UserActivityDetection.from_activity(activity, user)
+        # 任务重试时复用已创建的检测记录，已处理过的记录不再重复签到
+        result = await db.execute(
+            select(UserActivityDetection)
+            .where(UserActivityDetection.user_id == user.id)
+            .where(UserActivityDetection.activity_id == activity.activity_id)
+            .limit(1)
+        )
+        user_activity_detection = result.scalars().first()
+        if user_activity_detection and user_activity_detection.status != "pending":
+            return
+        if not user_activity_detection:
+            _push_notice_when_detect(user=user, activity=activity, config=config)
+            user_activity_detection = UserActivityDetection.from_activity(activity, user)
         if activity.other_id == 2:
             user_activity_detection.status = "enc"
             db.add(user_activity_detection)
@@ -98,25 +151,49 @@ async def handle_sign_from_ws(user: User, activity: SignActivity):
         if config.trigger_type == "immediate":
             await handle_immediate_sign(user=user, activity=activity, detection=user_activity_detection, db=db, http_client=http_client, logger=logger)
         elif config.trigger_type == "threshold":
-            user_activity_detection.status = "polling"
-            await db.commit()
+            # 节点接受轮询请求后才标记为 polling；请求失败时记录保持 pending，任务重试时会重新发送。
+            # 只更新仍为 pending 的记录，节点已经回报的结果不会被覆盖
             await handle_threshold_sign(user=user, activity=activity, config=config, detection=user_activity_detection, db=db, http_client=http_client, logger=logger)
+            await db.execute(
+                update(UserActivityDetection)
+                .where(UserActivityDetection.id == user_activity_detection.id)
+                .where(UserActivityDetection.status == "pending")
+                .values(status="polling")
+            )
+            await db.commit()
             # await handle_manual_sign(detection=user_activity_detection, db=db)
         elif config.trigger_type == "manual":
             await handle_manual_sign(detection=user_activity_detection, db=db)
     
 
 
+def parse_sign_response(response_data: dict) -> Tuple[str, str, Optional[dict]]:
+    """
+    解析工作节点返回的签到结果
+    
+    Returns:
+        Tuple[str, str, Optional[dict]]: (检测记录状态, 检测记录消息, 失败时的错误信息)
+    """
+    if response_data.get("result") == True:
+        return "success", f"签到成功: {response_data.get('message')}", None
+    if response_data.get("result") == False:
+        message = {
+            "result": False,
+            "message": f"{response_data.get('message')} {response_data.get('response_data')}",
+        }
+        return "failed", json.dumps(message, ensure_ascii=False), message
+    return "failed", "未知错误, 日志已记录", None
+
+
 async def handle_immediate_sign(*, user: User, activity: SignActivity, enc: Optional[str] = None, detection: UserActivityDetection, db: AsyncSession, http_client: AsyncHttpClient, logger: DBLogger):
     config = await get_config_for_sign(db, user, activity.class_id)
     if activity.other_id == 2:
         if not enc:
             return
-    if settings.DEBUG:
-        result = await http_client.post(f"http://localhost:8001/api/v1/fleet/signin", json={**activity.model_dump(by_alias=False), "cookies": user.cookies, "enc": enc, "random_photo": config.use_random_photo}, headers={"Authorization": f"Bearer {create_fleet_jwt(user.worker.name)}"})
-    else:
-        result = await http_client.post(f"https://{user.worker.subdomain}.xiusmo.com/api/v1/fleet/signin", json={**activity.model_dump(by_alias=False), "cookies": user.cookies, "enc": enc, "random_photo": config.use_random_photo}, headers={"Authorization": f"Bearer {create_fleet_jwt(user.worker.name)}"})
-    if result.status_code != 200:
+    try:
+        # 同一节点同一活动的签到请求会在短时间窗口内合并为一次批量请求
+        response_data = await sign_coalescer.signin(user=user, activity=activity, config=config, key=detection.uuid, enc=enc)
+    except Exception:
         await logger.error(
             message="Failed to sign activity",
             category=LogCategory.TASK,
@@ -133,20 +210,12 @@ async def handle_immediate_sign(*, user: User, activity: SignActivity, enc: Opti
         source="app.services.handle_sign_from_ws.handle_immediate_sign"
     )
     
-    response_data = result.json()
-    await _push_notice_when_sign(user=user, activity=activity, config=config, response_data=response_data, logger=logger, http_client=http_client)
+    _push_notice_when_sign(user=user, activity=activity, config=config, response_data=response_data)
+    detection.status, detection.message, error = parse_sign_response(response_data)
     if response_data.get("result") == True:
-        detection.status = "success"
-        detection.message = f"签到成功: {response_data.get('message')}"
         await db.commit()
         return response_data
     elif response_data.get("result") == False:
-        message = {
-            "result": False,
-            "message": f"{response_data.get('message')} {response_data.get('response_data')}",
-        }
-        detection.status = "failed"
-        detection.message = json.dumps(message, ensure_ascii=False)
         await logger.error(
             message="Failed to sign activity with response",
             category=LogCategory.TASK,
@@ -154,15 +223,13 @@ async def handle_immediate_sign(*, user: User, activity: SignActivity, enc: Opti
             details={
                 "user_name": user.person_name or user.username,
                 "activity_type": activity.other_id,
-                "error": message
+                "error": error
             },
             source="app.services.handle_sign_from_ws.handle_immediate_sign"
         )
         await db.commit()
-        return message
+        return error
     else:
-        detection.status = "failed"
-        detection.message = "未知错误, 日志已记录"
         await logger.error(
             message="Failed to sign activity with unexpected response",
             category=LogCategory.TASK,
@@ -177,7 +244,7 @@ async def handle_immediate_sign(*, user: User, activity: SignActivity, enc: Opti
         await db.commit()
         raise HTTPException(status_code=400, detail="Failed to sign, unknown error")
 
-async def handle_threshold_sign(*, user: User, activity: SignActivity, config: SignConfig, detection: UserActivityDetection, db: AsyncSession, http_client: AsyncHttpClient, logger: DBLogger):
+async def handle_threshold_sign(*, user: User, activity: SignActivity, config: SignConfigSnapshot, detection: UserActivityDetection, db: AsyncSession, http_client: AsyncHttpClient, logger: DBLogger):
     worker = user.worker
     if settings.DEBUG:
         result = await http_client.post(f"http://localhost:8001/api/v1/fleet/threshold",raise_for_status=False, json={
@@ -223,17 +290,22 @@ async def handle_manual_sign(detection: UserActivityDetection, db: AsyncSession)
     await db.commit()
 
 
-async def _push_notice_when_detect(*, user: User, activity: SignActivity, config: SignConfig, logger: DBLogger, http_client: AsyncHttpClient):
+def _push_notice(*, user: User, config: SignConfigSnapshot, title: str, message: str) -> None:
+    """交给推送通知调度器在后台发送，短时间内的多条通知会合并"""
+    if config.ios_bark_key:
+        notifier.notify(BARK, config.ios_bark_key, title, message, user_id=user.id)
+    if config.android_ntfy_key:
+        notifier.notify(NTFY, config.android_ntfy_key, title, message, user_id=user.id)
+
+
+def _push_notice_when_detect(*, user: User, activity: SignActivity, config: SignConfigSnapshot):
     if not config.notify_on_detect:
         return
     message = f"{activity.course_name} 课程的 {activity.title} {activity.sign_type}签到: {activity.title}"
-    if config.ios_bark_key:
-        await push_to_bark(title=f"签到检测", message=message, key=config.ios_bark_key, logger=logger, http_client=http_client)
-    if config.android_ntfy_key:
-        await push_to_ntfy(title=f"签到检测", message=message, key=config.android_ntfy_key, logger=logger, http_client=http_client)
+    _push_notice(user=user, config=config, title="签到检测", message=message)
         
 
-async def _push_notice_when_sign(*, user: User, activity: SignActivity, config: SignConfig, response_data: dict, logger: DBLogger, http_client: AsyncHttpClient):
+def _push_notice_when_sign(*, user: User, activity: SignActivity, config: SignConfigSnapshot, response_data: dict):
     if not config.notify_on_sign:
         return
     if response_data.get("result"):
@@ -241,7 +313,4 @@ async def _push_notice_when_sign(*, user: User, activity: SignActivity, config:
     else:
         title = "签到失败"
     message = f"{activity.course_name} 课程的 {activity.title} {activity.sign_type}签到: {activity.title}"
-    if config.ios_bark_key:
-        await push_to_bark(title=title, message=message, key=config.ios_bark_key, logger=logger, http_client=http_client)
-    if config.android_ntfy_key:
-        await push_to_ntfy(title=title, message=message, key=config.android_ntfy_key, logger=logger, http_client=http_client)
+    _push_notice(user=user, config=config, title=title, message=message)
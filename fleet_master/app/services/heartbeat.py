@@ -0,0 +1,260 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, bindparam, case, delete, func, insert, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from shared.core.config import settings
+from shared.db.session import async_session
+from shared.models.worker import Worker, WorkerStatus
+from shared.models.worker_metric import WorkerMetric
+from shared.schemas.worker import WorkerLoad
+from shared.utils.cache import TTLCache
+from shared.utils.pubsub import WORKER_CHANGED, WorkerChanged, pubsub
+
+logger = logging.getLogger(__name__)
+
+workers_table = Worker.__table__
+
+
+class _LoadAccumulator:
+    """一个采样周期内的负载指标，写入时取平均值"""
+
+    def __init__(self):
+        self.samples = 0
+        self._sums: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+
+    def add(self, load: WorkerLoad) -> None:
+        self.samples += 1
+        for field, value in load.model_dump(exclude_none=True).items():
+            self._sums[field] = self._sums.get(field, 0.0) + value
+            self._counts[field] = self._counts.get(field, 0) + 1
+
+    def mean(self, field: str) -> Optional[float]:
+        if not self._counts.get(field):
+            return None
+        return self._sums[field] / self._counts[field]
+
+
+class HeartbeatBuffer:
+    """
+    进程级心跳缓冲
+
+    心跳请求只更新内存中的最近心跳时间和状态，不访问数据库；后台任务每隔 flush_interval 秒
+    用一条批量 UPDATE 写入 workers.last_heartbeat，只会用更新的时间覆盖（多个进程各自写入时不会回退）。
+    心跳附带的负载指标按 metrics_interval 聚合后写入 worker_metrics。
+    节点名称到 ID、ID 到节点信息的映射缓存在内存中，心跳接口通常不需要任何查询。
+    """
+
+    def __init__(self, flush_interval: float = 5.0, metrics_interval: float = 60.0):
+        self.flush_interval = flush_interval
+        self.metrics_interval = metrics_interval
+
+        self._pending: Dict[str, Tuple[datetime, WorkerStatus]] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._latest_load: Dict[str, Dict[str, Any]] = {}
+        self._loads: Dict[str, _LoadAccumulator] = {}
+        self._metrics_started_at = time.monotonic()
+
+        self._workers: TTLCache[Worker] = TTLCache(max_size=1000, ttl=settings.LOOKUP_CACHE_TTL)
+        self._task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+
+        # 统计计数
+        self.received = 0
+        self.flushed = 0
+        self.failed = 0
+        self.last_flush_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """启动后台写入任务，需要在事件循环中调用"""
+        if self.running:
+            return
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="heartbeat-buffer")
+        logger.info(f"心跳缓冲已启动，写入间隔 {self.flush_interval}s")
+
+    async def stop(self) -> None:
+        """停止后台任务，并写入剩余的心跳和负载指标"""
+        if not self._task:
+            return
+        self._closing.set()
+        await self._task
+        self._task = None
+        await self.flush()
+        await self.flush_metrics()
+
+    async def get_worker(self, db: AsyncSession, *, worker_id: Optional[int] = None, name: Optional[str] = None) -> Optional[Worker]:
+        """按 ID 或名称获取节点信息，优先使用缓存（会话关闭后的只读对象）"""
+        key = ("id", worker_id) if worker_id is not None else ("name", name)
+        worker = self._workers.get(key)
+        if worker is not None:
+            return worker
+        condition = Worker.id == worker_id if worker_id is not None else Worker.name == name
+        worker = (await db.execute(select(Worker).where(condition))).scalars().first()
+        if worker:
+            db.expunge(worker)
+            self._workers.set(("id", worker.id), worker)
+            self._workers.set(("name", worker.name), worker)
+        return worker
+
+    def forget(self, worker_name: str) -> None:
+        """节点信息变更或删除后清除缓存"""
+        self._workers.discard_where(lambda worker: worker.name == worker_name)
+
+    def clear(self) -> None:
+        self._workers.clear()
+
+    def record(self, worker_name: str, status: WorkerStatus = WorkerStatus.ONLINE, load: Optional[WorkerLoad] = None) -> datetime:
+        """记录一次心跳，返回心跳时间"""
+        now = datetime.now(timezone.utc)
+        self._pending[worker_name] = (now, status)
+        self._last_seen[worker_name] = now.timestamp()
+        self.received += 1
+        if load is not None:
+            self._latest_load[worker_name] = load.model_dump(exclude_none=True)
+            self._loads.setdefault(worker_name, _LoadAccumulator()).add(load)
+        return now
+
+    def last_seen(self, worker_name: str) -> Optional[float]:
+        """本进程收到的最近一次心跳时间（时间戳）"""
+        return self._last_seen.get(worker_name)
+
+    def latest_load(self, worker_name: str) -> Optional[Dict[str, Any]]:
+        return self._latest_load.get(worker_name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "flush_interval": self.flush_interval,
+            "metrics_interval": self.metrics_interval,
+            "received": self.received,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "last_flush_at": self.last_flush_at,
+        }
+
+    async def _run(self) -> None:
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._closing.is_set():
+                break
+            await self.flush()
+            if time.monotonic() - self._metrics_started_at >= self.metrics_interval:
+                await self.flush_metrics()
+
+    async def flush(self) -> None:
+        """批量写入缓冲中的心跳，失败时放回缓冲等待下次写入"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        rows = [
+            {"worker_name": name, "seen": seen, "new_status": status}
+            for name, (seen, status) in pending.items()
+        ]
+        new_status = bindparam("new_status", type_=workers_table.c.status.type)
+        statement = (
+            update(workers_table)
+            .where(workers_table.c.name == bindparam("worker_name"))
+            .where(or_(workers_table.c.last_heartbeat.is_(None), workers_table.c.last_heartbeat < bindparam("seen")))
+            .values(
+                last_heartbeat=bindparam("seen"),
+                # 熔断标记的 ERROR 只由熔断恢复或主动健康检查清除，ONLINE 心跳不覆盖
+                status=case(
+                    (and_(workers_table.c.status == WorkerStatus.ERROR, new_status == WorkerStatus.ONLINE), workers_table.c.status),
+                    else_=new_status,
+                ),
+            )
+        )
+        try:
+            async with async_session() as db:
+                await db.execute(statement, rows)
+                await db.commit()
+            self.flushed += len(rows)
+            self.last_flush_at = time.time()
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"批量写入 {len(rows)} 条心跳失败: {e}")
+            for name, value in pending.items():
+                self._pending.setdefault(name, value)
+
+    async def flush_metrics(self) -> None:
+        """把本周期聚合的负载指标写入 worker_metrics"""
+        self._metrics_started_at = time.monotonic()
+        if not self._loads:
+            return
+        loads, self._loads = self._loads, {}
+        now = datetime.now(timezone.utc)
+        rows = []
+        for name, load in loads.items():
+            connections = load.mean("connections")
+            queue_depth = load.mean("queue_depth")
+            rows.append({
+                "worker_name": name,
+                "ts": now,
+                "samples": load.samples,
+                "connections": round(connections) if connections is not None else None,
+                "cpu_percent": load.mean("cpu_percent"),
+                "queue_depth": round(queue_depth) if queue_depth is not None else None,
+            })
+        try:
+            async with async_session() as db:
+                await db.execute(insert(WorkerMetric), rows)
+                await db.commit()
+        except Exception as e:
+            logger.error(f"写入 {len(rows)} 条节点负载指标失败: {e}")
+
+
+heartbeats = HeartbeatBuffer(
+    flush_interval=settings.HEARTBEAT_FLUSH_INTERVAL,
+    metrics_interval=settings.HEARTBEAT_METRICS_INTERVAL,
+)
+
+
+@pubsub.subscribe(WORKER_CHANGED)
+def _on_worker_changed(payload: WorkerChanged) -> None:
+    heartbeats.forget(payload.worker_name)
+
+
+pubsub.on_reconnect(heartbeats.clear)
+
+
+async def sweep_stale_workers(db: AsyncSession, timeout: float) -> List[str]:
+    """
+    把超过 timeout 秒没有心跳的节点标记为离线，返回被标记的节点名称
+
+    从未发送过心跳的节点以最后更新时间为准，刚注册的节点不会被立即标记。
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=timeout)
+    result = await db.execute(
+        update(workers_table)
+        .where(workers_table.c.status != WorkerStatus.OFFLINE)
+        .where(func.coalesce(workers_table.c.last_heartbeat, workers_table.c.updated_at) < cutoff)
+        .values(status=WorkerStatus.OFFLINE, updated_at=func.now())
+        .returning(workers_table.c.name)
+    )
+    names = list(result.scalars().all())
+    await db.commit()
+    return names
+
+
+async def clean_worker_metrics(db: AsyncSession, retention_days: int) -> int:
+    """删除超过保留天数的负载指标，返回删除数量"""
+    result = await db.execute(
+        delete(WorkerMetric).where(WorkerMetric.ts < datetime.now(timezone.utc) - timedelta(days=retention_days))
+    )
+    await db.commit()
+    return result.rowcount
@@ -0,0 +1,438 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from shared.core.config import settings
+from shared.db.session import async_session
+from shared.models.sign_job import JobStatus, SignJob
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+# 任务类型 -> 处理函数
+_handlers: Dict[str, JobHandler] = {}
+# 任务类型 -> 执行超时（秒），未设置时使用 JOB_QUEUE_JOB_TIMEOUT
+_timeouts: Dict[str, float] = {}
+
+# 当前协程正在执行的任务
+_current_job: ContextVar[Optional[SignJob]] = ContextVar("current_job", default=None)
+
+
+def job_handler(kind: str, timeout: Optional[float] = None):
+    """
+    注册任务处理函数
+
+    处理函数只接收任务的 payload，抛出异常表示需要重试。
+    任务可能被重复执行（重试、进程退出后重新入队），处理函数需要保证幂等。
+    执行时间较长的任务可以单独设置 timeout，并定期调用 job_queue.report_progress 续期。
+    """
+    def decorator(fn: JobHandler) -> JobHandler:
+        _handlers[kind] = fn
+        if timeout is not None:
+            _timeouts[kind] = timeout
+        return fn
+    return decorator
+
+
+class JobQueue:
+    """
+    基于 Postgres 的签到任务队列
+
+    任务写入 sign_jobs 表后立即返回，每个进程的后台任务用 FOR UPDATE SKIP LOCKED
+    领取待执行的任务，多个 gunicorn worker 之间不会重复领取。失败的任务按指数退避重试，
+    超过最大次数后标记为 DEAD；进程重启时未完成的任务在锁超时后重新入队。
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 20,
+        worker_concurrency: int = 10,
+        poll_interval: float = 1.0,
+        max_attempts: int = 5,
+        backoff_base: float = 2.0,
+        backoff_max: float = 300.0,
+        job_timeout: float = 120.0,
+        lock_timeout: float = 600.0,
+    ):
+        self.concurrency = concurrency
+        self.worker_concurrency = worker_concurrency
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.job_timeout = job_timeout
+        self.lock_timeout = lock_timeout
+
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._running_jobs: Set[asyncio.Task] = set()
+        # 当前进程中每个工作节点正在执行的任务数
+        self._worker_running: Dict[str, int] = {}
+
+        # 统计计数
+        self.succeeded = 0
+        self.retried = 0
+        self.dead = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """启动后台领取任务，需要在事件循环中调用"""
+        if self.running:
+            return
+        self._closing = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="job-queue")
+        logger.info(f"任务队列已启动，节点 {self.node_id}，并发 {self.concurrency}")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """停止领取新任务，等待执行中的任务结束，超时的任务放回队列"""
+        if not self._task:
+            return
+        self._closing.set()
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+        if self._running_jobs:
+            _, pending = await asyncio.wait(self._running_jobs, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        logger.info("任务队列已停止")
+
+    async def enqueue(
+        self,
+        db: AsyncSession,
+        kind: str,
+        payload: Dict[str, Any],
+        *,
+        worker_name: Optional[str] = None,
+        max_attempts: Optional[int] = None,
+    ) -> SignJob:
+        """写入一个任务并提交事务"""
+        if kind not in _handlers:
+            raise ValueError(f"未注册的任务类型: {kind}")
+        job = SignJob(
+            kind=kind,
+            payload=payload,
+            worker_name=worker_name,
+            max_attempts=max_attempts or self.max_attempts,
+        )
+        db.add(job)
+        await db.commit()
+        # 本进程立即领取，无需等待下一次轮询
+        if self._wakeup:
+            self._wakeup.set()
+        return job
+
+    def backoff(self, attempts: int) -> float:
+        """第 attempts 次失败后的等待时间，带随机抖动"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return random.uniform(delay / 2, delay)
+
+    async def _run(self) -> None:
+        last_recover = 0.0
+        while not self._closing.is_set():
+            try:
+                if time.monotonic() - last_recover > self.lock_timeout / 2:
+                    await self._recover_stale()
+                    last_recover = time.monotonic()
+
+                jobs = []
+                free = self.concurrency - len(self._running_jobs)
+                if free > 0:
+                    jobs = await self._claim(free)
+                for job in jobs:
+                    self._worker_running[job.worker_name] = self._worker_running.get(job.worker_name, 0) + 1
+                    task = asyncio.create_task(self._execute(job))
+                    self._running_jobs.add(task)
+                    task.add_done_callback(self._running_jobs.discard)
+                # 领满一批时马上继续领取，否则等待新任务通知或轮询间隔
+                if jobs and len(jobs) == free:
+                    continue
+            except Exception as e:
+                logger.error(f"领取任务失败: {e}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self, limit: int) -> List[SignJob]:
+        """领取至多 limit 个到期的任务"""
+        now = datetime.now(timezone.utc)
+        # 本进程已占满的工作节点不再领取
+        saturated = [
+            name for name, count in self._worker_running.items()
+            if name is not None and count >= self.worker_concurrency
+        ]
+        running = aliased(SignJob)
+        running_count = (
+            select(func.count())
+            .select_from(running)
+            .where(running.status == JobStatus.RUNNING)
+            .where(running.worker_name == SignJob.worker_name)
+            .scalar_subquery()
+        )
+        query = (
+            select(SignJob)
+            .where(SignJob.status == JobStatus.PENDING)
+            .where(SignJob.run_at <= now)
+            # 所有进程合计的并发已满的工作节点暂不领取
+            .where(or_(SignJob.worker_name.is_(None), running_count < self.worker_concurrency))
+            .order_by(SignJob.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True, of=SignJob)
+        )
+        if saturated:
+            query = query.where(or_(SignJob.worker_name.is_(None), SignJob.worker_name.notin_(saturated)))
+
+        async with async_session() as db:
+            jobs = (await db.execute(query)).scalars().all()
+            # 上面的条件只按领取前的运行数判断，同一批可能领到同一节点的很多任务：
+            # 每个节点只领取剩余的并发数，多余的任务保持 PENDING，提交后释放行锁
+            remaining: Dict[str, int] = {}
+            worker_names = {job.worker_name for job in jobs if job.worker_name is not None}
+            if worker_names:
+                rows = await db.execute(
+                    select(SignJob.worker_name, func.count())
+                    .where(SignJob.status == JobStatus.RUNNING)
+                    .where(SignJob.worker_name.in_(worker_names))
+                    .group_by(SignJob.worker_name)
+                )
+                running_by_worker = dict(rows.all())
+                remaining = {
+                    name: self.worker_concurrency - running_by_worker.get(name, 0)
+                    for name in worker_names
+                }
+            claimed = []
+            for job in jobs:
+                if job.worker_name is not None:
+                    if remaining[job.worker_name] <= 0:
+                        continue
+                    remaining[job.worker_name] -= 1
+                job.status = JobStatus.RUNNING
+                job.attempts += 1
+                job.locked_by = self.node_id
+                job.locked_at = now
+                job.started_at = now
+                job.updated_at = now
+                claimed.append(job)
+            await db.commit()
+        return claimed
+
+    async def _execute(self, job: SignJob) -> None:
+        handler = _handlers.get(job.kind)
+        _current_job.set(job)
+        try:
+            if handler is None:
+                raise RuntimeError(f"未注册的任务类型: {job.kind}")
+            await asyncio.wait_for(handler(job.payload), _timeouts.get(job.kind, self.job_timeout))
+        except asyncio.CancelledError:
+            # 进程退出时放回队列，不计入尝试次数
+            await self._finish(job, status=JobStatus.PENDING, attempts=job.attempts - 1)
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:1000]
+            if job.attempts >= job.max_attempts:
+                self.dead += 1
+                logger.error(f"任务 {job.id} ({job.kind}) 第 {job.attempts} 次执行失败，进入死信: {error}")
+                await self._finish(job, status=JobStatus.DEAD, last_error=error, finished_at=datetime.now(timezone.utc))
+            else:
+                self.retried += 1
+                delay = self.backoff(job.attempts)
+                logger.warning(f"任务 {job.id} ({job.kind}) 第 {job.attempts} 次执行失败，{delay:.1f}s 后重试: {error}")
+                await self._finish(
+                    job,
+                    status=JobStatus.PENDING,
+                    last_error=error,
+                    run_at=datetime.now(timezone.utc) + timedelta(seconds=delay),
+                )
+        else:
+            self.succeeded += 1
+            await self._finish(job, status=JobStatus.SUCCEEDED, finished_at=datetime.now(timezone.utc))
+        finally:
+            self._worker_running[job.worker_name] -= 1
+            if not self._worker_running[job.worker_name]:
+                del self._worker_running[job.worker_name]
+            # 释放了并发名额，唤醒领取循环
+            if self._wakeup:
+                self._wakeup.set()
+
+    async def _finish(self, job: SignJob, *, status: JobStatus, **values: Any) -> None:
+        """更新任务状态，只更新仍由本进程持有的任务"""
+        values.setdefault("locked_by", None)
+        values.setdefault("locked_at", None)
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    update(SignJob)
+                    .where(SignJob.id == job.id)
+                    .where(SignJob.locked_by == self.node_id)
+                    .values(status=status, updated_at=datetime.now(timezone.utc), **values)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"更新任务 {job.id} 状态失败: {e}")
+
+    async def report_progress(self, progress: Dict[str, Any]) -> None:
+        """
+        在任务处理函数中调用：把进度写入任务 payload 的 progress 字段，并续期任务锁
+
+        执行时间超过 JOB_QUEUE_LOCK_TIMEOUT 的任务需要定期调用，否则会被当作进程已退出而重新入队。
+        重试时处理函数收到的 payload 带有上次写入的进度。不在任务中调用时不做任何事。
+        """
+        job = _current_job.get()
+        if job is None:
+            return
+        job.payload = {**job.payload, "progress": progress}
+        now = datetime.now(timezone.utc)
+        try:
+            async with async_session() as db:
+                await db.execute(
+                    update(SignJob)
+                    .where(SignJob.id == job.id)
+                    .where(SignJob.locked_by == self.node_id)
+                    .values(payload=job.payload, locked_at=now, updated_at=now)
+                )
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"更新任务 {job.id} 进度失败: {e}")
+
+    async def _recover_stale(self) -> None:
+        """领取后长时间未完成的任务（进程已退出）重新入队或进入死信"""
+        now = datetime.now(timezone.utc)
+        stale = and_(
+            SignJob.status == JobStatus.RUNNING,
+            SignJob.locked_at < now - timedelta(seconds=self.lock_timeout),
+        )
+        async with async_session() as db:
+            dead = await db.execute(
+                update(SignJob)
+                .where(stale)
+                .where(SignJob.attempts >= SignJob.max_attempts)
+                .values(status=JobStatus.DEAD, last_error="执行超时，进程可能已退出", locked_by=None, locked_at=None, finished_at=now, updated_at=now)
+            )
+            requeued = await db.execute(
+                update(SignJob)
+                .where(stale)
+                .values(status=JobStatus.PENDING, run_at=now, locked_by=None, locked_at=None, updated_at=now)
+            )
+            await db.commit()
+        if dead.rowcount or requeued.rowcount:
+            logger.warning(f"回收超时任务: 重新入队 {requeued.rowcount} 个，进入死信 {dead.rowcount} 个")
+
+    async def stats(self, db: AsyncSession, window: timedelta = timedelta(hours=1)) -> Dict[str, Any]:
+        """
+        获取队列深度和延迟分位数
+
+        等待时间为任务到期到被领取的时间，执行时间为最后一次执行的耗时，
+        端到端时间为创建到完成的时间，统计最近 window 内完成的任务。
+        """
+        now = datetime.now(timezone.utc)
+        result = await db.execute(
+            select(SignJob.status, func.count()).group_by(SignJob.status)
+        )
+        depth = {status.value: 0 for status in JobStatus}
+        for status, count in result.all():
+            depth[status.value] = count
+
+        oldest = (await db.execute(
+            select(func.min(SignJob.run_at))
+            .where(SignJob.status == JobStatus.PENDING)
+            .where(SignJob.run_at <= now)
+        )).scalar()
+
+        def percentiles(expr):
+            return [
+                func.percentile_cont(q).within_group(func.extract("epoch", expr))
+                for q in (0.5, 0.9, 0.99)
+            ]
+
+        row = (await db.execute(
+            select(
+                *percentiles(SignJob.started_at - SignJob.run_at),
+                *percentiles(SignJob.finished_at - SignJob.started_at),
+                *percentiles(SignJob.finished_at - SignJob.created_at),
+            )
+            .where(SignJob.status == JobStatus.SUCCEEDED)
+            .where(SignJob.finished_at >= now - window)
+        )).one()
+
+        def as_dict(values):
+            return {
+                name: round(value, 3) if value is not None else None
+                for name, value in zip(("p50", "p90", "p99"), values)
+            }
+
+        return {
+            "depth": depth,
+            "oldest_pending_seconds": (now - oldest).total_seconds() if oldest else 0,
+            "latency_window_seconds": window.total_seconds(),
+            "wait_seconds": as_dict(row[0:3]),
+            "run_seconds": as_dict(row[3:6]),
+            "total_seconds": as_dict(row[6:9]),
+            "process": {
+                "node_id": self.node_id,
+                "running": self.running,
+                "in_flight": len(self._running_jobs),
+                "worker_in_flight": dict(self._worker_running),
+                "succeeded": self.succeeded,
+                "retried": self.retried,
+                "dead": self.dead,
+            },
+        }
+
+    async def retry_dead(self, db: AsyncSession, job_id: int) -> bool:
+        """把死信任务重新放回队列"""
+        result = await db.execute(
+            update(SignJob)
+            .where(SignJob.id == job_id)
+            .where(SignJob.status == JobStatus.DEAD)
+            .values(status=JobStatus.PENDING, attempts=0, run_at=datetime.now(timezone.utc), finished_at=None, updated_at=datetime.now(timezone.utc))
+        )
+        await db.commit()
+        if self._wakeup:
+            self._wakeup.set()
+        return result.rowcount > 0
+
+
+async def clean_jobs(db: AsyncSession, retention_days: int) -> int:
+    """删除超过保留天数的成功任务，死信任务保留以便排查"""
+    result = await db.execute(
+        delete(SignJob)
+        .where(SignJob.status == JobStatus.SUCCEEDED)
+        .where(SignJob.finished_at < datetime.now(timezone.utc) - timedelta(days=retention_days))
+    )
+    await db.commit()
+    return result.rowcount
+
+
+job_queue = JobQueue(
+    concurrency=settings.JOB_QUEUE_CONCURRENCY,
+    worker_concurrency=settings.JOB_QUEUE_WORKER_CONCURRENCY,
+    poll_interval=settings.JOB_QUEUE_POLL_INTERVAL,
+    max_attempts=settings.JOB_QUEUE_MAX_ATTEMPTS,
+    backoff_base=settings.JOB_QUEUE_BACKOFF_BASE,
+    backoff_max=settings.JOB_QUEUE_BACKOFF_MAX,
+    job_timeout=settings.JOB_QUEUE_JOB_TIMEOUT,
+    lock_timeout=settings.JOB_QUEUE_LOCK_TIMEOUT,
+)
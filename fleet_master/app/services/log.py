@@ -1,13 +1,49 @@
-from typing import List, Optional, Dict, Any
-import inspect
+from typing import List, Optional, Dict, Any, Tuple
+import base64
+import json
+import random
+import sys
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
-from sqlalchemy import desc
+from sqlalchemy import desc, func, literal_column, or_, text, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from shared.models.log import Log, LogLevel, LogCategory
+from app.services.bulk_delete import DeleteProgress, bulk_delete
+from app.services.job_queue import job_handler, job_queue
+from shared.core.config import settings
+from shared.db.session import async_session
+from shared.models.log import LOG_SEARCH_DOCUMENT, Log, LogLevel, LogCategory
+from shared.schemas.log import LogFilter
+from shared.utils.http_body import resolve_details
+from shared.utils.log_sink import log_sink
+
+# 日志封装所在的模块，查找调用者时跳过
+_WRAPPER_MODULES = frozenset({__name__, "shared.utils.logger"})
+
+# 代码对象 -> source，封装模块中的代码对象为空字符串
+_source_cache: Dict[Any, str] = {}
+
+
+def caller_source() -> str:
+    """
+    调用日志函数的代码位置，格式为 "模块.函数"
+
+    沿调用栈跳过日志封装（DBLogger.info -> log -> add_log），返回第一个业务函数。
+    结果按代码对象缓存，每个调用点只在第一次调用时拼接字符串。
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        code = frame.f_code
+        source = _source_cache.get(code)
+        if source is None:
+            module = frame.f_globals.get("__name__", "")
+            source = _source_cache[code] = "" if module in _WRAPPER_MODULES else f"{module}.{code.co_name}"
+        if source:
+            return source
+        frame = frame.f_back
+    return ""
 
 
 async def add_log(
@@ -21,14 +57,15 @@ async def add_log(
     task_id: Optional[int] = None,
     worker_id: Optional[int] = None
 ) -> Log:
-    """添加日志到数据库"""
-    # 如果没有指定source，尝试自动获取调用者信息
+    """
+    添加日志到数据库
+    
+    日志写入器运行时，日志只放入缓冲区，由后台任务批量写入，返回的 Log 对象不带 id；
+    未启动写入器时（如独立脚本中），直接使用传入的会话写入。
+    """
+    # 如果没有指定source，使用调用者信息
     if not source:
-        frame = inspect.currentframe().f_back
-        if frame:
-            module = frame.f_globals.get('__name__', '')
-            func = frame.f_code.co_name
-            source = f"{module}.{func}"
+        source = caller_source()
     
     # 创建日志记录
     log = Log(
@@ -42,6 +79,11 @@ async def add_log(
         worker_id=worker_id
     )
     
+    if log_sink.running:
+        log_sink.put(log.model_dump(exclude={"id"}))
+        return log
+    
+    resolve_details(log.details)
     db.add(log)
     await db.commit()
     await db.refresh(log)
@@ -91,7 +133,8 @@ async def log_exception(
     category: LogCategory = LogCategory.SYSTEM,
     user_id: Optional[int] = None,
     task_id: Optional[int] = None,
-    worker_id: Optional[int] = None
+    worker_id: Optional[int] = None,
+    source: str = None
 ) -> Log:
     """记录异常到日志"""
     # 获取异常信息
@@ -117,7 +160,205 @@ async def log_exception(
         level=LogLevel.ERROR,
         category=category,
         details=details,
+        source=source or caller_source(),
         user_id=user_id,
         task_id=task_id,
         worker_id=worker_id
-    ) 
\ No newline at end of file
+    ) 
+
+
+def apply_log_filters(query, filter: LogFilter):
+    """给日志查询添加筛选条件"""
+    if filter.level:
+        query = query.where(Log.level == filter.level)
+    if filter.category:
+        query = query.where(Log.category == filter.category)
+    if filter.user_id:
+        query = query.where(Log.user_id == filter.user_id)
+    if filter.task_id:
+        query = query.where(Log.task_id == filter.task_id)
+    if filter.worker_id:
+        query = query.where(Log.worker_id == filter.worker_id)
+    if filter.start_date:
+        query = query.where(Log.created_at >= filter.start_date)
+    if filter.end_date:
+        query = query.where(Log.created_at <= filter.end_date)
+    if filter.search:
+        query = query.where(
+            or_(
+                Log.message.contains(filter.search),
+                Log.source.contains(filter.search)
+            )
+        )
+    return query
+
+
+BULK_DELETE_LOGS_JOB = "bulk_delete_logs"
+
+
+async def delete_logs(filter: LogFilter, on_progress=None) -> DeleteProgress:
+    """分批删除符合条件的日志，返回删除进度（包含删除总数）"""
+    return await bulk_delete(Log, apply_log_filters(select(Log.id, Log.created_at), filter), on_progress=on_progress)
+
+
+@job_handler(BULK_DELETE_LOGS_JOB, timeout=settings.BULK_DELETE_JOB_TIMEOUT)
+async def run_delete_logs_job(payload: dict):
+    """后台删除日志任务，payload: {"filter": LogFilter, "user_id": ...}，进度写入 payload["progress"]"""
+    filter = LogFilter.model_validate(payload["filter"])
+
+    async def report(progress: DeleteProgress):
+        await job_queue.report_progress(progress.to_dict())
+
+    progress = await delete_logs(filter, on_progress=report)
+    async with async_session() as db:
+        await add_log(
+            db,
+            f"后台清空 {progress.deleted} 条日志",
+            level=LogLevel.WARNING,
+            category=LogCategory.SYSTEM,
+            details={"filter": payload["filter"], **progress.to_dict()},
+            source=f"{__name__}.run_delete_logs_job",
+            user_id=payload.get("user_id"),
+        )
+
+
+def encode_log_cursor(log: Log) -> str:
+    """把一页最后一条日志的 (created_at, id) 编码为不透明的游标"""
+    raw = json.dumps([log.created_at.isoformat(), log.id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_log_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标，格式不正确时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, log_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(log_id)
+    except Exception as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
+
+
+async def query_logs_page(
+    db: AsyncSession,
+    filter: LogFilter,
+    limit: int = 100,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Log], Optional[str]]:
+    """
+    按 (created_at, id) 倒序分页查询日志，返回日志列表和下一页的游标
+
+    传入 cursor 时从游标位置继续读取（键集分页），利用 ix_logs_created_at_id 索引直接定位，
+    耗时与页码无关；否则按 skip 偏移，兼容跳页。没有更多数据时下一页游标为 None。
+    """
+    query = apply_log_filters(select(Log), filter)
+    if cursor:
+        created_at, log_id = decode_log_cursor(cursor)
+        query = query.where(tuple_(Log.created_at, Log.id) < tuple_(created_at, log_id))
+        # 行比较不能用于分区裁剪，单独加上时间条件
+        query = query.where(Log.created_at <= created_at)
+    elif skip:
+        query = query.offset(skip)
+    # 多取一条判断是否还有下一页
+    query = query.order_by(Log.created_at.desc(), Log.id.desc()).limit(limit + 1)
+    logs = list((await db.execute(query)).scalars().all())
+    if len(logs) <= limit:
+        return logs, None
+    logs = logs[:limit]
+    return logs, encode_log_cursor(logs[-1])
+
+
+async def estimate_log_count(db: AsyncSession, filter: LogFilter) -> int:
+    """
+    估算符合条件的日志数量
+
+    Postgres 上使用查询计划的估计行数（来自 pg_class.reltuples 和列统计信息），不扫描表；
+    估计值小于 LOG_QUERY_EXACT_COUNT_THRESHOLD 时精确计数的代价很低，改为返回准确值。
+    其他数据库或无法获取查询计划时直接计数。
+    """
+    query = apply_log_filters(select(Log.id), filter)
+    if db.get_bind().dialect.name == "postgresql":
+        try:
+            sql = query.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+            plan = (await db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = int(plan[0]["Plan"]["Plan Rows"])
+            if estimate >= settings.LOG_QUERY_EXACT_COUNT_THRESHOLD:
+                return estimate
+        except Exception:
+            pass
+    result = await db.execute(select(func.count()).select_from(query.subquery()))
+    return result.scalar_one()
+
+
+def should_audit_log_query() -> bool:
+    """
+    是否为本次日志查询写入审计日志
+
+    LOG_QUERY_AUDIT 为 all 时每次记录，sample 时按 LOG_QUERY_AUDIT_SAMPLE_RATE 抽样，off 时不记录。
+    """
+    mode = settings.LOG_QUERY_AUDIT
+    if mode == "all":
+        return True
+    if mode == "sample":
+        return random.random() < settings.LOG_QUERY_AUDIT_SAMPLE_RATE
+    return False
+
+
+def bound_search_window(filter: LogFilter) -> LogFilter:
+    """
+    全文检索必须限定时间范围：未指定时检索最近 LOG_SEARCH_DEFAULT_DAYS 天，
+    超过 LOG_SEARCH_MAX_DAYS 天时抛出 ValueError
+    """
+    end = filter.end_date or datetime.now(timezone.utc)
+    start = filter.start_date or end - timedelta(days=settings.LOG_SEARCH_DEFAULT_DAYS)
+    if start > end:
+        raise ValueError("开始时间不能晚于结束时间")
+    if end - start > timedelta(days=settings.LOG_SEARCH_MAX_DAYS):
+        raise ValueError(f"检索的时间范围不能超过 {settings.LOG_SEARCH_MAX_DAYS} 天")
+    return filter.model_copy(update={"start_date": start, "end_date": end, "search": None})
+
+
+async def fulltext_search_logs(
+    db: AsyncSession,
+    q: str,
+    filter: LogFilter,
+    limit: int = 50,
+    skip: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    在限定时间范围内全文检索日志，按相关度排序，返回 {"log", "rank", "highlight"} 列表
+
+    Postgres 上使用 ix_logs_search 表达式索引，检索消息、来源和 details 中的常用字段，
+    q 支持 websearch 语法（空格为且、or、"短语"、-排除）；highlight 为消息中命中部分用 <mark> 标出的片段，
+    消息本身未转义，展示时需要按纯文本处理。
+    其他数据库退化为子串匹配，按时间倒序，不返回相关度和高亮。
+    """
+    filter = bound_search_window(filter)
+    query = apply_log_filters(select(Log), filter)
+
+    if db.get_bind().dialect.name != "postgresql":
+        query = query.where(or_(Log.message.contains(q), Log.source.contains(q)))
+        query = query.order_by(Log.created_at.desc(), Log.id.desc()).offset(skip).limit(limit)
+        logs = (await db.execute(query)).scalars().all()
+        return [{"log": log, "rank": None, "highlight": None} for log in logs]
+
+    config = literal_column("'simple'::regconfig")
+    document = literal_column(f"({LOG_SEARCH_DOCUMENT})")
+    tsquery = func.websearch_to_tsquery(config, q)
+    rank = func.ts_rank_cd(document, tsquery)
+    # 带 LIMIT 排序时，Postgres 只对返回的行计算 ts_headline
+    highlight = func.ts_headline(
+        config, Log.message, tsquery,
+        "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5",
+    )
+    query = (
+        query.add_columns(rank.label("rank"), highlight.label("highlight"))
+        .where(document.op("@@")(tsquery))
+        .order_by(rank.desc(), Log.created_at.desc(), Log.id.desc())
+        .offset(skip)
+        .limit(limit)
+    )
+    result = await db.execute(query)
+    return [{"log": log, "rank": rank, "highlight": highlight} for log, rank, highlight in result.all()]
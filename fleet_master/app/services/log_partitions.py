@@ -0,0 +1,155 @@
+import logging
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shared.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PARENT = "logs"
+DEFAULT_PARTITION = "logs_default"
+PARTITION_PREFIX = "logs_p"
+
+_BOUND_RE = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+Range = Tuple[datetime, datetime]
+
+
+async def is_partitioned(db: AsyncSession) -> bool:
+    """logs 是否为分区表（非 Postgres 或未迁移时为普通表）"""
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    relkind = (await db.execute(text(f"SELECT relkind FROM pg_class WHERE oid = to_regclass('{PARENT}')"))).scalar()
+    return relkind == "p"
+
+
+async def list_log_partitions(db: AsyncSession) -> Dict[str, Optional[Range]]:
+    """日志表的所有分区：名称 -> [开始, 结束)，默认分区为 None"""
+    # 分区边界按会话时区输出，统一为 UTC 便于解析
+    await db.execute(text("SET LOCAL TimeZone = 'UTC'"))
+    result = await db.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        f"WHERE i.inhparent = to_regclass('{PARENT}')"
+    ))
+    partitions: Dict[str, Optional[Range]] = {}
+    for name, bound in result.all():
+        match = _BOUND_RE.search(bound or "")
+        partitions[name] = (
+            (datetime.fromisoformat(match.group(1)), datetime.fromisoformat(match.group(2))) if match else None
+        )
+    return partitions
+
+
+def partition_window(day: date, days: Optional[int] = None) -> Range:
+    """包含 day 的分区范围，按周分区时从周一开始"""
+    days = days or settings.LOG_PARTITION_DAYS
+    ordinal = day.toordinal()
+    start = date.fromordinal(ordinal - (ordinal - 1) % days)
+    start_at = datetime.combine(start, time.min, tzinfo=timezone.utc)
+    return start_at, start_at + timedelta(days=days)
+
+
+def _literal(value: datetime) -> str:
+    return f"'{value.isoformat()}'"
+
+
+async def ensure_log_partitions(
+    db: AsyncSession,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[str]:
+    """
+    创建 [start, end) 内缺少的分区，返回新建的分区名称
+
+    默认覆盖保留期内到未来 LOG_PARTITION_PREMAKE_DAYS 天。新分区先建成独立的表，
+    把默认分区中落在该范围内的日志移入后再 ATTACH。ATTACH 在父表上只需要 SHARE UPDATE EXCLUSIVE 锁，
+    但存在默认分区时还要锁住并扫描默认分区，确认其中没有属于新范围的行，期间写入默认分区的日志会被阻塞；
+    默认分区越大阻塞越久。每个分区在单独的事务中创建，并用 lock_timeout 限制等锁时间，
+    拿不到锁时放弃本次创建，下一次 clean_logs 再试。与已有分区重叠的范围（如修改了分区宽度）跳过。
+    """
+    now = datetime.now(timezone.utc)
+    start = start or now - timedelta(days=settings.LOG_RETENTION_DAYS)
+    end = end or now + timedelta(days=settings.LOG_PARTITION_PREMAKE_DAYS)
+
+    partitions = await list_log_partitions(db)
+    existing = [bounds for bounds in partitions.values() if bounds is not None]
+    has_default = DEFAULT_PARTITION in partitions
+    await db.commit()
+
+    created = []
+    lower, upper = partition_window(start.date())
+    windows = []
+    while lower < end:
+        windows.append((lower, upper))
+        lower, upper = upper, upper + (upper - lower)
+
+    for lower, upper in windows:
+        if not any(lower < b_upper and b_lower < upper for b_lower, b_upper in existing):
+            name = f"{PARTITION_PREFIX}{lower:%Y%m%d}"
+            try:
+                await db.execute(text("SET LOCAL lock_timeout = '5s'"))
+                await db.execute(text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+                if has_default:
+                    moved = await db.execute(text(
+                        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                        f"WHERE created_at >= {_literal(lower)} AND created_at < {_literal(upper)} RETURNING *) "
+                        f"INSERT INTO {name} SELECT * FROM moved"
+                    ))
+                    if moved.rowcount:
+                        logger.warning(f"从默认分区移动 {moved.rowcount} 条日志到 {name}")
+                await db.execute(text(
+                    f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+                    f"FOR VALUES FROM ({_literal(lower)}) TO ({_literal(upper)})"
+                ))
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logger.error(f"创建日志分区 {name} 失败: {e}")
+                continue
+            existing.append((lower, upper))
+            created.append(name)
+    if created:
+        logger.info(f"创建日志分区: {', '.join(created)}")
+    return created
+
+
+async def drop_expired_log_partitions(db: AsyncSession, retention_days: int) -> Tuple[List[str], int]:
+    """
+    删除整体早于保留期的分区，返回 (删除的分区名称, 从默认分区删除的行数)
+
+    DETACH 后 DROP，不产生死元组，不需要 VACUUM。边界跨过保留期的分区保留到下一次清理。
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    partitions = await list_log_partitions(db)
+    await db.commit()
+
+    dropped = []
+    for name, bounds in sorted(partitions.items()):
+        if bounds is None or bounds[1] > cutoff:
+            continue
+        # 等锁超时说明有长查询正在读该分区，下一次再删
+        try:
+            await db.execute(text("SET LOCAL lock_timeout = '5s'"))
+            await db.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name}"))
+            await db.execute(text(f"DROP TABLE {name}"))
+            await db.commit()
+            dropped.append(name)
+        except Exception as e:
+            await db.rollback()
+            logger.warning(f"删除日志分区 {name} 失败: {e}")
+
+    removed = 0
+    if DEFAULT_PARTITION in partitions:
+        result = await db.execute(text(
+            f"DELETE FROM {DEFAULT_PARTITION} WHERE created_at < {_literal(cutoff)}"
+        ))
+        await db.commit()
+        removed = result.rowcount
+    if dropped:
+        logger.info(f"删除过期日志分区: {', '.join(dropped)}")
+    return dropped, removed
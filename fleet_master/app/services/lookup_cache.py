@@ -0,0 +1,110 @@
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from shared.core.config import settings
+from shared.models.sign_activity import SignActivity
+from shared.models.user import User
+from shared.utils.cache import SingleFlight, TTLCache
+from shared.utils.pubsub import (
+    ACTIVITY_CHANGED, USER_CHANGED, WORKER_CHANGED,
+    ActivityChanged, UserChanged, WorkerChanged, pubsub,
+)
+
+# 工作节点上报活动时的查询缓存
+# 缓存的是已从会话中移除（expunge）的只读对象（已预加载 worker），调用方的会话回滚或关闭不会使其过期，
+# 调用方不能修改或重新加入会话，需要修改时通过自己的会话重新查询
+user_cache: TTLCache[User] = TTLCache(max_size=settings.LOOKUP_CACHE_MAX_SIZE, ttl=settings.LOOKUP_CACHE_TTL)
+activity_cache: TTLCache[SignActivity] = TTLCache(max_size=settings.LOOKUP_CACHE_MAX_SIZE, ttl=settings.LOOKUP_CACHE_TTL)
+
+# 同一活动的并发上报只创建一次活动
+activity_flight = SingleFlight()
+
+
+async def get_user_by_im_username(db: AsyncSession, im_username: str) -> Optional[User]:
+    """根据 IM 用户名获取用户及其工作节点，优先使用缓存"""
+    user = user_cache.get(im_username)
+    if user is not None:
+        return user
+    result = await db.execute(
+        select(User)
+        .where(User.im_username == im_username)
+        .options(selectinload(User.worker))
+        .limit(1)
+    )
+    user = result.scalars().first()
+    if user:
+        detach(db, user, user.worker)
+        user_cache.set(im_username, user)
+    return user
+
+
+async def get_activity(db: AsyncSession, activity_id: str) -> Optional[SignActivity]:
+    """根据活动 ID 获取活动，优先使用缓存"""
+    activity = activity_cache.get(activity_id)
+    if activity is not None:
+        return activity
+    result = await db.execute(
+        select(SignActivity)
+        .where(SignActivity.activity_id == activity_id)
+        .limit(1)
+    )
+    activity = result.scalars().first()
+    if activity:
+        detach(db, activity)
+        activity_cache.set(activity_id, activity)
+    return activity
+
+
+def detach(db: AsyncSession, *objects: Any) -> None:
+    """把要缓存的对象从会话中移除，已加载的属性保留"""
+    for obj in objects:
+        if obj is not None and obj in db:
+            db.expunge(obj)
+
+
+def invalidate_user(user_id: int) -> None:
+    """用户信息变更（IM 账号、Cookie、工作节点等）后删除缓存，并通知其他进程"""
+    pubsub.publish_nowait(USER_CHANGED, UserChanged(user_id=user_id))
+
+
+def invalidate_worker(worker_name: str) -> None:
+    """工作节点信息变更后删除该节点下所有用户的缓存，并通知其他进程"""
+    pubsub.publish_nowait(WORKER_CHANGED, WorkerChanged(worker_name=worker_name))
+
+
+def invalidate_activity(activity_id: str) -> None:
+    """活动信息变更后删除缓存，并通知其他进程"""
+    pubsub.publish_nowait(ACTIVITY_CHANGED, ActivityChanged(activity_id=activity_id))
+
+
+@pubsub.subscribe(USER_CHANGED)
+def _on_user_changed(payload: UserChanged) -> None:
+    user_cache.discard_where(lambda user: user.id == payload.user_id)
+
+
+@pubsub.subscribe(WORKER_CHANGED)
+def _on_worker_changed(payload: WorkerChanged) -> None:
+    user_cache.discard_where(lambda user: user.worker_name == payload.worker_name)
+
+
+@pubsub.subscribe(ACTIVITY_CHANGED)
+def _on_activity_changed(payload: ActivityChanged) -> None:
+    activity_cache.pop(payload.activity_id)
+
+
+@pubsub.on_reconnect
+def _clear_caches() -> None:
+    user_cache.clear()
+    activity_cache.clear()
+
+
+def stats() -> Dict[str, Any]:
+    """获取缓存状态"""
+    return {
+        "users": user_cache.stats(),
+        "activities": activity_cache.stats(),
+        "activity_flight": activity_flight.stats(),
+    }
@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.utils.push_notice import NTFY_PRIORITIES, bark_url, ntfy_request
+from shared.core.config import settings
+from shared.db.session import async_session
+from shared.models.log import LogCategory
+from shared.utils.http import AsyncHttpClient
+from shared.utils.logger import DBLogger
+from shared.utils.retry_policy import IDEMPOTENT_METHODS, RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+BARK = "bark"
+NTFY = "ntfy"
+
+# 同一推送渠道、同一接收方（推送 key）、同一标题的通知合并为一条
+NoticeKey = Tuple[str, str, str]
+
+# 合并后的内容最多保留的行数
+MAX_LINES = 10
+
+# ntfy 优先级从低到高，合并时取最高的
+_PRIORITY_ORDER = {priority: index for index, priority in enumerate(reversed(list(NTFY_PRIORITIES)))}
+
+
+class _TokenBucket:
+    """每个接收方的推送频率限制"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """距离下一次可以推送还需要等待的时间，为 0 时可以推送"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+
+class _PendingNotice:
+    """合并窗口内的一组通知"""
+
+    def __init__(self, provider: str, key: str, title: str, priority: str, user_id: Optional[int], due: float):
+        self.provider = provider
+        self.key = key
+        self.title = title
+        self.priority = priority
+        self.user_id = user_id
+        self.due = due
+        self.count = 0
+        self.messages: List[str] = []
+
+    def add(self, message: str, priority: str) -> None:
+        self.count += 1
+        if message not in self.messages:
+            self.messages.append(message)
+        if _PRIORITY_ORDER[priority] > _PRIORITY_ORDER[self.priority]:
+            self.priority = priority
+
+    def render(self) -> Tuple[str, str]:
+        """合并后的标题和内容，如 "签到检测（3 条）" """
+        if self.count == 1:
+            return self.title, self.messages[0]
+        lines = self.messages[:MAX_LINES]
+        if len(self.messages) > MAX_LINES:
+            lines.append(f"等 {len(self.messages)} 条")
+        return f"{self.title}（{self.count} 条）", "\n".join(lines)
+
+
+class NotificationDispatcher:
+    """
+    进程级推送通知调度器
+
+    notify 只把通知放入内存，不等待推送完成，签到流程不再等待 Bark / ntfy 响应。
+    同一接收方同一标题的通知在 coalesce_window 秒内合并为一条；每个接收方按令牌桶限制推送频率，
+    超出频率的通知继续等待并合并后续通知，而不是逐条排队。到期的通知由 workers 个后台任务发送，
+    请求走共享连接池，连接错误、429 和 5xx 按 RetryPolicy 退避重试，只有最终失败时写入数据库日志。
+    推送服务地址取自 BARK_SERVER / NTFY_SERVER，可以指向本地的测试服务。
+    """
+
+    def __init__(
+        self,
+        coalesce_window: float = 3.0,
+        rate_per_minute: float = 6.0,
+        burst: int = 3,
+        workers: int = 4,
+        max_pending: int = 10000,
+        max_retries: int = 3,
+        timeout: float = 10.0,
+    ):
+        self.coalesce_window = coalesce_window
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self.workers = workers
+        self.max_pending = max_pending
+        # 推送重复一次好过漏推，ntfy 的 POST 也重试
+        self.http_client = AsyncHttpClient(
+            timeout=timeout,
+            retry_policy=RetryPolicy(max_retries=max_retries, base_delay=1.0, methods=IDEMPOTENT_METHODS | {"POST"}),
+        )
+
+        self._pending: Dict[NoticeKey, _PendingNotice] = {}
+        self._buckets: Dict[Tuple[str, str], _TokenBucket] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._closing: Optional[asyncio.Event] = None
+
+        # 统计计数
+        self.received = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.dropped = 0
+        self.sent: Counter = Counter()
+        self.failed: Counter = Counter()
+        self.last_error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """启动调度和发送任务，需要在事件循环中调用"""
+        if self.running:
+            return
+        self.queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="notifier")
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"notifier-worker-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info(f"推送通知调度器已启动，合并窗口 {self.coalesce_window}s，发送任务 {self.workers} 个")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """停止调度，等待中的通知不再合并和限速，在 timeout 秒内尽量发送完"""
+        if not self._task:
+            return
+        self._closing.set()
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+        for notice in self._pending.values():
+            self.queue.put_nowait(notice)
+        self._pending.clear()
+        for _ in self._workers:
+            self.queue.put_nowait(None)
+        done, pending = await asyncio.wait(self._workers, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        self._workers = []
+        logger.info(f"推送通知调度器已停止，累计推送 {sum(self.sent.values())} 条，{len(pending)} 个发送任务超时被取消")
+
+    def notify(
+        self,
+        provider: str,
+        key: str,
+        title: str,
+        message: str,
+        *,
+        priority: str = "info",
+        user_id: Optional[int] = None,
+    ) -> bool:
+        """
+        非阻塞地提交一条通知
+
+        Returns:
+            bool: 通知是否被接受（调度器未启动或等待推送的通知过多时返回 False）
+        """
+        if not self.running:
+            logger.warning(f"推送通知调度器未启动，丢弃通知: {provider} {title}")
+            self.dropped += 1
+            return False
+        self.received += 1
+        notice_key = (provider, key, title)
+        notice = self._pending.get(notice_key)
+        if notice is not None:
+            self.coalesced += 1
+        elif len(self._pending) + self.queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return False
+        else:
+            notice = _PendingNotice(provider, key, title, priority, user_id, time.monotonic() + self.coalesce_window)
+            self._pending[notice_key] = notice
+            self._wakeup.set()
+        notice.add(message, priority)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "queued": self.queue.qsize() if self.queue else 0,
+            "coalesce_window": self.coalesce_window,
+            "rate_per_minute": self.rate * 60,
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "rate_limited": self.rate_limited,
+            "dropped": self.dropped,
+            "sent": dict(self.sent),
+            "failed": dict(self.failed),
+            "last_error": self.last_error,
+        }
+
+    def _bucket(self, provider: str, key: str) -> _TokenBucket:
+        bucket = self._buckets.get((provider, key))
+        if bucket is None:
+            bucket = self._buckets[(provider, key)] = _TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _release_due(self, now: float) -> Optional[float]:
+        """把到期且未超出频率的通知交给发送任务，返回最早的下一个到期时间"""
+        next_due = None
+        for notice_key, notice in list(self._pending.items()):
+            if notice.due <= now:
+                bucket = self._bucket(notice.provider, notice.key)
+                wait = bucket.wait_time(now)
+                if wait <= 0:
+                    bucket.take()
+                    del self._pending[notice_key]
+                    self.queue.put_nowait(notice)
+                    continue
+                # 超出频率：推迟发送，期间的通知继续合并
+                notice.due = now + wait
+                self.rate_limited += 1
+            if next_due is None or notice.due < next_due:
+                next_due = notice.due
+        return next_due
+
+    async def _run(self) -> None:
+        while not self._closing.is_set():
+            self._wakeup.clear()
+            now = time.monotonic()
+            next_due = self._release_due(now)
+            timeout = None if next_due is None else max(next_due - now, 0.0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self) -> None:
+        while True:
+            notice = await self.queue.get()
+            if notice is None:
+                return
+            try:
+                await self._deliver(notice)
+            except Exception as e:
+                logger.error(f"推送通知失败: {e}")
+
+    async def _deliver(self, notice: _PendingNotice) -> None:
+        title, message = notice.render()
+        error = None
+        try:
+            if notice.provider == BARK:
+                response = await self.http_client.get(bark_url(notice.key, title, message), raise_for_status=False)
+            else:
+                url, headers, body = ntfy_request(notice.key, title, message, notice.priority)
+                response = await self.http_client.post(url, content=body, headers=headers, raise_for_status=False)
+            if response.status_code != 200:
+                error = f"状态码={response.status_code}, 响应={response.text[:200]}"
+        except httpx.HTTPError as e:
+            error = f"{type(e).__name__}: {e}"
+
+        if error is None:
+            self.sent[notice.provider] += 1
+            logger.debug(f"推送{notice.provider}通知: {title}（合并 {notice.count} 条）")
+            return
+        self.failed[notice.provider] += 1
+        self.last_error = error
+        async with async_session() as db:
+            await DBLogger(db).error(
+                f"推送{notice.provider}通知失败: {error}",
+                category=LogCategory.PUSH,
+                user_id=notice.user_id,
+                details={"title": title, "message": message, "count": notice.count},
+            )
+
+
+notifier = NotificationDispatcher(
+    coalesce_window=settings.NOTIFY_COALESCE_WINDOW,
+    rate_per_minute=settings.NOTIFY_RATE_PER_MINUTE,
+    burst=settings.NOTIFY_BURST,
+    workers=settings.NOTIFY_WORKERS,
+    max_pending=settings.NOTIFY_MAX_PENDING,
+    max_retries=settings.NOTIFY_MAX_RETRIES,
+    timeout=settings.NOTIFY_TIMEOUT,
+)
@@ -0,0 +1,299 @@
+import asyncio
+import logging
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.security import create_fleet_jwt
+from app.services.heartbeat import heartbeats
+from app.services.lookup_cache import invalidate_user
+from app.services.worker import get_worker_url
+from app.services.ws_connections import ws_registry
+from shared.core.config import settings
+from shared.models.user import User
+from shared.models.worker import Worker, WorkerStatus
+from shared.models.worker_metric import WorkerMetric
+from shared.utils.http import AsyncHttpClient
+
+logger = logging.getLogger(__name__)
+
+
+class _SignStats:
+    """单个工作节点的签到耗时和错误率（指数滑动平均）"""
+
+    def __init__(self):
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples = 0
+
+    def record(self, seconds: float, ok: bool, alpha: float) -> None:
+        self.latency = seconds if self.latency is None else alpha * seconds + (1 - alpha) * self.latency
+        self.error_rate = alpha * (0.0 if ok else 1.0) + (1 - alpha) * self.error_rate
+        self.samples += 1
+
+
+class PlacementEngine:
+    """
+    工作节点负载评分与用户分配
+
+    评分越低越优先，由以下几项加权求和：
+    - 已分配的监控用户数、当前 WebSocket 连接数，按节点容量归一化
+      （capabilities["max_users"]，未配置时使用 PLACEMENT_DEFAULT_CAPACITY）
+    - 最近签到请求的耗时（相对 PLACEMENT_LATENCY_TARGET）和错误率
+    - 心跳上报的 CPU 使用率和任务队列长度（相对 PLACEMENT_QUEUE_TARGET）
+    - 心跳超过 PLACEMENT_HEARTBEAT_STALE 秒未更新的节点额外加分
+
+    计数保存在进程内存中：分配数定期从数据库刷新，两次刷新之间本进程的分配会立即计入，
+    连接数来自 ws_connections，签到耗时和错误率由 sign_coalescer 每次请求后更新。
+    负载取本进程收到的最近一次心跳和 worker_metrics 中最近一行（刷新时读取）中较新的一个，
+    超过 PLACEMENT_HEARTBEAT_STALE 秒的负载不计入。
+    """
+
+    def __init__(self, refresh_interval: float = 30.0, alpha: float = 0.2):
+        self.refresh_interval = refresh_interval
+        self.alpha = alpha
+        self._assigned: Dict[str, int] = {}
+        self._loaded_at = 0.0
+        self._sign_stats: Dict[str, _SignStats] = defaultdict(_SignStats)
+        # 节点名称 -> (采样时间戳, 负载指标)，来自 worker_metrics
+        self._metrics: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, db: AsyncSession, force: bool = False) -> None:
+        """从数据库刷新各节点的监控用户数和连接数"""
+        if not force and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._loaded_at < self.refresh_interval:
+                return
+            result = await db.execute(
+                select(User.worker_name, func.count())
+                .where(User.is_active == True)
+                .where(User.monitor_status == True)
+                .where(User.worker_name.is_not(None))
+                .group_by(User.worker_name)
+            )
+            self._assigned = {worker_name: count for worker_name, count in result.all()}
+            await ws_registry.load(db, force=force)
+            await self._load_metrics(db)
+            self._loaded_at = time.monotonic()
+
+    async def _load_metrics(self, db: AsyncSession) -> None:
+        """读取各节点最近一行负载指标，心跳可能由其他进程接收"""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.PLACEMENT_HEARTBEAT_STALE)
+        latest = (
+            select(WorkerMetric.worker_name, func.max(WorkerMetric.ts).label("ts"))
+            .where(WorkerMetric.ts >= cutoff)
+            .group_by(WorkerMetric.worker_name)
+            .subquery()
+        )
+        result = await db.execute(
+            select(WorkerMetric.worker_name, WorkerMetric.ts, WorkerMetric.cpu_percent, WorkerMetric.queue_depth)
+            .join(latest, (WorkerMetric.worker_name == latest.c.worker_name) & (WorkerMetric.ts == latest.c.ts))
+        )
+        self._metrics = {
+            worker_name: (ts.timestamp(), {"cpu_percent": cpu_percent, "queue_depth": queue_depth})
+            for worker_name, ts, cpu_percent, queue_depth in result.all()
+        }
+
+    def load(self, worker_name: str) -> Dict[str, Any]:
+        """节点最近的负载指标，没有或已过期时为空"""
+        seen, load = self._metrics.get(worker_name, (None, None))
+        latest = heartbeats.latest_load(worker_name)
+        heartbeat_seen = heartbeats.last_seen(worker_name)
+        if latest is not None and heartbeat_seen is not None and (seen is None or heartbeat_seen >= seen):
+            seen, load = heartbeat_seen, latest
+        if seen is None or time.time() - seen > settings.PLACEMENT_HEARTBEAT_STALE:
+            return {}
+        return load
+
+    def record_sign(self, worker_name: str, seconds: float, ok: bool) -> None:
+        """记录一次发往工作节点的签到请求"""
+        self._sign_stats[worker_name].record(seconds, ok, self.alpha)
+
+    def assigned(self, worker_name: str) -> int:
+        return self._assigned.get(worker_name, 0)
+
+    def capacity(self, worker: Worker) -> int:
+        value = (worker.capabilities or {}).get("max_users")
+        try:
+            return max(int(value), 1)
+        except (TypeError, ValueError):
+            return settings.PLACEMENT_DEFAULT_CAPACITY
+
+    def score(self, worker: Worker) -> float:
+        capacity = self.capacity(worker)
+        assigned = self.assigned(worker.name)
+        connections = ws_registry.counts().get(worker.name, 0)
+        stats = self._sign_stats.get(worker.name)
+
+        score = settings.PLACEMENT_WEIGHT_ASSIGNED * assigned / capacity
+        score += settings.PLACEMENT_WEIGHT_CONNECTIONS * connections / capacity
+        if stats is not None:
+            if stats.latency is not None:
+                score += settings.PLACEMENT_WEIGHT_LATENCY * min(stats.latency / settings.PLACEMENT_LATENCY_TARGET, 3.0)
+            score += settings.PLACEMENT_WEIGHT_ERRORS * stats.error_rate
+        load = self.load(worker.name)
+        if load.get("cpu_percent") is not None:
+            score += settings.PLACEMENT_WEIGHT_CPU * min(load["cpu_percent"] / 100, 1.0)
+        if load.get("queue_depth") is not None:
+            score += settings.PLACEMENT_WEIGHT_QUEUE * min(load["queue_depth"] / settings.PLACEMENT_QUEUE_TARGET, 3.0)
+        if self._heartbeat_age(worker) > settings.PLACEMENT_HEARTBEAT_STALE:
+            score += settings.PLACEMENT_STALE_PENALTY
+        return score
+
+    def _heartbeat_age(self, worker: Worker) -> float:
+        """距最近一次心跳的秒数，优先使用本进程收到的心跳"""
+        seen = heartbeats.last_seen(worker.name)
+        if seen is None and worker.last_heartbeat is not None:
+            seen = worker.last_heartbeat.timestamp()
+        if seen is None:
+            return math.inf
+        return time.time() - seen
+
+    def choose(self, workers: Sequence[Worker], exclude: Optional[str] = None) -> Optional[Worker]:
+        """选出评分最低的节点，优先选择未满的节点"""
+        candidates = [worker for worker in workers if worker.name != exclude]
+        if not candidates:
+            return None
+        not_full = [worker for worker in candidates if self.assigned(worker.name) < self.capacity(worker)]
+        if not not_full:
+            logger.warning("所有候选工作节点均已达到容量上限，选择负载最低的节点")
+        return min(not_full or candidates, key=self.score)
+
+    def assign(self, worker_name: str, source: Optional[str] = None) -> None:
+        """计入本进程的一次分配，下一次刷新前的选择即可看到"""
+        self._assigned[worker_name] = self._assigned.get(worker_name, 0) + 1
+        if source:
+            self._assigned[source] = max(self._assigned.get(source, 0) - 1, 0)
+
+    def snapshot(self, workers: Sequence[Worker]) -> List[Dict[str, Any]]:
+        counts = ws_registry.counts()
+        result = []
+        for worker in workers:
+            stats = self._sign_stats.get(worker.name)
+            age = self._heartbeat_age(worker)
+            result.append({
+                "name": worker.name,
+                "status": worker.status,
+                "capacity": self.capacity(worker),
+                "assigned": self.assigned(worker.name),
+                "connections": counts.get(worker.name, 0),
+                "sign_latency": round(stats.latency, 3) if stats and stats.latency is not None else None,
+                "sign_error_rate": round(stats.error_rate, 4) if stats else None,
+                "heartbeat_age": round(age, 1) if age != math.inf else None,
+                "load": self.load(worker.name) or None,
+                "score": round(self.score(worker), 4),
+            })
+        return sorted(result, key=lambda item: item["score"])
+
+
+placement = PlacementEngine(refresh_interval=settings.PLACEMENT_REFRESH_INTERVAL)
+
+
+async def rebalance(
+    db: AsyncSession,
+    http_client: AsyncHttpClient,
+    *,
+    dry_run: bool = False,
+    max_moves: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    把监控用户从过载节点迁移到负载较低的节点
+
+    节点的负载率为已分配用户数 / 容量，超过整体负载率 PLACEMENT_REBALANCE_TOLERANCE 以上的节点视为过载，
+    迁移到整体负载率为止。每个用户先在原节点断开，再更新分配并在新节点连接，
+    避免同一 IM 账号同时在两个节点上在线。
+
+    Args:
+        dry_run: 只计算迁移计划，不实际迁移
+        max_moves: 本次最多迁移的用户数，默认 PLACEMENT_REBALANCE_MAX_MOVES
+    """
+    max_moves = settings.PLACEMENT_REBALANCE_MAX_MOVES if max_moves is None else max_moves
+    await placement.refresh(db, force=True)
+    workers = (await db.execute(
+        select(Worker).where(Worker.status == WorkerStatus.ONLINE)
+    )).scalars().all()
+    before = placement.snapshot(workers)
+    if len(workers) < 2:
+        return {"dry_run": dry_run, "moves": [], "workers": before}
+
+    total_assigned = sum(placement.assigned(worker.name) for worker in workers)
+    total_capacity = sum(placement.capacity(worker) for worker in workers)
+    average = total_assigned / total_capacity
+
+    moves: List[Dict[str, Any]] = []
+    for worker in sorted(workers, key=lambda w: placement.assigned(w.name) / placement.capacity(w), reverse=True):
+        assigned = placement.assigned(worker.name)
+        capacity = placement.capacity(worker)
+        if assigned / capacity <= average + settings.PLACEMENT_REBALANCE_TOLERANCE:
+            break
+        excess = min(assigned - math.ceil(average * capacity), max_moves - len(moves))
+        if excess <= 0:
+            continue
+        users = (await db.execute(
+            select(User)
+            .where(User.worker_name == worker.name)
+            .where(User.is_active == True)
+            .where(User.monitor_status == True)
+            .order_by(User.id.desc())
+            .limit(excess)
+        )).scalars().all()
+        for user in users:
+            # 只迁移到负载率低于整体负载率的节点，避免把新节点也推成过载
+            under = [w for w in workers if placement.assigned(w.name) + 1 <= math.ceil(average * placement.capacity(w))]
+            target = placement.choose(under, exclude=worker.name)
+            if target is None:
+                break
+            move = {"user_id": user.id, "from": worker.name, "to": target.name}
+            if not dry_run:
+                move["connected"] = await _move_user(db, http_client, user, worker, target)
+            placement.assign(target.name, source=worker.name)
+            moves.append(move)
+        if len(moves) >= max_moves:
+            break
+
+    if dry_run:
+        # 计划只在本进程中模拟，恢复真实计数
+        await placement.refresh(db, force=True)
+    logger.info(f"工作节点负载均衡{'（演练）' if dry_run else ''}: 迁移 {len(moves)} 个用户")
+    return {"dry_run": dry_run, "moves": moves, "workers": before}
+
+
+async def _move_user(db: AsyncSession, http_client: AsyncHttpClient, user: User, source: Worker, target: Worker) -> bool:
+    """迁移单个用户，返回是否已在新节点连接成功"""
+    params = {"im_username": user.im_username, "im_password": user.im_password}
+    try:
+        await http_client.get(
+            get_worker_url(source, "ws/disconnect"),
+            params=params,
+            headers={"Authorization": f"Bearer {create_fleet_jwt(source.name)}"},
+            ignore_retries=True,
+            raise_for_status=False,
+        )
+    except Exception as e:
+        # 原节点断开失败时仍然迁移，多余的连接由定时核对断开
+        logger.warning(f"迁移 {user.im_username} 时断开 {source.name} 失败: {e}")
+
+    user.worker_name = target.name
+    await db.commit()
+    invalidate_user(user.id)
+
+    try:
+        response = await http_client.get(
+            get_worker_url(target, "ws/connect"),
+            params=params,
+            headers={"Authorization": f"Bearer {create_fleet_jwt(target.name)}"},
+            ignore_retries=True,
+            raise_for_status=False,
+        )
+    except Exception as e:
+        logger.warning(f"迁移 {user.im_username} 时连接 {target.name} 失败: {e}")
+        return False
+    return response.status_code == 200
@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from app.core.security import create_fleet_jwt
+from app.services.placement import placement
+from app.services.worker import get_worker_url
+from shared.core.config import settings
+from shared.db.session import async_session
+from shared.models.log import LogCategory, LogLevel
+from shared.models.sign_activity import SignActivity
+from shared.models.user import User
+from shared.models.worker import Worker
+from shared.schemas.sign_activity import BatchSignRequest, BatchSignUser
+from shared.schemas.sign_config import SignConfigSnapshot
+from shared.utils.http import AsyncHttpClient
+from shared.utils.http_body import parse_json
+from shared.utils.logger import DBLogger
+
+logger = logging.getLogger(__name__)
+
+# 同一工作节点、同一活动的签到请求合并为一批
+BatchKey = Tuple[str, str]
+
+
+class _PendingBatch:
+    """等待发送的一批签到请求"""
+
+    def __init__(self, worker: Worker, activity: SignActivity):
+        self.worker = worker
+        self.activity = activity
+        self.users: List[BatchSignUser] = []
+        self.user_ids: List[int] = []
+        self.futures: List[asyncio.Future] = []
+
+
+class SignCoalescer:
+    """
+    签到请求合并器
+
+    在短时间窗口内到达的、发往同一工作节点的同一活动的签到请求会被合并为一次
+    /fleet/signin/batch 请求，活动信息只发送一次。每个调用方仍然拿到自己的签到结果。
+    工作节点不支持批量接口时自动退回逐个调用 /fleet/signin。
+    一批请求属于多个用户，不经过调用方的 DBLogger，每批完成后按用户（带 user_id）记录签到请求结果。
+    """
+
+    def __init__(self, window: float = 0.05, max_batch: int = 100, worker_concurrency: int = 10):
+        self.window = window
+        self.max_batch = max_batch
+        self.worker_concurrency = worker_concurrency
+
+        self._pending: Dict[BatchKey, _PendingBatch] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        # 不支持批量接口的工作节点
+        self._no_batch_workers: Set[str] = set()
+        # 事件循环只保留任务的弱引用，发送中的批次任务需要在这里持有
+        self._tasks: Set[asyncio.Task] = set()
+        self.http_client = AsyncHttpClient()
+
+    def _semaphore(self, worker: Worker) -> asyncio.Semaphore:
+        """每个工作节点独立限制同时进行的签到请求数"""
+        semaphore = self._semaphores.get(worker.name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.worker_concurrency)
+            self._semaphores[worker.name] = semaphore
+        return semaphore
+
+    async def signin(
+        self,
+        *,
+        user: User,
+        activity: SignActivity,
+        config: SignConfigSnapshot,
+        key: str,
+        enc: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        提交单个用户的签到，返回工作节点给出的该用户签到结果
+
+        Raises:
+            httpx.HTTPError: 请求工作节点失败
+        """
+        worker = user.worker
+        batch_key = (worker.name, activity.activity_id)
+        batch = self._pending.get(batch_key)
+        if batch is None:
+            batch = _PendingBatch(worker, activity)
+            self._pending[batch_key] = batch
+            self._spawn(self._flush_later(batch_key, batch))
+
+        future = asyncio.get_running_loop().create_future()
+        batch.users.append(BatchSignUser(key=key, cookies=user.cookies, enc=enc, random_photo=config.use_random_photo))
+        batch.user_ids.append(user.id)
+        batch.futures.append(future)
+
+        if len(batch.users) >= self.max_batch:
+            self._take(batch_key, batch)
+            self._spawn(self._send(batch))
+        return await future
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"签到批次处理失败: {task.exception()}")
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """进程退出前立即发送等待合并的批次，等待发送中的批次完成，超时后取消"""
+        for batch_key, batch in list(self._pending.items()):
+            if self._take(batch_key, batch):
+                self._spawn(self._send(batch))
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"签到合并器关闭，{len(pending)} 个发送中的批次被取消")
+
+    def _take(self, batch_key: BatchKey, batch: _PendingBatch) -> bool:
+        """把批次从等待队列中取出，避免重复发送"""
+        if self._pending.get(batch_key) is batch:
+            del self._pending[batch_key]
+            return True
+        return False
+
+    async def _flush_later(self, batch_key: BatchKey, batch: _PendingBatch) -> None:
+        await asyncio.sleep(self.window)
+        if self._take(batch_key, batch):
+            await self._send(batch)
+
+    async def _send(self, batch: _PendingBatch) -> None:
+        start = time.monotonic()
+        try:
+            if batch.worker.name in self._no_batch_workers:
+                results = await self._send_each(batch)
+            else:
+                results = await self._send_batch(batch)
+        except Exception as e:
+            placement.record_sign(batch.worker.name, time.monotonic() - start, ok=False)
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            placement.record_sign(batch.worker.name, time.monotonic() - start, ok=len(results) == len(batch.users))
+            for user, future in zip(batch.users, batch.futures):
+                if future.done():
+                    continue
+                if user.key in results:
+                    future.set_result(results[user.key])
+                else:
+                    future.set_exception(RuntimeError(f"工作节点未返回 {user.key} 的签到结果"))
+        try:
+            await self._log_results(batch, time.monotonic() - start)
+        except Exception as e:
+            logger.error(f"记录签到请求日志失败: {e}")
+
+    async def _log_results(self, batch: _PendingBatch, elapsed: float) -> None:
+        """按用户记录一批签到请求的结果，签到失败可以按 user_id 追查"""
+        async with async_session() as db:
+            db_logger = DBLogger(db, source="app.services.sign_coalescer.SignCoalescer")
+            for user, user_id, future in zip(batch.users, batch.user_ids, batch.futures):
+                if future.cancelled():
+                    continue
+                error = future.exception()
+                response_data = None if error else future.result()
+                ok = error is None and response_data.get("result") == True
+                await db_logger.log(
+                    message=f"签到请求{'成功' if ok else '失败'}: {batch.worker.name}",
+                    level=LogLevel.INFO if ok else LogLevel.ERROR,
+                    category=LogCategory.API,
+                    user_id=user_id,
+                    worker_id=batch.worker.id,
+                    details={
+                        "worker_name": batch.worker.name,
+                        "activity_id": batch.activity.activity_id,
+                        "key": user.key,
+                        "batch_size": len(batch.users),
+                        "elapsed_seconds": elapsed,
+                        "error": f"{type(error).__name__}: {error}" if error else None,
+                        "response": response_data,
+                    },
+                )
+
+    async def _send_batch(self, batch: _PendingBatch) -> Dict[str, Dict[str, Any]]:
+        """一次请求提交整批签到"""
+        request = BatchSignRequest(
+            activity=batch.activity.model_dump(by_alias=False),
+            users=batch.users,
+        )
+        async with self._semaphore(batch.worker):
+            response = await self.http_client.post(
+                get_worker_url(batch.worker, "signin/batch"),
+                json=request,
+                headers={"Authorization": f"Bearer {create_fleet_jwt(batch.worker.name)}"},
+                ignore_retries=True,
+                raise_for_status=False,
+            )
+        if response.status_code in (404, 405):
+            # 旧版本工作节点没有批量接口，之后直接逐个提交
+            logger.warning(f"工作节点 {batch.worker.name} 不支持批量签到，改为逐个提交")
+            self._no_batch_workers.add(batch.worker.name)
+            return await self._send_each(batch)
+        response.raise_for_status()
+        logger.info(f"批量签到已提交到 {batch.worker.name}: {len(batch.users)} 个用户")
+        return parse_json(response).get("results", {})
+
+    async def _send_each(self, batch: _PendingBatch) -> Dict[str, Dict[str, Any]]:
+        """逐个用户调用 /fleet/signin，单个用户失败时只影响该用户"""
+        activity_data = batch.activity.model_dump(by_alias=False)
+        results: Dict[str, Dict[str, Any]] = {}
+
+        async def send_one(user: BatchSignUser, future: asyncio.Future) -> None:
+            async with self._semaphore(batch.worker):
+                try:
+                    response = await self.http_client.post(
+                        get_worker_url(batch.worker, "signin"),
+                        json={**activity_data, "cookies": user.cookies, "enc": user.enc, "random_photo": user.random_photo},
+                        headers={"Authorization": f"Bearer {create_fleet_jwt(batch.worker.name)}"},
+                    )
+                    results[user.key] = parse_json(response)
+                except httpx.HTTPError as e:
+                    if not future.done():
+                        future.set_exception(e)
+
+        await asyncio.gather(*(send_one(user, future) for user, future in zip(batch.users, batch.futures)))
+        return results
+
+
+sign_coalescer = SignCoalescer(
+    window=settings.SIGN_COALESCE_WINDOW,
+    max_batch=settings.SIGN_COALESCE_MAX_BATCH,
+    worker_concurrency=settings.BATCH_SIGN_WORKER_CONCURRENCY,
+)
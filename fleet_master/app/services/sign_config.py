@@ -1,11 +1,12 @@
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Optional, Sequence
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import update
 from sqlalchemy.future import select
+from app.services.config_cache import pick_snapshot, sign_config_cache
 from shared.models.sign_config import SignConfig
-from shared.schemas.sign_config import SignConfigCreate, SignConfigUpdate
+from shared.schemas.sign_config import SignConfigCreate, SignConfigSnapshot, SignConfigUpdate
 from shared.models.user import User
 
 async def clear_default_for_user(db: AsyncSession, user_id: int, exclude_uuid: Optional[str] = None):
@@ -24,6 +25,7 @@ async def clear_default_for_user(db: AsyncSession, user_id: int, exclude_uuid: O
     # 提交更新
     if configs:
         await db.commit()
+        sign_config_cache.invalidate(user_id)
     
     return len(configs)
 
@@ -46,6 +48,7 @@ async def update_sign_config(
         existing.updated_at = datetime.now(timezone.utc)
         await db.commit()
         await db.refresh(existing)
+        sign_config_cache.invalidate(user_id)
         return existing
     else:
         raise HTTPException(status_code=404, detail="签到配置不存在")
@@ -60,6 +63,7 @@ async def create_sign_config(
     db.add(sign_config_db)
     await db.commit()
     await db.refresh(sign_config_db)
+    sign_config_cache.invalidate(user_id)
     return sign_config_db
 
 
@@ -82,27 +86,19 @@ async def get_by_uuid(db: AsyncSession, uuid: str):
 
 
 
-async def get_config_for_sign(db: AsyncSession, user: User, class_id: Optional[str] = None) -> SignConfig:
-    if class_id:
-        result = await db.execute(
-            select(SignConfig)
-            .where(SignConfig.user_id == user.id, SignConfig.class_id == class_id)
-            .limit(1)
-        )
-        config = result.scalars().first()
-        if config:
-            return config
-    
-    result = await db.execute(
-        select(SignConfig)
-        .where(SignConfig.user_id == user.id, SignConfig.is_default == True)
-        .limit(1)
-    )
-    config = result.scalars().first()
-    if config:
-        return config
-    
-    return SignConfig(trigger_type="manual", use_random_photo=True)
+async def get_config_for_sign(db: AsyncSession, user: User, class_id: Optional[str] = None) -> SignConfigSnapshot:
+    """
+    获取本次签到使用的配置：优先班级配置，其次默认配置，最后使用手动签到配置
     
+    结果按 (user_id, class_id) 缓存，返回只读快照。
+    """
+    return await sign_config_cache.resolve(db, user.id, class_id)
+
+
+def pick_config_for_sign(configs: Sequence[SignConfig], class_id: Optional[str] = None) -> SignConfigSnapshot:
+    """
+    从用户已加载的全部签到配置中选出本次签到使用的配置
     
-    
\ No newline at end of file
+    规则与 get_config_for_sign 相同：优先班级配置，其次默认配置，最后使用手动签到配置。
+    """
+    return pick_snapshot(configs, class_id)
@@ -1,13 +1,87 @@
-from datetime import datetime, timezone
-from typing import List, Optional, Tuple, Dict, Any
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Set, Tuple, Dict, Any
 
+import httpx
 from fastapi import HTTPException, status
-from sqlalchemy import desc
+from sqlalchemy import desc, func, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.services.heartbeat import heartbeats
+from app.services.lookup_cache import invalidate_worker
+from shared.core.config import settings
+from shared.db.session import async_session
 from shared.models.worker import Worker, WorkerStatus
+from shared.models.worker_metric import WorkerMetric
 from shared.schemas.worker import WorkerCreate, WorkerUpdate, WorkerHeartbeat
+from shared.utils.circuit_breaker import CircuitState, circuit_breakers, origin_of
+from shared.utils.pubsub import CIRCUIT_CHANGED, CircuitChanged, pubsub
+
+logger = logging.getLogger(__name__)
+
+WORKER_DOMAIN = ".xiusmo.com"
+
+_pending: Set[asyncio.Task] = set()
+
+
+def get_worker_url(worker: Worker, path: str) -> str:
+    """获取工作节点 fleet 接口的完整地址"""
+    if settings.DEBUG:
+        return f"http://localhost:8001/api/v1/fleet/{path}"
+    return f"https://{worker.subdomain}{WORKER_DOMAIN}/api/v1/fleet/{path}"
+
+
+def get_worker_health_url(worker: Worker) -> str:
+    """工作节点健康检查地址，与 fleet 接口同一上游（同一个熔断器）"""
+    if settings.DEBUG:
+        return "http://localhost:8001/health"
+    return f"https://{worker.subdomain}{WORKER_DOMAIN}/health"
+
+
+def worker_origin(worker: Worker) -> str:
+    return origin_of(httpx.URL(get_worker_url(worker, "")))
+
+
+@circuit_breakers.add_listener
+def _on_worker_circuit_changed(origin: str, state: CircuitState) -> None:
+    host = httpx.URL(origin).host
+    if not host.endswith(WORKER_DOMAIN):
+        return
+    task = asyncio.get_running_loop().create_task(_set_circuit_status(host[: -len(WORKER_DOMAIN)], state))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+async def _set_circuit_status(subdomain: str, state: CircuitState) -> None:
+    """
+    工作节点熔断时标记为 ERROR，恢复后标记回 ONLINE，分配用户时不会选中熔断中的节点
+
+    心跳超时被标记为 OFFLINE 的节点不修改。ERROR 不会被 ONLINE 心跳覆盖，
+    没有签到请求触发半开探测时，由调度器的 probe_error_workers 主动探测恢复。
+    """
+    if state == CircuitState.OPEN:
+        condition, new_status = Worker.status != WorkerStatus.OFFLINE, WorkerStatus.ERROR
+    else:
+        condition, new_status = Worker.status == WorkerStatus.ERROR, WorkerStatus.ONLINE
+    try:
+        async with async_session() as db:
+            result = await db.execute(
+                update(Worker)
+                .where(Worker.subdomain == subdomain)
+                .where(condition)
+                .values(status=new_status, updated_at=func.now())
+                .returning(Worker.name)
+            )
+            names = list(result.scalars().all())
+            await db.commit()
+    except Exception as e:
+        logger.error(f"更新工作节点 {subdomain} 熔断状态失败: {e}")
+        return
+    for name in names:
+        invalidate_worker(name)
+        logger.warning(f"工作节点 {name} {'熔断' if state == CircuitState.OPEN else '恢复'}，状态标记为 {new_status.value}")
 
 
 async def create_worker(db: AsyncSession, worker_in: WorkerCreate) -> Worker:
@@ -68,6 +142,7 @@ async def update_worker(
     
     await db.commit()
     await db.refresh(worker)
+    invalidate_worker(worker.name)
     return worker
 
 
@@ -79,23 +154,78 @@ async def delete_worker(db: AsyncSession, worker_id: int) -> bool:
     
     await db.delete(worker)
     await db.commit()
+    invalidate_worker(worker.name)
     return True
 
 
 async def update_worker_heartbeat(
     db: AsyncSession, worker_id: int, heartbeat_in: WorkerHeartbeat
-) -> Optional[Worker]:
-    """更新工作节点心跳信息"""
-    worker = await get_worker(db, worker_id)
+) -> Optional[Dict[str, Any]]:
+    """更新工作节点心跳信息，只写入内存，由心跳缓冲批量写入数据库"""
+    worker = await heartbeats.get_worker(db, worker_id=worker_id)
     if not worker:
         return None
     
-    worker.status = heartbeat_in.status
-    worker.last_heartbeat = datetime.now(timezone.utc)
-    
+    # 熔断标记的 ERROR 由心跳缓冲写入时保留（ONLINE 心跳不覆盖），不按本进程的熔断状态判断
+    seen = heartbeats.record(worker.name, heartbeat_in.status, heartbeat_in.load)
+    return {**worker.model_dump(), "status": heartbeat_in.status, "last_heartbeat": seen}
+
+
+async def probe_error_workers(db: AsyncSession, timeout: float = 5.0) -> List[str]:
+    """
+    主动探测 ERROR 状态的工作节点，返回恢复的节点名称
+
+    熔断后没有新的签到请求时不会有半开探测，节点会一直停留在 ERROR。这里请求节点的 /health：
+    请求经过本进程的熔断器，熔断中时就是半开探测；成功时把节点标记回 ONLINE，
+    并通知所有进程关闭该节点的熔断。
+    """
+    from shared.utils.http import AsyncHttpClient
+
+    workers = (await db.execute(select(Worker).where(Worker.status == WorkerStatus.ERROR))).scalars().all()
+    if not workers:
+        return []
+    http_client = AsyncHttpClient(timeout=timeout)
+
+    async def healthy(worker: Worker) -> bool:
+        try:
+            response = await http_client.get(get_worker_health_url(worker), ignore_retries=True, raise_for_status=False)
+        except httpx.HTTPError as e:
+            logger.info(f"工作节点 {worker.name} 健康检查失败: {e}")
+            return False
+        return response.status_code == 200
+
+    results = await asyncio.gather(*(healthy(worker) for worker in workers))
+    recovered = [worker for worker, ok in zip(workers, results) if ok]
+    if not recovered:
+        return []
+    result = await db.execute(
+        update(Worker)
+        .where(Worker.id.in_([worker.id for worker in recovered]))
+        .where(Worker.status == WorkerStatus.ERROR)
+        .values(status=WorkerStatus.ONLINE, updated_at=func.now())
+        .returning(Worker.name)
+    )
+    names = list(result.scalars().all())
     await db.commit()
-    await db.refresh(worker)
-    return worker
+    for worker in recovered:
+        await pubsub.publish(CIRCUIT_CHANGED, CircuitChanged(origin=worker_origin(worker), state=CircuitState.CLOSED))
+    for name in names:
+        invalidate_worker(name)
+        logger.warning(f"工作节点 {name} 健康检查恢复，状态标记为 {WorkerStatus.ONLINE.value}")
+    return names
+
+
+async def get_worker_metrics(
+    db: AsyncSession, worker: Worker, hours: int = 24
+) -> List[WorkerMetric]:
+    """获取工作节点最近一段时间的负载指标"""
+    result = await db.execute(
+        select(WorkerMetric)
+        .where(WorkerMetric.worker_name == worker.name)
+        .where(WorkerMetric.ts >= datetime.now(timezone.utc) - timedelta(hours=hours))
+        .order_by(WorkerMetric.ts)
+    )
+    return result.scalars().all()
 
 
 async def verify_worker_availability(
@@ -172,7 +302,7 @@ async def find_available_worker(
     capabilities: Optional[Dict[str, Any]] = None
 ) -> Optional[Worker]:
     """
-    查找可用的工作节点
+    查找可用的工作节点，在满足能力要求的在线节点中选择负载评分最低的一个
     
     Args:
         db: 数据库会话
@@ -215,12 +345,11 @@ async def find_available_worker(
         # 使用所有在线工作节点
         workers_to_check = online_workers
     
-    # 检查每个工作节点的可用性
-    # TODO: 检查每个工作节点的可用性，以及worker的选择逻辑
-    for worker in workers_to_check:
-        # available, _ = await verify_worker_availability(db, worker.id)
-        # if available:
-        return worker
-    
-    # 没有找到可用的工作节点
-    return None
+    # 按负载评分选择节点：已分配用户数、连接数、签到耗时与错误率
+    from app.services.placement import placement
+
+    await placement.refresh(db)
+    worker = placement.choose(workers_to_check)
+    if worker is not None:
+        placement.assign(worker.name)
+    return worker
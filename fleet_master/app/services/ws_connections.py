@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Set
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.security import create_fleet_jwt
+from app.services.job_queue import job_handler, job_queue
+from app.services.worker import get_worker_url
+from shared.db.session import async_session
+from shared.models.user import User
+from shared.models.worker import Worker, WorkerStatus
+from shared.models.ws_connection import WsConnection
+from shared.utils.http import AsyncHttpClient
+
+logger = logging.getLogger(__name__)
+
+WS_CONNECT_JOB = "ws_connect"
+
+
+def connection_checksum(names: Iterable[str]) -> Dict[str, Any]:
+    """
+    连接集合的校验和，工作节点的 /fleet/ws/connections-checksum 需使用相同算法
+
+    每个 IM 用户名取 sha256 的前 8 字节，按位异或后以 16 位十六进制表示，与顺序无关，
+    增删一个连接只需再异或一次。
+    """
+    value = 0
+    count = 0
+    for name in names:
+        value ^= int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], "big")
+        count += 1
+    return {"count": count, "checksum": f"{value:016x}"}
+
+
+class ConnectionRegistry:
+    """
+    各工作节点的 WebSocket 连接集合
+
+    ws_connections 表是唯一的数据来源，工作节点推送的连接/断开增量直接写表；
+    每个进程在内存中保留一份副本，超过 refresh_interval 后从表中重新加载，
+    用于统计各节点连接数等高频读取。
+    """
+
+    def __init__(self, refresh_interval: float = 30.0):
+        self.refresh_interval = refresh_interval
+        self._sets: Dict[str, Set[str]] = {}
+        self._loaded_at = 0.0
+
+    async def load(self, db: AsyncSession, force: bool = False) -> None:
+        """从表中加载所有节点的连接"""
+        if not force and time.monotonic() - self._loaded_at < self.refresh_interval:
+            return
+        result = await db.execute(select(WsConnection.worker_name, WsConnection.im_username))
+        sets: Dict[str, Set[str]] = defaultdict(set)
+        for worker_name, im_username in result.all():
+            sets[worker_name].add(im_username)
+        self._sets = dict(sets)
+        self._loaded_at = time.monotonic()
+
+    def get(self, worker_name: str) -> Set[str]:
+        return set(self._sets.get(worker_name, ()))
+
+    def counts(self) -> Dict[str, int]:
+        return {worker_name: len(names) for worker_name, names in self._sets.items()}
+
+    def checksum(self, worker_name: str) -> Dict[str, Any]:
+        return connection_checksum(self._sets.get(worker_name, ()))
+
+    async def apply(self, db: AsyncSession, worker_name: str, connected: List[str], disconnected: List[str]) -> None:
+        """
+        写入一个节点上报的连接/断开增量，同一用户同时出现在两边时以连接为准
+
+        连接用 upsert 写入：同一节点的并发上报或与 replace 同时写入同一用户时不会违反唯一约束。
+        """
+        removed = set(disconnected) - set(connected)
+        if not connected and not removed:
+            return
+        if removed:
+            await db.execute(
+                delete(WsConnection)
+                .where(WsConnection.worker_name == worker_name)
+                .where(WsConnection.im_username.in_(removed))
+            )
+        if connected:
+            now = datetime.now(timezone.utc)
+            statement = insert(WsConnection).values([
+                {"worker_name": worker_name, "im_username": name, "connected_at": now}
+                for name in set(connected)
+            ])
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=[WsConnection.worker_name, WsConnection.im_username],
+                set_={"connected_at": statement.excluded.connected_at},
+            ))
+        await db.commit()
+
+        names = self._sets.setdefault(worker_name, set())
+        names.difference_update(disconnected)
+        names.update(connected)
+
+    async def replace(self, db: AsyncSession, worker_name: str, names: Set[str]) -> None:
+        """用节点返回的完整连接列表覆盖该节点的记录"""
+        current = set((await db.execute(
+            select(WsConnection.im_username).where(WsConnection.worker_name == worker_name)
+        )).scalars().all())
+        added, removed = names - current, current - names
+        if removed:
+            await db.execute(
+                delete(WsConnection)
+                .where(WsConnection.worker_name == worker_name)
+                .where(WsConnection.im_username.in_(removed))
+            )
+        if added:
+            # 读取后节点可能又上报了同一用户的连接，已存在的记录保留原来的连接时间
+            # 多行 VALUES 受参数个数限制，分批写入
+            now = datetime.now(timezone.utc)
+            added_list = sorted(added)
+            for start in range(0, len(added_list), 1000):
+                await db.execute(insert(WsConnection).values([
+                    {"worker_name": worker_name, "im_username": name, "connected_at": now}
+                    for name in added_list[start:start + 1000]
+                ]).on_conflict_do_nothing(index_elements=[WsConnection.worker_name, WsConnection.im_username]))
+        await db.commit()
+        self._sets[worker_name] = set(names)
+
+
+ws_registry = ConnectionRegistry()
+
+
+async def handle_ws_report(db: AsyncSession, worker_name: str, connected: List[str], disconnected: List[str]) -> int:
+    """
+    处理工作节点上报的连接增量
+
+    断开的用户如果仍需监控且仍分配在该节点，立即写入重连任务，由任务队列负责重试。
+
+    Returns:
+        int: 写入的重连任务数
+    """
+    await ws_registry.apply(db, worker_name, connected, disconnected)
+    lost = set(disconnected) - set(connected)
+    if not lost:
+        return 0
+
+    result = await db.execute(
+        select(User.id)
+        .where(User.im_username.in_(lost))
+        .where(User.worker_name == worker_name)
+        .where(User.is_active == True)
+        .where(User.monitor_status == True)
+    )
+    user_ids = result.scalars().all()
+    for user_id in user_ids:
+        await job_queue.enqueue(db, WS_CONNECT_JOB, {"user_id": user_id, "worker_name": worker_name}, worker_name=worker_name)
+    return len(user_ids)
+
+
+@job_handler(WS_CONNECT_JOB)
+async def run_ws_connect_job(payload: dict):
+    """重连任务，payload: {"user_id": ..., "worker_name": ...}"""
+    async with async_session() as db:
+        user = (await db.execute(select(User).where(User.id == payload["user_id"]))).scalars().first()
+        # 已关闭监控或已迁移到其他节点，无需重连
+        if not user or not user.is_active or not user.monitor_status or user.worker_name != payload["worker_name"]:
+            return
+        # 等待重试期间节点可能已自行重连并上报
+        connected = (await db.execute(
+            select(WsConnection.id)
+            .where(WsConnection.worker_name == user.worker_name)
+            .where(WsConnection.im_username == user.im_username)
+        )).first()
+        if connected:
+            return
+        worker = (await db.execute(select(Worker).where(Worker.name == user.worker_name))).scalars().first()
+    if not worker or worker.status != WorkerStatus.ONLINE:
+        # 节点离线，由定时核对处理
+        return
+
+    response = await AsyncHttpClient().get(
+        get_worker_url(worker, "ws/connect"),
+        params={"im_username": user.im_username, "im_password": user.im_password},
+        headers={"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"},
+        ignore_retries=True,
+    )
+    logger.info(f"已重连 {worker.name} 上的 {user.im_username}: HTTP {response.status_code}")
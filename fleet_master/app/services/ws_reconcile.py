@@ -0,0 +1,318 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.security import create_fleet_jwt
+from app.services.worker import get_worker_url
+from app.services.ws_connections import ws_registry
+from shared.core.config import settings
+from shared.models.log import LogCategory, LogLevel
+from shared.models.user import User
+from shared.models.worker import Worker, WorkerStatus
+from shared.utils.http import AsyncHttpClient
+from shared.utils.http_body import parse_json
+from shared.utils.logger import DBLogger
+
+logger = logging.getLogger(__name__)
+
+# (IM 用户名, IM 密码)，数据库中不存在的连接没有密码
+Account = Tuple[str, Optional[str]]
+
+
+class ReconcileResult:
+    """一轮 WebSocket 连接核对的结果和统计"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.duration: float = 0.0
+        self.workers_queried = 0
+        self.checksum_matched = 0  # 校验和一致、直接使用表中连接的节点数
+        self.full_fetches = 0  # 拉取完整连接列表的节点数
+        self.workers_failed: Dict[str, str] = {}
+        self.desired = 0
+        self.connected = 0
+        self.missing = 0
+        self.extra = 0
+        self.unknown = 0  # 所在节点未响应，本轮无法确认状态的用户
+        self.reconnect_attempted = 0
+        self.reconnect_succeeded = 0
+        self.closed = 0
+        self.orphaned = 0  # 节点上存在、数据库中没有对应用户的连接
+        self.worker_durations: Dict[str, float] = {}
+
+    @property
+    def reconnect_success_rate(self) -> Optional[float]:
+        if not self.reconnect_attempted:
+            return None
+        return round(self.reconnect_succeeded / self.reconnect_attempted, 4)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "started_at": self.started_at,
+            "duration_seconds": round(self.duration, 3),
+            "workers_queried": self.workers_queried,
+            "checksum_matched": self.checksum_matched,
+            "full_fetches": self.full_fetches,
+            "workers_failed": self.workers_failed,
+            "desired": self.desired,
+            "connected": self.connected,
+            "missing": self.missing,
+            "extra": self.extra,
+            "unknown": self.unknown,
+            "reconnect_attempted": self.reconnect_attempted,
+            "reconnect_succeeded": self.reconnect_succeeded,
+            "reconnect_success_rate": self.reconnect_success_rate,
+            "closed": self.closed,
+            "orphaned": self.orphaned,
+            "worker_durations": {name: round(value, 3) for name, value in self.worker_durations.items()},
+        }
+
+
+async def fetch_worker_connections(worker: Worker, http_client: AsyncHttpClient, timeout: float) -> Set[str]:
+    """获取单个工作节点当前的 WebSocket 连接（IM 用户名集合），超时或失败时抛出异常"""
+    response = await asyncio.wait_for(
+        http_client.get(
+            get_worker_url(worker, "ws/get-all-connections"),
+            headers={"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"},
+            timeout=timeout,
+            ignore_retries=True,
+        ),
+        timeout,
+    )
+    return set(parse_json(response))
+
+
+async def fetch_worker_checksum(worker: Worker, http_client: AsyncHttpClient, timeout: float) -> Optional[Dict[str, Any]]:
+    """获取工作节点连接集合的校验和，节点不支持时返回 None"""
+    response = await asyncio.wait_for(
+        http_client.get(
+            get_worker_url(worker, "ws/connections-checksum"),
+            headers={"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"},
+            timeout=timeout,
+            ignore_retries=True,
+            raise_for_status=False,
+        ),
+        timeout,
+    )
+    if response.status_code in (404, 405):
+        return None
+    response.raise_for_status()
+    return parse_json(response)
+
+
+async def _call_ws(
+    worker: Worker,
+    action: str,
+    accounts: List[Account],
+    http_client: AsyncHttpClient,
+    concurrency: int,
+    timeout: float,
+) -> int:
+    """
+    对同一节点的一组账号调用 ws/connect 或 ws/disconnect，限制并发，返回成功数量
+
+    同一节点的请求共享一个 JWT 和连接池。没有密码的账号只携带用户名。
+    """
+    if not accounts:
+        return 0
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"}
+    url = get_worker_url(worker, f"ws/{action}")
+
+    async def call_one(im_username: str, im_password: Optional[str]) -> bool:
+        params = {"im_username": im_username}
+        if im_password is not None:
+            params["im_password"] = im_password
+        async with semaphore:
+            try:
+                response = await asyncio.wait_for(
+                    http_client.get(
+                        url,
+                        params=params,
+                        headers=headers,
+                        timeout=timeout,
+                        ignore_retries=True,
+                        raise_for_status=False,
+                    ),
+                    timeout,
+                )
+            except Exception as e:
+                logger.warning(f"{worker.name} ws/{action} {im_username} 失败: {e}")
+                return False
+            if response.status_code != 200:
+                logger.warning(f"{worker.name} ws/{action} {im_username} 失败: HTTP {response.status_code}")
+                return False
+            return True
+
+    results = await asyncio.gather(*(call_one(*account) for account in accounts))
+    return sum(results)
+
+
+async def reconcile_ws_connections(
+    *,
+    db: AsyncSession,
+    http_client: AsyncHttpClient,
+    db_logger: DBLogger,
+    use_checksum: bool = False,
+) -> ReconcileResult:
+    """
+    核对所有工作节点的 WebSocket 连接与需要监控的用户
+
+    1. 并发查询所有在线节点的连接列表，每个节点单独超时，慢节点不拖慢整轮核对。
+       use_checksum 为 True 时先比较节点与 ws_connections 表的校验和，一致则直接使用表中的连接，
+       不一致或节点不支持时才拉取完整列表；拉取到的完整列表会覆盖表中该节点的记录
+    2. 以集合求差：应连未连的用户重新连接，节点上多余的连接（用户已关闭监控或已分配到其他节点）断开
+    3. 按节点分组，限制每个节点的并发请求数
+    未响应节点上的用户本轮不处理，避免误重连。用户列表在本轮开始时读取，操作前重新读取相关用户的
+    当前分配，期间开启监控或被迁移（placement._move_user）的用户不会被误断开或连到旧节点。
+    """
+    result = ReconcileResult()
+    start = time.monotonic()
+    timeout = settings.WS_RECONCILE_WORKER_TIMEOUT
+    concurrency = settings.WS_RECONCILE_CONCURRENCY
+
+    workers = (await db.execute(
+        select(Worker).where(Worker.status == WorkerStatus.ONLINE)
+    )).scalars().all()
+    users = (await db.execute(
+        select(User)
+        .where(User.is_active == True)
+        .where(User.monitor_status == True)
+        .where(User.im_username.is_not(None))
+        .where(User.worker_name.is_not(None))
+    )).scalars().all()
+
+    users_by_im = {user.im_username: user for user in users}
+    # 每个节点应该保持的连接
+    desired: Dict[str, Set[str]] = defaultdict(set)
+    for user in users:
+        desired[user.worker_name].add(user.im_username)
+    result.desired = sum(len(names) for names in desired.values())
+
+    # 步骤1: 并发获取各节点的连接
+    if use_checksum:
+        await ws_registry.load(db, force=True)
+    fetched: Dict[str, Set[str]] = {}
+
+    async def fetch(worker: Worker):
+        worker_start = time.monotonic()
+        try:
+            if use_checksum:
+                checksum = await fetch_worker_checksum(worker, http_client, timeout)
+                if checksum == ws_registry.checksum(worker.name):
+                    result.checksum_matched += 1
+                    return ws_registry.get(worker.name)
+            names = await fetch_worker_connections(worker, http_client, timeout)
+            result.full_fetches += 1
+            fetched[worker.name] = names
+            return names
+        finally:
+            result.worker_durations[worker.name] = time.monotonic() - worker_start
+
+    result.workers_queried = len(workers)
+    responses = await asyncio.gather(*(fetch(worker) for worker in workers), return_exceptions=True)
+    actual: Dict[str, Set[str]] = {}
+    for worker, response in zip(workers, responses):
+        if isinstance(response, BaseException):
+            result.workers_failed[worker.name] = f"{type(response).__name__}: {response}"
+        else:
+            actual[worker.name] = response
+    # 完整列表是最准确的状态，同步到表中
+    for worker_name, names in fetched.items():
+        await ws_registry.replace(db, worker_name, names)
+
+    # 步骤2: 集合求差
+    to_connect: Dict[str, List[User]] = {}
+    extra_by_worker: Dict[str, Set[str]] = {}
+    for worker in workers:
+        if worker.name not in actual:
+            result.unknown += len(desired.get(worker.name, ()))
+            continue
+        want = desired.get(worker.name, set())
+        have = actual[worker.name]
+        missing = want - have
+        extra = have - want
+        result.connected += len(want & have)
+        result.missing += len(missing)
+        result.extra += len(extra)
+        to_connect[worker.name] = [users_by_im[name] for name in missing]
+        if settings.WS_RECONCILE_CLOSE_EXTRA:
+            extra_by_worker[worker.name] = extra
+    # 重新读取相关用户的当前状态：多余连接对应的用户需要 IM 密码才能断开，
+    # 查询连接列表期间分配可能已经变化
+    to_close: Dict[str, List[Account]] = {}
+    extra_names = set().union(*extra_by_worker.values())
+    recheck = extra_names.union(*({user.im_username for user in pending} for pending in to_connect.values()))
+    current: Dict[str, User] = {}
+    if recheck:
+        current = {
+            user.im_username: user
+            for user in (await db.execute(
+                select(User)
+                .where(User.im_username.in_(recheck))
+                .execution_options(populate_existing=True)
+            )).scalars().all()
+        }
+
+    def assigned_to(user: Optional[User], worker_name: str) -> bool:
+        return (
+            user is not None
+            and user.is_active
+            and user.monitor_status
+            and user.worker_name == worker_name
+        )
+
+    for worker_name, names in extra_by_worker.items():
+        to_close[worker_name] = []
+        for name in names:
+            user = current.get(name)
+            if user is None:
+                # 数据库中不存在的 IM 用户名也需要断开，只携带用户名
+                result.orphaned += 1
+                to_close[worker_name].append((name, None))
+            elif not assigned_to(user, worker_name):
+                to_close[worker_name].append((user.im_username, user.im_password))
+    to_open: Dict[str, List[Account]] = {
+        worker_name: [
+            (user.im_username, user.im_password)
+            for user in pending
+            if assigned_to(current.get(user.im_username), worker_name)
+        ]
+        for worker_name, pending in to_connect.items()
+    }
+    # 分配到不在线节点的用户同样无法确认
+    online = {worker.name for worker in workers}
+    result.unknown += sum(len(names) for name, names in desired.items() if name not in online)
+
+    # 步骤3: 按节点并发断开 / 重连
+    # 先断开所有节点的多余连接再重连，用户从一个节点迁移到另一个节点时不会同时在线
+    workers_by_name = {worker.name: worker for worker in workers}
+    closed = await asyncio.gather(*(
+        _call_ws(workers_by_name[name], "disconnect", accounts, http_client, concurrency, timeout)
+        for name, accounts in to_close.items()
+    ))
+    connected = await asyncio.gather(*(
+        _call_ws(workers_by_name[name], "connect", accounts, http_client, concurrency, timeout)
+        for name, accounts in to_open.items()
+    ))
+    result.closed = sum(closed)
+    result.reconnect_attempted = sum(len(accounts) for accounts in to_open.values())
+    result.reconnect_succeeded = sum(connected)
+
+    result.duration = time.monotonic() - start
+    await db_logger.log(
+        message=(
+            f"WebSocket连接核对完成: 应连接 {result.desired}，缺失 {result.missing}，多余 {result.extra}，"
+            f"重连成功 {result.reconnect_succeeded}/{result.reconnect_attempted}，耗时 {result.duration:.2f}s"
+        ),
+        level=LogLevel.WARNING if result.workers_failed else LogLevel.INFO,
+        category=LogCategory.SCHEDULER,
+        details=result.to_dict(),
+        source="app.services.ws_reconcile.reconcile_ws_connections"
+    )
+    return result
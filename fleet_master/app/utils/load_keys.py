@@ -1,11 +1,18 @@
 from pathlib import Path
 import logging
 import os
+from typing import Dict, Tuple
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.hazmat.primitives import serialization
+from jose import jwk
+from jose.backends.base import Key
+
+from shared.utils.pubsub import NODE_KEY_CHANGED, NodeKeyChanged, pubsub
 
 logger = logging.getLogger(__name__)
 
+ALGORITHM = "RS256"
+
 def load_private_key(path: str) -> str:
     key_path = Path(path)
     if not key_path.exists():
@@ -88,8 +95,66 @@ def save_node_public_key(node_name: str, public_key: str, base_path="config/publ
         key_path = key_dir / f"{node_name}.pem"
         key_path.write_text(public_key)
         
+        # 使缓存的旧公钥失效
+        key_manager.invalidate(str(key_path))
+        
         logger.info(f"已保存节点 {node_name} 的公钥到 {key_path}")
         return True
     except Exception as e:
         logger.error(f"保存节点 {node_name} 公钥失败: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+class KeyManager:
+    """
+    已解析密钥的内存缓存
+    
+    每个 PEM 文件只解析一次，之后按文件修改时间判断是否需要重新加载，
+    避免每次签发/校验 fleet JWT 都读取磁盘并解析密钥。
+    """
+    
+    def __init__(self, algorithm: str = ALGORITHM):
+        self.algorithm = algorithm
+        self._keys: Dict[str, Tuple[int, Key]] = {}
+    
+    def _load(self, path: str) -> Key:
+        """按路径获取密钥对象，文件修改时间变化时重新加载"""
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._keys.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        key = jwk.construct(Path(path).read_text(), self.algorithm)
+        self._keys[path] = (mtime, key)
+        logger.info(f"已加载密钥 {path}")
+        return key
+    
+    def get_private_key(self, path: str) -> Key:
+        """获取私钥对象，私钥不存在时自动生成密钥对"""
+        if not Path(path).exists():
+            load_private_key(path)
+        return self._load(path)
+    
+    def get_public_key(self, node_name: str, base_path="config/public_keys") -> Key:
+        """获取节点公钥对象，公钥不存在时抛出 FileNotFoundError"""
+        key_path = Path(base_path) / f"{node_name}.pem"
+        try:
+            return self._load(str(key_path))
+        except FileNotFoundError:
+            self.invalidate(str(key_path))
+            logger.warning(f"节点 {node_name} 的公钥不存在，路径: {key_path}")
+            raise FileNotFoundError(f"找不到公钥: {key_path}")
+    
+    def invalidate(self, path: str = None) -> None:
+        """使指定路径（或全部）的缓存失效"""
+        if path is None:
+            self._keys.clear()
+        else:
+            self._keys.pop(path, None)
+
+
+key_manager = KeyManager()
+
+
+@pubsub.subscribe(NODE_KEY_CHANGED)
+def _on_node_key_changed(payload: NodeKeyChanged) -> None:
+    key_manager.invalidate(str(Path("config/public_keys") / f"{payload.node_name}.pem"))
@@ -1,11 +1,41 @@
+from typing import Any, Dict, Tuple
+from urllib.parse import quote
+
+from shared.core.config import settings
 from shared.utils.http import AsyncHttpClient
 from shared.utils.logger import DBLogger
 from shared.models.log import LogCategory
 
+NTFY_PRIORITIES = {
+    "error": "urgent",
+    "warning": "high",
+    "info": "default",
+    "debug": "low",
+}
+
+
+def bark_url(key: str, title: str, message: str) -> str:
+    """Bark 推送地址，标题和内容放在路径中，需要转义其中的 /"""
+    return f"{settings.BARK_SERVER}/{quote(key, safe='')}/{quote(title, safe='')}/{quote(message, safe='')}"
+
+
+def ntfy_request(key: str, title: str, message: str, priority: str = "info") -> Tuple[str, Dict[str, Any], bytes]:
+    """ntfy 推送的地址、请求头和请求体"""
+    headers = {
+        "Title": title.encode('utf-8'),
+        "Priority": NTFY_PRIORITIES[priority],
+        "Tags": "tags",
+        "Content-Type": "text/plain; charset=utf-8",
+        # "Actions": "test",
+        # "Icon": "https://ntfy.sh/icons/ntfy.png",
+    }
+    return f"{settings.NTFY_SERVER}/{quote(key, safe='')}", headers, message.encode('utf-8')
+
+
 async def push_to_bark(*, title, message, key, logger: DBLogger, http_client: AsyncHttpClient):
-    url = f"https://api.day.app/{key}/{title}/{message}"
+    url = bark_url(key, title, message)
     try:
-        response = await http_client.get(url)
+        response = await http_client.get(url, raise_for_status=False)
         await logger.info(f"推送Bark通知: key={key}, 状态码={response.status_code}, 内容={title}/{message}", category=LogCategory.PUSH)
         if response.status_code == 200:
             return True
@@ -18,24 +48,10 @@ async def push_to_bark(*, title, message, key, logger: DBLogger, http_client: As
 
 
 async def push_to_ntfy(*, title, message, key, priority="info", logger: DBLogger, http_client: AsyncHttpClient):
-    enum_priority = {
-        "error": "urgent",
-        "warning": "high",
-        "info": "default",
-        "debug": "low",
-    }
-    headers = {
-        "Title": title.encode('utf-8'),
-        "Priority": enum_priority[priority],
-        "Tags": "tags",
-        "Content-Type": "text/plain; charset=utf-8",
-        # "Actions": "test",
-        # "Icon": "https://ntfy.sh/icons/ntfy.png",
-    }
-    url = f"https://ntfy.sh/{key}"
-    
+    url, headers, body = ntfy_request(key, title, message, priority)
+
     try:
-        response = await http_client.post(url, data=message.encode('utf-8'), headers=headers)
+        response = await http_client.post(url, content=body, headers=headers, raise_for_status=False)
         await logger.info(f"推送Ntfy通知: key={key}, 状态码={response.status_code}, 内容={title}/{message}", category=LogCategory.PUSH)
         if response.status_code == 200:
             return True
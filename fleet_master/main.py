@@ -2,13 +2,16 @@ import asyncio
 from contextlib import asynccontextmanager
 import logging
 import os
-from fastapi import FastAPI
+import secrets
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.api.v1 import api_router
 from shared.core.config import settings
 from app.core.events import startup_event, shutdown_event
 from app.middleware.fleet_jwt_auth import JWTAuthMiddleware
+from shared.utils.http_metrics import http_metrics
 
 logging.basicConfig(
     level=logging.DEBUG if settings.DEBUG else logging.INFO,
@@ -18,6 +21,13 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup_event()
+    yield
+    await shutdown_event()
+
+
 def create_application() -> FastAPI:
     """构建并返回 FastAPI 实例。"""
     app = FastAPI(
@@ -27,6 +37,7 @@ def create_application() -> FastAPI:
         debug=settings.DEBUG,
         docs_url="/docs" if settings.DEBUG else None,
         redoc_url="/redoc" if settings.DEBUG else None,
+        lifespan=lifespan,
     )
 
     # ---------------- CORS ----------------
@@ -37,6 +48,7 @@ def create_application() -> FastAPI:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=["X-Total-Count", "X-Next-Cursor"],
         )
     else:
         app.add_middleware(
@@ -45,6 +57,7 @@ def create_application() -> FastAPI:
             allow_credentials=True,
             allow_methods=["GET", "POST", "PUT", "DELETE"],
             allow_headers=["Authorization", "Content-Type"],
+            expose_headers=["X-Total-Count", "X-Next-Cursor"],
         )
 
     # ---------------- 业务中间件 & 路由 ----------------
@@ -54,12 +67,6 @@ def create_application() -> FastAPI:
 
     return app
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    await startup_event()
-    yield
-    await shutdown_event()
-
 # 供 gunicorn 调用的顶级变量
 app = create_application()
 
@@ -74,6 +81,14 @@ async def health():
     return {"status": "healthy", "version": "0.1.0"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(authorization: str = Header(None)):
+    """Prometheus 指标（所有进程汇总的上游 HTTP 请求统计），配置 METRICS_TOKEN 时需要 Bearer Token"""
+    if settings.METRICS_TOKEN and not secrets.compare_digest(authorization or "", f"Bearer {settings.METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(await http_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 
 if __name__ == "__main__":
     import uvicorn
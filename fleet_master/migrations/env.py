@@ -15,6 +15,9 @@ from shared.models.announcement import Announcement
 from shared.models.sign_activity import SignActivity
 from shared.models.sign_config import SignConfig
 from shared.models.user_activity_detection import UserActivityDetection
+from shared.models.sign_job import SignJob
+from shared.models.ws_connection import WsConnection
+from shared.models.worker_metric import WorkerMetric
 
 # 使用应用程序的配置来覆盖alembic.ini中的设置
 from shared.core.config import settings
@@ -0,0 +1,95 @@
+"""partition logs by created_at
+
+Revision ID: a4d9e2f7b5c3
+Revises: f2b6d8a4c1e7
+Create Date: 2026-10-18 22:00:00.000000
+
+把 logs 转为按 created_at 范围分区的表（按天，UTC）。迁移期间锁住 logs，
+复制全部日志：最近 30 天的日志进入按天分区，更早的进入默认分区，
+由 clean_logs 任务按 LOG_RETENTION_DAYS 删除或移入之后创建的分区，迁移本身不删除日志。
+之后的分区由调度器的 clean_logs 任务预先创建和删除。
+"""
+from datetime import datetime, time, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d9e2f7b5c3'
+down_revision: Union[str, None] = 'f2b6d8a4c1e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 迁移时预先创建的历史分区天数，更早的日志进入默认分区
+BACKFILL_DAYS = 30
+PREMAKE_DAYS = 7
+
+# 与 shared.models.log.LOG_SEARCH_DOCUMENT 一致
+LOG_SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple'::regconfig, coalesce(message, '')), 'A') "
+    "|| setweight(to_tsvector('simple'::regconfig, coalesce(source, '')), 'B') "
+    "|| setweight(to_tsvector('simple'::regconfig, coalesce(details ->> 'error', '') || ' ' || coalesce(details ->> 'im_username', '') || ' ' || coalesce(details ->> 'activity_id', '') || ' ' || coalesce(details ->> 'worker_name', '')), 'C')"
+)
+
+
+def create_indexes() -> None:
+    op.create_index('ix_logs_user_id', 'logs', ['user_id'], unique=False)
+    op.create_index('ix_logs_task_id', 'logs', ['task_id'], unique=False)
+    op.create_index('ix_logs_worker_id', 'logs', ['worker_id'], unique=False)
+    op.create_index('ix_logs_created_at_brin', 'logs', ['created_at'], unique=False, postgresql_using='brin')
+    op.create_index('ix_logs_created_at_id', 'logs', ['created_at', 'id'], unique=False)
+    op.create_index('ix_logs_message_trgm', 'logs', ['message'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'message': 'gin_trgm_ops'})
+    op.create_index('ix_logs_source_trgm', 'logs', ['source'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'source': 'gin_trgm_ops'})
+    op.create_index('ix_logs_search', 'logs', [sa.text(f"({LOG_SEARCH_DOCUMENT})")], unique=False,
+                    postgresql_using='gin')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("LOCK TABLE logs IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER TABLE logs RENAME TO logs_legacy")
+    op.execute("ALTER TABLE logs_legacy RENAME CONSTRAINT logs_pkey TO logs_legacy_pkey")
+    # 序列随旧表删除，先解除归属
+    op.execute("ALTER SEQUENCE logs_id_seq OWNED BY NONE")
+    op.execute(
+        "CREATE TABLE logs (LIKE logs_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    op.execute("ALTER TABLE logs ADD CONSTRAINT logs_pkey PRIMARY KEY (id, created_at)")
+    op.execute("CREATE TABLE logs_default PARTITION OF logs DEFAULT")
+
+    today = datetime.now(timezone.utc).date()
+    for offset in range(-BACKFILL_DAYS, PREMAKE_DAYS + 1):
+        day = today + timedelta(days=offset)
+        lower = datetime.combine(day, time.min, tzinfo=timezone.utc)
+        upper = lower + timedelta(days=1)
+        op.execute(
+            f"CREATE TABLE logs_p{day:%Y%m%d} PARTITION OF logs "
+            f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+        )
+
+    op.execute("INSERT INTO logs SELECT * FROM logs_legacy")
+    op.execute("DROP TABLE logs_legacy")
+    op.execute("ALTER SEQUENCE logs_id_seq OWNED BY logs.id")
+
+    # 在父表上建索引，自动在每个分区上创建
+    create_indexes()
+    op.execute("ANALYZE logs")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("LOCK TABLE logs IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER TABLE logs RENAME TO logs_partitioned")
+    op.execute("ALTER SEQUENCE logs_id_seq OWNED BY NONE")
+    op.execute("CREATE TABLE logs (LIKE logs_partitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    op.execute("ALTER TABLE logs ADD CONSTRAINT logs_pkey_plain PRIMARY KEY (id)")
+    op.execute("INSERT INTO logs SELECT * FROM logs_partitioned")
+    op.execute("DROP TABLE logs_partitioned CASCADE")
+    op.execute("ALTER SEQUENCE logs_id_seq OWNED BY logs.id")
+    op.execute("ALTER TABLE logs RENAME CONSTRAINT logs_pkey_plain TO logs_pkey")
+    create_indexes()
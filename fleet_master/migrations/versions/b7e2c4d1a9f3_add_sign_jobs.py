@@ -0,0 +1,55 @@
+"""add sign_jobs
+
+Revision ID: b7e2c4d1a9f3
+Revises: 45960ae8201c
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2c4d1a9f3'
+down_revision: Union[str, None] = '45960ae8201c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('sign_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=True),
+    sa.Column('worker_name', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('status', sa.Enum('PENDING', 'RUNNING', 'SUCCEEDED', 'DEAD', name='jobstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('run_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('locked_by', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('locked_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('started_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('finished_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_sign_jobs_kind'), 'sign_jobs', ['kind'], unique=False)
+    op.create_index(op.f('ix_sign_jobs_status'), 'sign_jobs', ['status'], unique=False)
+    op.create_index(op.f('ix_sign_jobs_worker_name'), 'sign_jobs', ['worker_name'], unique=False)
+    op.create_index('ix_sign_jobs_pending_run_at', 'sign_jobs', ['run_at'], unique=False, postgresql_where=sa.text("status = 'PENDING'"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_sign_jobs_pending_run_at', table_name='sign_jobs')
+    op.drop_index(op.f('ix_sign_jobs_worker_name'), table_name='sign_jobs')
+    op.drop_index(op.f('ix_sign_jobs_status'), table_name='sign_jobs')
+    op.drop_index(op.f('ix_sign_jobs_kind'), table_name='sign_jobs')
+    op.drop_table('sign_jobs')
+    sa.Enum(name='jobstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,52 @@
+"""add hot lookup indexes
+
+Revision ID: c3a8f5e2b6d1
+Revises: b7e2c4d1a9f3
+Create Date: 2026-10-18 18:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3a8f5e2b6d1'
+down_revision: Union[str, None] = 'b7e2c4d1a9f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY 不能在事务中执行，建索引期间不阻塞日志写入和签到
+    with op.get_context().autocommit_block():
+        # check_activity_exist / report_ws_error 按 IM 用户名查用户
+        op.create_index('ix_users_im_username', 'users', ['im_username'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        # clean_logs 按时间范围删除，日志按时间顺序写入，BRIN 足够且体积很小
+        op.create_index('ix_logs_created_at_brin', 'logs', ['created_at'], unique=False,
+                        postgresql_using='brin', postgresql_concurrently=True, if_not_exists=True)
+        # get_logs 按时间倒序分页
+        op.create_index('ix_logs_created_at_id', 'logs', ['created_at', 'id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        # get_config_for_sign 先按班级、再按默认配置查找
+        op.create_index('ix_sign_configs_user_id_class_id', 'sign_configs', ['user_id', 'class_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_sign_configs_user_id_default', 'sign_configs', ['user_id'], unique=False,
+                        postgresql_where=sa.text('is_default'), postgresql_concurrently=True, if_not_exists=True)
+        # get_activities 按用户查询最近的检测记录（uuid 已有唯一约束索引）
+        op.create_index('ix_user_activity_detections_user_id_detected_at', 'user_activity_detections', ['user_id', 'detected_at'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_user_activity_detections_user_id_detected_at', table_name='user_activity_detections', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_sign_configs_user_id_default', table_name='sign_configs', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_sign_configs_user_id_class_id', table_name='sign_configs', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_logs_created_at_id', table_name='logs', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_logs_created_at_brin', table_name='logs', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_users_im_username', table_name='users', postgresql_concurrently=True, if_exists=True)
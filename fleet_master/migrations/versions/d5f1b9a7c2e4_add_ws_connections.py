@@ -0,0 +1,40 @@
+"""add ws_connections
+
+Revision ID: d5f1b9a7c2e4
+Revises: c3a8f5e2b6d1
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5f1b9a7c2e4'
+down_revision: Union[str, None] = 'c3a8f5e2b6d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('ws_connections',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('worker_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('im_username', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('connected_at', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('worker_name', 'im_username', name='uq_ws_connections_worker_name_im_username')
+    )
+    op.create_index(op.f('ix_ws_connections_worker_name'), 'ws_connections', ['worker_name'], unique=False)
+    op.create_index(op.f('ix_ws_connections_im_username'), 'ws_connections', ['im_username'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ws_connections_im_username'), table_name='ws_connections')
+    op.drop_index(op.f('ix_ws_connections_worker_name'), table_name='ws_connections')
+    op.drop_table('ws_connections')
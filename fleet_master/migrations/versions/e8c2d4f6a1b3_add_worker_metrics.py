@@ -0,0 +1,40 @@
+"""add worker_metrics
+
+Revision ID: e8c2d4f6a1b3
+Revises: d5f1b9a7c2e4
+Create Date: 2026-10-18 19:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8c2d4f6a1b3'
+down_revision: Union[str, None] = 'd5f1b9a7c2e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('worker_metrics',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('worker_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('ts', sa.TIMESTAMP(timezone=True), nullable=False),
+    sa.Column('samples', sa.SmallInteger(), nullable=False),
+    sa.Column('connections', sa.Integer(), nullable=True),
+    sa.Column('cpu_percent', sa.REAL(), nullable=True),
+    sa.Column('queue_depth', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_worker_metrics_worker_name_ts', 'worker_metrics', ['worker_name', 'ts'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_worker_metrics_worker_name_ts', table_name='worker_metrics')
+    op.drop_table('worker_metrics')
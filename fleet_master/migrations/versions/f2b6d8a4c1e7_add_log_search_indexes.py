@@ -0,0 +1,50 @@
+"""add log search indexes
+
+Revision ID: f2b6d8a4c1e7
+Revises: e8c2d4f6a1b3
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b6d8a4c1e7'
+down_revision: Union[str, None] = 'e8c2d4f6a1b3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 shared.models.log.LOG_SEARCH_DOCUMENT 一致
+LOG_SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple'::regconfig, coalesce(message, '')), 'A') "
+    "|| setweight(to_tsvector('simple'::regconfig, coalesce(source, '')), 'B') "
+    "|| setweight(to_tsvector('simple'::regconfig, coalesce(details ->> 'error', '') || ' ' || coalesce(details ->> 'im_username', '') || ' ' || coalesce(details ->> 'activity_id', '') || ' ' || coalesce(details ->> 'worker_name', '')), 'C')"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY 不能在事务中执行，建索引期间不阻塞日志写入
+    with op.get_context().autocommit_block():
+        # get_logs / clear_logs 的关键字子串搜索（LIKE '%x%'）
+        op.create_index('ix_logs_message_trgm', 'logs', ['message'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'message': 'gin_trgm_ops'},
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_logs_source_trgm', 'logs', ['source'], unique=False,
+                        postgresql_using='gin', postgresql_ops={'source': 'gin_trgm_ops'},
+                        postgresql_concurrently=True, if_not_exists=True)
+        # 全文检索，表达式必须与查询中使用的完全一致
+        op.create_index('ix_logs_search', 'logs', [sa.text(f"({LOG_SEARCH_DOCUMENT})")], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_logs_search', table_name='logs', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_logs_source_trgm', table_name='logs', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_logs_message_trgm', table_name='logs', postgresql_concurrently=True, if_exists=True)
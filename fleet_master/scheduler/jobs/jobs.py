@@ -2,16 +2,19 @@ from datetime import datetime, timedelta, timezone
 import logging
 import sys
 
-from app.core.security import create_fleet_jwt
+from app.services.bulk_delete import bulk_delete
+from app.services.log_partitions import drop_expired_log_partitions, ensure_log_partitions, is_partitioned
+from app.services.heartbeat import clean_worker_metrics, sweep_stale_workers
+from app.services.worker import probe_error_workers
+from app.services.job_queue import clean_jobs
+from app.services.ws_reconcile import reconcile_ws_connections
 from shared.db.session import async_session
 from shared.models.log import Log, LogLevel, LogCategory
-from shared.models.user import User
-from shared.models.worker import Worker, WorkerStatus
-from sqlalchemy import delete, select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select
 from shared.core.config import settings
 from shared.utils.http import AsyncHttpClient
 from shared.utils.logger import DBLogger
+from shared.utils.pubsub import WORKER_CHANGED, WorkerChanged, pubsub
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -23,148 +26,100 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 async def clean_logs():
-    async with async_session() as db:
-        try:
-            await db.execute(
-                delete(Log)
-                .where(Log.created_at < datetime.now(timezone.utc) - timedelta(days=30)))
-            await db.commit()
-            logger.info("日志清理完成")
-        except Exception as e:
-            logger.error(f"日志清理失败: {e}")
-
-async def measure_ws_connections():
     """
-    监控WebSocket连接，检查是否有连接异常中断，并尝试重新连接
+    清理超过保留期的日志并预先创建未来的分区
+
+    分区表直接删除过期分区；尚未迁移为分区表时分批删除，避免一条 DELETE 长时间持锁。
     """
     try:
-        # 创建HTTP客户端
         async with async_session() as db:
-            db_logger = DBLogger(db)
-            http_client = AsyncHttpClient()
-            
-            async with async_session() as db:
-                # 获取所有活跃且需要监控的用户
-                users_result = await db.execute(
-                    select(User)
-                    .where(User.is_active == True)
-                    .where(User.monitor_status == True)
-                    .options(selectinload(User.worker))
-                )
-                users = users_result.scalars().all()
-                
-                if not users:
-                    return
-                
-                # 获取所有在线工作节点
-                workers_result = await db.execute(
-                    select(Worker)
-                    .where(Worker.status == WorkerStatus.ONLINE)
-                )
-                workers = workers_result.scalars().all()
-                
-                if not workers:
-                    return
-                
-                # 获取当前所有WebSocket连接
-                all_connections = []
-                
-                if settings.DEBUG:
-                    for worker in workers:
-                        response = await http_client.get("http://localhost:8001/api/v1/fleet/ws/get-all-connections", headers={"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"})
-                        if response.status_code == 200:
-                            all_connections = response.json()
-                            await db_logger.log(
-                                message=f"从本地开发服务器获取到{len(all_connections)}个WebSocket连接",
-                                level=LogLevel.INFO,
-                                category=LogCategory.SCHEDULER,
-                                source="scheduler.jobs.measure_ws_connections"
-                            )
-                else:
-                    for worker in workers:
-                        worker_url = f"https://{worker.subdomain}.xiusmo.com/api/v1/fleet/ws/get-all-connections"
-                        response = await http_client.get(worker_url, headers={"Authorization": f"Bearer {create_fleet_jwt(worker.name)}"})
-                        if response.status_code == 200:
-                            worker_connections = response.json()
-                            all_connections.extend(worker_connections)
-                            await db_logger.log(
-                                message=f"从 {worker.subdomain} 获取到 {len(worker_connections)} 个WebSocket连接",
-                                level=LogLevel.INFO,
-                                category=LogCategory.SCHEDULER,
-                                source="scheduler.jobs.measure_ws_connections"
-                            )
-                
-                
-                # 比较需要监控的用户和活跃连接
-                missing_connections = []
-                for user in users:
-                    if user.im_username not in all_connections:
-                        missing_connections.append(user)
-                
-                # 尝试重新建立丢失的连接
-                for user in missing_connections:
-                    if not user.worker:
-                        continue
-                        
-                    await open_ws_monitor(
-                        im_username=user.im_username, 
-                        im_password=user.im_password, 
-                        subdomain=user.worker.subdomain,
-                        db_logger=db_logger
-                    )
-                
-                await db_logger.log(
-                    message=f"WebSocket连接检查完成，已尝试重新连接 {len(missing_connections)} 个断开的连接, 总连接数 {len(all_connections)}",
-                    level=LogLevel.INFO,
+            partitioned = await is_partitioned(db)
+            if partitioned:
+                dropped, removed = await drop_expired_log_partitions(db, settings.LOG_RETENTION_DAYS)
+                created = await ensure_log_partitions(db)
+        if partitioned:
+            logger.info(f"日志清理完成，删除分区 {dropped}，默认分区删除 {removed} 条，新建分区 {created}")
+            return
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.LOG_RETENTION_DAYS)
+        progress = await bulk_delete(Log, select(Log.id, Log.created_at).where(Log.created_at < cutoff))
+        logger.info(f"日志清理完成，删除 {progress.deleted} 条，{progress.chunks} 批，耗时 {progress.elapsed:.2f}s")
+    except Exception as e:
+        logger.error(f"日志清理失败: {e}")
+
+async def clean_sign_jobs():
+    async with async_session() as db:
+        try:
+            count = await clean_jobs(db, settings.JOB_QUEUE_RETENTION_DAYS)
+            logger.info(f"签到任务清理完成，删除 {count} 条")
+        except Exception as e:
+            logger.error(f"签到任务清理失败: {e}")
+
+async def mark_stale_workers_offline():
+    """把心跳超时的工作节点标记为离线，并探测熔断中的节点是否恢复，分配和连接核对只会选择在线节点"""
+    async with async_session() as db:
+        try:
+            names = await sweep_stale_workers(db, settings.WORKER_HEARTBEAT_TIMEOUT)
+            for name in names:
+                await pubsub.publish(WORKER_CHANGED, WorkerChanged(worker_name=name))
+            if names:
+                await DBLogger(db).log(
+                    message=f"工作节点心跳超时，已标记为离线: {', '.join(names)}",
+                    level=LogLevel.WARNING,
                     category=LogCategory.SCHEDULER,
-                    source="scheduler.jobs.measure_ws_connections"
+                    details={"workers": names, "timeout": settings.WORKER_HEARTBEAT_TIMEOUT},
+                    source="scheduler.jobs.mark_stale_workers_offline"
                 )
-                logger.info(f"WebSocket连接监控任务执行完成{len(missing_connections)}个断开的连接, 总连接数 {len(all_connections)}")
-            
-    except Exception as e:
-        await db_logger.log(
-            message=f"执行WebSocket连接监控任务时出现未处理异常: {str(e)}",
-            level=LogLevel.ERROR,
-            category=LogCategory.SCHEDULER,
-            details={"error": str(e)},
-            source="scheduler.jobs.measure_ws_connections"
-        )
-        logger.error(f"执行WebSocket连接监控任务时出现未处理异常: {str(e)}")
+                logger.warning(f"工作节点心跳超时，已标记为离线: {names}")
+        except Exception as e:
+            logger.error(f"检查工作节点心跳失败: {e}")
+        try:
+            # 熔断标记为 ERROR 的节点没有签到请求时不会被半开探测，这里主动检查是否恢复
+            recovered = await probe_error_workers(db)
+            if recovered:
+                logger.info(f"工作节点健康检查恢复: {recovered}")
+        except Exception as e:
+            logger.error(f"探测异常工作节点失败: {e}")
+
+async def clean_worker_metric_rows():
+    async with async_session() as db:
+        try:
+            count = await clean_worker_metrics(db, settings.WORKER_METRICS_RETENTION_DAYS)
+            logger.info(f"节点负载指标清理完成，删除 {count} 条")
+        except Exception as e:
+            logger.error(f"节点负载指标清理失败: {e}")
 
-async def open_ws_monitor(im_username: str, im_password: str, subdomain: str, db_logger: DBLogger):
+async def measure_ws_connections(use_checksum: bool = False):
     """
-    为指定用户打开WebSocket监控连接
+    监控WebSocket连接，检查是否有连接异常中断，并尝试重新连接
+    
+    Args:
+        use_checksum: 先比较节点与 ws_connections 表的校验和，一致的节点不再拉取完整连接列表
+    
+    Returns:
+        Dict[str, Any]: 本轮核对的统计信息，失败时为 None
     """
-    try:
-        http_client = AsyncHttpClient()
-        
-        if settings.DEBUG:
-            url = f"http://localhost:8001/api/v1/fleet/ws/connect"
-        else:
-            url = f"https://{subdomain}.xiusmo.com/api/v1/fleet/ws/connect"
-            
-        params = {"im_username": im_username, "im_password": im_password}
-        
-        response = await http_client.get(url, params=params, headers={"Authorization": f"Bearer {create_fleet_jwt(subdomain)}"})
-        
-        if response.status_code == 200:
-            return True
-        else:
+    async with async_session() as db:
+        db_logger = DBLogger(db)
+        try:
+            result = await reconcile_ws_connections(
+                db=db, http_client=AsyncHttpClient(), db_logger=db_logger, use_checksum=use_checksum
+            )
+            logger.info(
+                f"WebSocket连接监控任务执行完成: 缺失 {result.missing}，多余 {result.extra}，"
+                f"重连成功率 {result.reconnect_success_rate}，耗时 {result.duration:.2f}s"
+            )
+            return result.to_dict()
+        except Exception as e:
             await db_logger.log(
-                message=f"为用户 {im_username} 建立WebSocket连接失败: HTTP {response.status_code} - {response.text}",
+                message=f"执行WebSocket连接监控任务时出现未处理异常: {str(e)}",
                 level=LogLevel.ERROR,
                 category=LogCategory.SCHEDULER,
                 details={"error": str(e)},
-                source="scheduler.jobs.open_ws_monitor"
+                source="scheduler.jobs.measure_ws_connections"
             )
-            return False
-            
-    except Exception as e:
-        await db_logger.log(
-            message=f"为用户 {im_username} 打开WebSocket连接时出现异常: {str(e)}",
-            level=LogLevel.ERROR,
-            category=LogCategory.SCHEDULER,
-            details={"error": str(e)},
-            source="scheduler.jobs.open_ws_monitor"
-        )
-        return False
\ No newline at end of file
+            logger.error(f"执行WebSocket连接监控任务时出现未处理异常: {str(e)}")
+            return None
+
+async def verify_ws_connections():
+    """低成本的校验和核对，连接增量由节点通过 /abracadabra/ws-connections/report 推送"""
+    return await measure_ws_connections(use_checksum=True)
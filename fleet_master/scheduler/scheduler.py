@@ -21,8 +21,17 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 import asyncio
+from datetime import datetime, timezone
 from shared.db.session import async_session
-from jobs.jobs import clean_logs, measure_ws_connections
+from shared.utils.log_sink import log_sink
+from shared.utils.http_pool import http_pool
+from shared.utils.http_metrics import http_metrics
+from shared.utils.pubsub import pubsub
+from shared.core.config import settings
+from jobs.jobs import (
+    clean_logs, clean_sign_jobs, clean_worker_metric_rows,
+    mark_stale_workers_offline, measure_ws_connections, verify_ws_connections
+)
 
 
 
@@ -35,20 +44,65 @@ async def main():
     """主函数"""
     std_logger.info("调度器主程序启动")
     
+    # 启动日志批量写入
+    log_sink.start()
+    
+    # 启动HTTP连接池
+    http_pool.start()
+    
+    # HTTP客户端指标快照，与 API 共享 HTTP_METRICS_DIR 时一起出现在 /metrics 中
+    http_metrics.start()
+    
+    # 连接进程间通知，调度任务修改的数据需要通知 API 进程失效缓存
+    pubsub.start()
+    
     # 创建并配置调度器
     scheduler = AsyncIOScheduler(timezone="Asia/Shanghai")
     
-    # 每天凌晨 2:00 清理日志（或按需时间）
+    # 每天凌晨 2:00 清理日志并预建分区（或按需时间），启动时先执行一次，保证当天的分区存在
     scheduler.add_job(
         clean_logs,
         trigger=CronTrigger(hour=2, minute=0),  # 可改为 hour=0 表示午夜
-        id="log_cleaner"
+        id="log_cleaner",
+        next_run_time=datetime.now(timezone.utc),
+    )
+
+    # 每天凌晨 2:30 清理已完成的签到任务
+    scheduler.add_job(
+        clean_sign_jobs,
+        trigger=CronTrigger(hour=2, minute=30),
+        id="sign_job_cleaner"
+    )
+
+    # 每天凌晨 2:45 清理过期的节点负载指标
+    scheduler.add_job(
+        clean_worker_metric_rows,
+        trigger=CronTrigger(hour=2, minute=45),
+        id="worker_metric_cleaner"
+    )
+
+    # 心跳超时的节点标记为离线
+    scheduler.add_job(
+        mark_stale_workers_offline,
+        trigger=IntervalTrigger(seconds=settings.WORKER_SWEEP_INTERVAL_SECONDS),
+        id="mark_stale_workers_offline",
+        max_instances=1,
+        coalesce=True
+    )
+
+    # 节点推送连接增量，定时只比较校验和
+    scheduler.add_job(
+        verify_ws_connections,
+        trigger=IntervalTrigger(seconds=settings.WS_CHECKSUM_INTERVAL_SECONDS),
+        id="verify_ws_connections",
+        max_instances=1,
+        coalesce=True
     )
 
-    # 每 30 分钟执行一次 WebSocket 检测
+    # 低频全量拉取连接列表兜底
     scheduler.add_job(
         measure_ws_connections,
-        trigger=IntervalTrigger(minutes=10),
+        trigger=IntervalTrigger(minutes=settings.WS_FULL_RECONCILE_INTERVAL_MINUTES),
         id="measure_ws_connections"
     )
     
@@ -64,6 +118,12 @@ async def main():
         std_logger.info("接收到终止信号，正在关闭调度器...")
         scheduler.shutdown()
         std_logger.info("调度器已关闭")
+    finally:
+        await pubsub.stop()
+        await http_pool.close()
+        await http_metrics.stop()
+        # 写入缓冲区中剩余的日志
+        await log_sink.stop()
 
 
 if __name__ == "__main__":
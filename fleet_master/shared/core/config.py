@@ -53,6 +53,134 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     
+    # 日志批量写入设置
+    LOG_SINK_MAX_SIZE: int = 10000  # 缓冲区最大日志条数
+    LOG_SINK_BATCH_SIZE: int = 500  # 单次批量写入的最大条数
+    LOG_SINK_FLUSH_INTERVAL: float = 1.0  # 最长写入间隔（秒）
+    LOG_SINK_OVERFLOW_POLICY: str = "drop_newest"  # 缓冲区满时的策略: drop_newest / drop_oldest
+    
+    # 数据库日志写入策略（JSON，字段见 shared.schemas.log.LogPolicyConfig），可在管理接口中热更新。
+    # 默认不过滤任何日志，需要时按需开启，例如：
+    # {"min_levels": {"api": "info"}, "sample_rates": {"api": 0.1}, "source_rate": {"rate": 20, "burst": 100}}
+    LOG_POLICY: Dict[str, Any] = {}
+    
+    # 日志保留与分区设置
+    LOG_RETENTION_DAYS: int = 30  # 日志保留天数
+    LOG_PARTITION_DAYS: int = 1  # 每个分区覆盖的天数（UTC），7 为按周分区
+    LOG_PARTITION_PREMAKE_DAYS: int = 7  # 提前创建未来多少天的分区
+    
+    # 日志查询设置
+    LOG_QUERY_AUDIT: str = "sample"  # 管理员查询日志时是否写入审计日志: all / sample / off
+    LOG_QUERY_AUDIT_SAMPLE_RATE: float = 0.05  # sample 模式下的抽样比例
+    LOG_QUERY_EXACT_COUNT_THRESHOLD: int = 10000  # 估计行数低于该值时精确计数
+    LOG_SEARCH_DEFAULT_DAYS: int = 7  # 全文检索未指定时间范围时检索最近的天数
+    LOG_SEARCH_MAX_DAYS: int = 31  # 全文检索允许的最大时间范围（天）
+    
+    # 分批删除设置
+    BULK_DELETE_CHUNK_SIZE: int = 5000  # 初始批大小
+    BULK_DELETE_MAX_CHUNK_SECONDS: float = 0.5  # 单批目标耗时（秒），超过时缩小批大小，限制持锁时间
+    BULK_DELETE_LOCK_TIMEOUT: float = 2.0  # 单批等待锁的最长时间（秒）
+    BULK_DELETE_PAUSE: float = 0.05  # 两批之间的间隔（秒）
+    BULK_DELETE_JOB_TIMEOUT: float = 3600.0  # 后台删除任务的执行超时（秒）
+    
+    # HTTP连接池设置（每个上游一个连接池）
+    HTTP_POOL_MAX_CONNECTIONS: int = 100  # 每个上游的最大连接数
+    HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS: int = 20  # 每个上游保持的空闲长连接数
+    HTTP_POOL_KEEPALIVE_EXPIRY: float = 30.0  # 空闲长连接过期时间（秒）
+    HTTP_POOL_HTTP2: bool = False  # 是否启用HTTP/2（需要安装 h2）
+    
+    # HTTP客户端指标设置
+    HTTP_METRICS_DIR: Optional[str] = "/tmp/fleet_http_metrics"  # 各进程定期把指标快照写入该目录，/metrics 汇总所有进程；为空时只统计本进程
+    HTTP_METRICS_FLUSH_INTERVAL: float = 15.0  # 写入快照的间隔（秒）
+    HTTP_METRICS_STALE_SECONDS: float = 3600.0  # 超过该时间未更新的快照（进程已退出）累加到 retired.json 后删除
+    HTTP_METRICS_MAX_SERIES: int = 2000  # 每个进程最多的时间序列数，超出的路由合并为 {other}
+    METRICS_TOKEN: Optional[str] = None  # 访问 /metrics 的 Bearer Token，为空时不校验
+    
+    # 上游熔断设置（按 scheme://host:port 区分上游）
+    HTTP_BREAKER_ENABLED: bool = True  # 是否启用熔断和自适应超时
+    HTTP_BREAKER_WINDOW: int = 20  # 统计最近多少次请求的失败比例
+    HTTP_BREAKER_MIN_REQUESTS: int = 5  # 请求数达到该值后才判断是否熔断
+    HTTP_BREAKER_FAILURE_RATIO: float = 0.5  # 失败比例达到该值时熔断
+    HTTP_BREAKER_OPEN_SECONDS: float = 15.0  # 首次熔断时间（秒），半开探测失败后加倍
+    HTTP_BREAKER_MAX_OPEN_SECONDS: float = 300.0  # 最长熔断时间（秒）
+    HTTP_CONNECT_TIMEOUT: float = 5.0  # 建立连接的超时（秒），不超过请求超时
+    HTTP_ADAPTIVE_TIMEOUT_MULTIPLIER: float = 3.0  # 自适应超时为最近成功请求 p99 耗时的倍数
+    HTTP_ADAPTIVE_TIMEOUT_MIN: float = 2.0  # 自适应超时下限（秒），上限为客户端配置的超时
+    HTTP_ADAPTIVE_TIMEOUT_MIN_SAMPLES: int = 50  # 样本数不足时使用客户端配置的超时
+    HTTP_ADAPTIVE_TIMEOUT_WINDOW: float = 300.0  # 耗时统计窗口（秒）
+    
+    # HTTP重试设置（每个调用点可以传入自己的 RetryPolicy）
+    HTTP_RETRY_MAX_DELAY: float = 10.0  # 单次重试前的最长等待（秒）
+    HTTP_RETRY_MAX_RETRY_AFTER: float = 30.0  # 响应的 Retry-After 超过该值（秒）时不再重试
+    HTTP_RETRY_BUDGET_RATIO: float = 0.1  # 每个进程最近的重试数不超过请求数的该比例
+    HTTP_RETRY_BUDGET_MIN_PER_SECOND: float = 1.0  # 请求很少时每秒至少允许的重试数
+    HTTP_RETRY_BUDGET_WINDOW: int = 10  # 重试预算的统计窗口（秒）
+    
+    # HTTP日志设置
+    HTTP_LOG_BODY_MAX_BYTES: int = 4096  # BODY 级别日志中请求/响应体的最大字节数，超出部分截断
+    
+    # 批量签到设置
+    BATCH_SIGN_WORKER_CONCURRENCY: int = 10  # 每个工作节点同时处理的签到请求数
+    SIGN_COALESCE_WINDOW: float = 0.05  # 合并同一节点签到请求的时间窗口（秒）
+    SIGN_COALESCE_MAX_BATCH: int = 100  # 单次批量签到请求的最大用户数
+    
+    # 推送通知设置
+    BARK_SERVER: str = "https://api.day.app"  # Bark 服务地址，自建服务或本地测试时修改
+    NTFY_SERVER: str = "https://ntfy.sh"  # ntfy 服务地址
+    NOTIFY_COALESCE_WINDOW: float = 3.0  # 同一接收方同一标题的通知在该时间（秒）内合并为一条
+    NOTIFY_RATE_PER_MINUTE: float = 6.0  # 每个接收方每分钟最多推送的条数，超出时继续合并等待
+    NOTIFY_BURST: int = 3  # 每个接收方允许连续推送的条数
+    NOTIFY_WORKERS: int = 4  # 每个进程的推送发送任务数
+    NOTIFY_MAX_PENDING: int = 10000  # 等待推送的通知上限，超出时丢弃新通知
+    NOTIFY_MAX_RETRIES: int = 3  # 推送失败（连接错误、429、5xx）的最大重试次数
+    NOTIFY_TIMEOUT: float = 10.0  # 单次推送超时（秒）
+    
+    # 活动上报查询缓存设置
+    LOOKUP_CACHE_MAX_SIZE: int = 10000  # 每类缓存的最大条目数
+    LOOKUP_CACHE_TTL: float = 300.0  # 缓存过期时间（秒）
+    
+    # 签到任务队列设置
+    JOB_QUEUE_ENABLED: bool = True  # 是否在当前进程中执行队列任务
+    JOB_QUEUE_CONCURRENCY: int = 20  # 每个进程同时执行的任务数
+    JOB_QUEUE_WORKER_CONCURRENCY: int = 10  # 每个工作节点同时执行的任务数
+    JOB_QUEUE_POLL_INTERVAL: float = 1.0  # 没有新任务通知时的轮询间隔（秒）
+    JOB_QUEUE_MAX_ATTEMPTS: int = 5  # 最大尝试次数，超过后进入死信
+    JOB_QUEUE_BACKOFF_BASE: float = 2.0  # 重试退避基数（秒），按 2 的指数增长
+    JOB_QUEUE_BACKOFF_MAX: float = 300.0  # 重试退避上限（秒）
+    JOB_QUEUE_JOB_TIMEOUT: float = 120.0  # 单个任务执行超时（秒）
+    JOB_QUEUE_LOCK_TIMEOUT: float = 600.0  # 领取后超过该时间未完成视为进程已退出，重新入队
+    JOB_QUEUE_RETENTION_DAYS: int = 7  # 成功任务保留天数
+    
+    # WebSocket 连接核对设置
+    WS_RECONCILE_WORKER_TIMEOUT: float = 10.0  # 单个节点请求超时（秒）
+    WS_RECONCILE_CONCURRENCY: int = 10  # 每个节点同时进行的重连/断开请求数
+    WS_RECONCILE_CLOSE_EXTRA: bool = True  # 是否断开节点上多余的连接
+    WS_CHECKSUM_INTERVAL_SECONDS: int = 60  # 校验和核对间隔（秒），节点推送增量后只需低成本核对
+    WS_FULL_RECONCILE_INTERVAL_MINUTES: int = 60  # 全量拉取连接列表的兜底核对间隔（分钟）
+    
+    # 工作节点心跳设置
+    HEARTBEAT_FLUSH_INTERVAL: float = 5.0  # 批量写入 last_heartbeat 的间隔（秒）
+    HEARTBEAT_METRICS_INTERVAL: float = 60.0  # 负载指标的采样周期（秒），周期内取平均值写入一行
+    WORKER_HEARTBEAT_TIMEOUT: float = 90.0  # 超过该时间（秒）没有心跳的节点标记为离线
+    WORKER_SWEEP_INTERVAL_SECONDS: int = 30  # 离线检查间隔（秒）
+    WORKER_METRICS_RETENTION_DAYS: int = 7  # 负载指标保留天数
+    
+    # 工作节点分配设置
+    PLACEMENT_REFRESH_INTERVAL: float = 30.0  # 从数据库刷新各节点分配数的间隔（秒）
+    PLACEMENT_DEFAULT_CAPACITY: int = 500  # 节点未在 capabilities 中配置 max_users 时的容量
+    PLACEMENT_LATENCY_TARGET: float = 2.0  # 签到耗时基准（秒），超过时评分升高
+    PLACEMENT_WEIGHT_ASSIGNED: float = 1.0  # 已分配用户数权重
+    PLACEMENT_WEIGHT_CONNECTIONS: float = 0.5  # 当前连接数权重
+    PLACEMENT_WEIGHT_LATENCY: float = 0.3  # 签到耗时权重
+    PLACEMENT_WEIGHT_ERRORS: float = 1.0  # 签到错误率权重
+    PLACEMENT_WEIGHT_CPU: float = 1.0  # 心跳上报的 CPU 使用率权重
+    PLACEMENT_WEIGHT_QUEUE: float = 0.5  # 心跳上报的任务队列长度权重
+    PLACEMENT_QUEUE_TARGET: int = 100  # 任务队列长度基准，超过时评分升高
+    PLACEMENT_HEARTBEAT_STALE: float = 180.0  # 心跳超过该时间（秒）未更新视为不健康
+    PLACEMENT_STALE_PENALTY: float = 5.0  # 心跳过期节点的额外评分
+    PLACEMENT_REBALANCE_TOLERANCE: float = 0.1  # 负载率超过整体负载率多少视为过载
+    PLACEMENT_REBALANCE_MAX_MOVES: int = 50  # 单次负载均衡最多迁移的用户数
+    
     
     class Config:
         env_file = ".env"
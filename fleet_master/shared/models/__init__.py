@@ -5,3 +5,6 @@ from shared.models.sign_activity import SignActivity
 from shared.models.sign_config import SignConfig
 from shared.models.user_activity_detection import UserActivityDetection
 from shared.models.announcement import Announcement, AnnouncementStatus
+from shared.models.sign_job import SignJob, JobStatus
+from shared.models.ws_connection import WsConnection
+from shared.models.worker_metric import WorkerMetric
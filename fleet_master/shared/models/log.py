@@ -29,11 +29,47 @@ class LogCategory(str, Enum):
     
 
 
+# 全文检索使用的文档表达式：消息、来源和 details 中常用于排查的字段，按权重 A/B/C 排序。
+# 表达式索引和查询必须使用完全相同的表达式，Postgres 才会使用索引。
+# 中文没有分词，使用 simple 配置按空白和标点切分；子串匹配由 message/source 的 pg_trgm 索引处理。
+LOG_SEARCH_DETAILS_KEYS = ("error", "im_username", "activity_id", "worker_name")
+LOG_SEARCH_DOCUMENT = (
+    "setweight(to_tsvector('simple'::regconfig, coalesce(message, '')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(source, '')), 'B') || "
+    "setweight(to_tsvector('simple'::regconfig, "
+    + " || ' ' || ".join(f"coalesce(details ->> '{key}', '')" for key in LOG_SEARCH_DETAILS_KEYS)
+    + "), 'C')"
+)
+
+
 class Log(SQLModel, table=True):
-    """日志模型"""
+    """
+    日志模型
+
+    Postgres 上按 created_at 范围分区（见 app.services.log_partitions），过期日志按分区直接删除，
+    主键需要包含分区键，因此为 (id, created_at)。
+    """
     __tablename__ = "logs"
+    __table_args__ = (
+        # 按时间范围删除、筛选（日志按时间顺序写入，BRIN 体积很小）
+        sa.Index("ix_logs_created_at_brin", "created_at", postgresql_using="brin"),
+        # 按时间倒序分页
+        sa.Index("ix_logs_created_at_id", "created_at", "id"),
+        # 关键字子串搜索（LIKE '%x%'）
+        sa.Index(
+            "ix_logs_message_trgm", "message",
+            postgresql_using="gin", postgresql_ops={"message": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        sa.Index(
+            "ix_logs_source_trgm", "source",
+            postgresql_using="gin", postgresql_ops={"source": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        # 全文检索
+        sa.Index("ix_logs_search", sa.text(f"({LOG_SEARCH_DOCUMENT})"), postgresql_using="gin").ddl_if(dialect="postgresql"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     
-    id: Optional[int] = Field(default=None, primary_key=True)
+    id: Optional[int] = Field(default=None, sa_column=sa.Column(sa.Integer, primary_key=True, autoincrement=True))
     level: LogLevel = Field(default=LogLevel.INFO)
     category: LogCategory = Field(default=LogCategory.OTHER)
     message: str
@@ -47,9 +83,23 @@ class Log(SQLModel, table=True):
     
     created_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),
-        sa_column=sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+        sa_column=sa.Column(sa.TIMESTAMP(timezone=True), primary_key=True, nullable=False)
     )
     updated_at: Optional[datetime] = Field(
         default_factory=lambda: datetime.now(timezone.utc),
         sa_column=sa.Column(sa.TIMESTAMP(timezone=True))
-    )
\ No newline at end of file
+    )
+
+
+# 建表前启用 pg_trgm 扩展（create_all 建表时使用，迁移中单独启用）
+sa.event.listen(
+    Log.__table__,
+    "before_create",
+    sa.DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+# 默认分区接收没有对应日期分区的日志，日期分区由定时任务预先创建
+sa.event.listen(
+    Log.__table__,
+    "after_create",
+    sa.DDL("CREATE TABLE IF NOT EXISTS logs_default PARTITION OF logs DEFAULT").execute_if(dialect="postgresql"),
+)
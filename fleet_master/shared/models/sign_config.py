@@ -12,6 +12,12 @@ if TYPE_CHECKING:
 class SignConfig(SQLModel, table=True):
     """用户签到配置模型，存储用户的签到参数和策略"""
     __tablename__ = 'sign_configs'
+    __table_args__ = (
+        # 查找用户在某个班级的配置
+        sa.Index("ix_sign_configs_user_id_class_id", "user_id", "class_id"),
+        # 查找用户的默认配置
+        sa.Index("ix_sign_configs_user_id_default", "user_id", postgresql_where=sa.text("is_default")),
+    )
     
     id: int = Field(sa_column=Column(Integer, primary_key=True, index=True))
     uuid: str = Field(sa_column=Column(String(100), default=lambda: str(uuid.uuid4()), nullable=False, unique=True))
@@ -0,0 +1,51 @@
+from datetime import datetime, timezone
+from enum import Enum
+from typing import Optional, Dict, Any
+
+import sqlalchemy as sa
+from sqlmodel import Field, Column, JSON, SQLModel
+
+
+class JobStatus(str, Enum):
+    """后台任务状态枚举"""
+    PENDING = "pending"      # 等待执行（包括等待重试）
+    RUNNING = "running"      # 已被某个进程领取
+    SUCCEEDED = "succeeded"  # 执行成功
+    DEAD = "dead"            # 超过最大重试次数，进入死信
+
+
+class SignJob(SQLModel, table=True):
+    """签到后台任务，多个进程通过 FOR UPDATE SKIP LOCKED 领取"""
+    __tablename__ = "sign_jobs"
+    __table_args__ = (
+        # 领取任务时只扫描待执行的任务
+        sa.Index("ix_sign_jobs_pending_run_at", "run_at", postgresql_where=sa.text("status = 'PENDING'")),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(index=True)  # 任务类型，对应注册的处理函数
+    payload: Dict[str, Any] = Field(default={}, sa_column=Column(JSON))
+    worker_name: Optional[str] = Field(default=None, index=True)  # 用于限制每个工作节点的并发
+    status: JobStatus = Field(default=JobStatus.PENDING, index=True)
+
+    attempts: int = Field(default=0)
+    max_attempts: int = Field(default=5)
+    last_error: Optional[str] = None
+
+    run_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+    )
+    locked_by: Optional[str] = None
+    locked_at: Optional[datetime] = Field(default=None, sa_column=sa.Column(sa.TIMESTAMP(timezone=True)))
+    started_at: Optional[datetime] = Field(default=None, sa_column=sa.Column(sa.TIMESTAMP(timezone=True)))
+    finished_at: Optional[datetime] = Field(default=None, sa_column=sa.Column(sa.TIMESTAMP(timezone=True)))
+
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+    )
+    updated_at: Optional[datetime] = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=sa.Column(sa.TIMESTAMP(timezone=True))
+    )
@@ -23,7 +23,7 @@ class User(SQLModel, table=True):
     cx_vc3: str = Field(default=None, nullable=True)
     cx_uid: str = Field(default=None, nullable=True)
     
-    im_username: str = Field(default=None, nullable=True)   
+    im_username: str = Field(default=None, nullable=True, index=True)   
     im_password: str = Field(default=None, nullable=True)
     monitor_status: bool = Field(default=False)
     
@@ -12,6 +12,10 @@ if TYPE_CHECKING:
 class UserActivityDetection(SQLModel, table=True):
     """用户活动检测记录，记录哪个用户检测到了哪个活动"""
     __tablename__ = 'user_activity_detections'
+    __table_args__ = (
+        # 按用户查询最近的检测记录，uuid 已有唯一约束索引
+        sa.Index("ix_user_activity_detections_user_id_detected_at", "user_id", "detected_at"),
+    )
     
     id: int = Field(sa_column=Column(Integer, primary_key=True, index=True))
     uuid: str = Field(sa_column=Column(String(100), default=lambda: str(uuid.uuid4()), nullable=False, unique=True))
@@ -0,0 +1,24 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlmodel import Field, SQLModel
+
+
+class WorkerMetric(SQLModel, table=True):
+    """工作节点心跳上报的负载指标，每个节点每个采样周期一行（周期内取平均值）"""
+    __tablename__ = "worker_metrics"
+    __table_args__ = (
+        sa.Index("ix_worker_metrics_worker_name_ts", "worker_name", "ts"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    worker_name: str
+    ts: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+    )
+    samples: int = Field(default=1, sa_column=sa.Column(sa.SmallInteger, nullable=False))
+    connections: Optional[int] = None
+    cpu_percent: Optional[float] = Field(default=None, sa_column=sa.Column(sa.REAL))
+    queue_depth: Optional[int] = None
@@ -0,0 +1,22 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlmodel import Field, SQLModel
+
+
+class WsConnection(SQLModel, table=True):
+    """工作节点上报的 WebSocket 连接，每个节点每个 IM 用户一行"""
+    __tablename__ = "ws_connections"
+    __table_args__ = (
+        sa.UniqueConstraint("worker_name", "im_username", name="uq_ws_connections_worker_name_im_username"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    worker_name: str = Field(index=True)
+    im_username: str = Field(index=True)
+
+    connected_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc),
+        sa_column=sa.Column(sa.TIMESTAMP(timezone=True), nullable=False)
+    )
@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from shared.models.log import LogLevel, LogCategory
 
@@ -32,6 +32,12 @@ class LogResponse(LogBase):
         from_attributes = True
 
 
+class LogSearchResult(LogResponse):
+    """全文检索结果"""
+    rank: Optional[float] = None  # 相关度，越大越相关
+    highlight: Optional[str] = None  # 消息中命中部分的片段，用 <mark> 标出
+
+
 class LogFilter(BaseModel):
     """日志筛选条件"""
     level: Optional[LogLevel] = None
@@ -41,4 +47,22 @@ class LogFilter(BaseModel):
     worker_id: Optional[int] = None
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
-    search: Optional[str] = None 
\ No newline at end of file
+    search: Optional[str] = None
+
+
+class LogRateLimit(BaseModel):
+    """令牌桶限速"""
+    rate: float = Field(..., ge=0, description="每秒补充的条数")
+    burst: int = Field(..., ge=1, description="桶容量，允许的突发条数")
+
+
+class LogPolicyConfig(BaseModel):
+    """数据库日志写入策略，按顺序判断：保留级别 -> 最低级别 -> 抽样 -> 限速"""
+    keep_level: LogLevel = LogLevel.WARNING  # 该级别及以上总是写入，不受其他规则限制
+    default_min_level: LogLevel = LogLevel.DEBUG  # 未单独配置的类别的最低级别
+    min_levels: Dict[LogCategory, LogLevel] = {}  # 各类别的最低级别
+    sample_rates: Dict[LogCategory, float] = {}  # 各类别低于保留级别的日志的写入比例
+    source_rate: Optional[LogRateLimit] = None  # 每个 source 的默认限速，None 为不限速
+    source_rates: Dict[str, LogRateLimit] = {}  # 按 source 前缀单独限速，最长前缀优先
+    exempt_categories: List[LogCategory] = [LogCategory.TASK, LogCategory.SECURITY]  # 审计类日志不抽样、不限速
+
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Dict, Optional, Any
+from typing import Dict, List, Optional, Any
 class SignActivityFromWS(BaseModel):
     activity_id: str = Field(..., description="活动的唯一标识符", alias="aid")
     class_id: str = Field(..., description="班级的唯一标识符", alias="classid")
@@ -13,6 +13,20 @@ class SignActivityFromWS(BaseModel):
     cookies: Optional[Dict[str, str]] = Field(None, description="cookies")
     
 
+class BatchSignUser(BaseModel):
+    """批量签到中单个用户的参数"""
+    key: str = Field(..., description="用于匹配返回结果的标识，通常为检测记录的uuid")
+    cookies: Dict[str, str] = Field(default_factory=dict, description="用户cookies")
+    enc: Optional[str] = Field(None, description="二维码签到的enc")
+    random_photo: bool = Field(False, description="是否使用随机照片")
+
+
+class BatchSignRequest(BaseModel):
+    """主节点发往工作节点的批量签到请求，活动信息只携带一次"""
+    activity: Dict[str, Any]
+    users: List[BatchSignUser]
+
+
 class Activity(BaseModel):
     activity_id: Optional[str] = None
     course_id: Optional[str] = None
@@ -1,5 +1,5 @@
 from typing import Optional, Dict, Any
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, validator
 from datetime import datetime
 
 
@@ -72,6 +72,15 @@ class SignConfigInDBBase(SignConfigBase):
         from_attributes = True
 
 
+class SignConfigSnapshot(SignConfigBase):
+    """签到时使用的只读配置快照，脱离数据库会话，可在进程内缓存共享"""
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+    id: Optional[int] = None
+    user_id: Optional[int] = None
+    uuid: Optional[str] = None
+
+
 class SignConfigQueryParams(BaseModel):
     """签到配置查询参数"""
     course_id: Optional[str] = None
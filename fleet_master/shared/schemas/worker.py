@@ -29,10 +29,18 @@ class WorkerUpdate(BaseModel):
     capabilities: Optional[Dict[str, Any]] = None
 
 
+# 工作节点心跳附带的负载指标
+class WorkerLoad(BaseModel):
+    connections: Optional[int] = None
+    cpu_percent: Optional[float] = None
+    queue_depth: Optional[int] = None
+
+
 # 工作节点心跳请求
 class WorkerHeartbeat(BaseModel):
     status: WorkerStatus
     last_heartbeat: Optional[datetime] = None
+    load: Optional[WorkerLoad] = None
 
 
 # 工作节点响应
@@ -0,0 +1,237 @@
+import logging
+import math
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import httpx
+
+from shared.core.config import settings
+from shared.utils.http_metrics import LatencyHistogram
+from shared.utils.pubsub import CIRCUIT_CHANGED, CircuitChanged, pubsub
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+    """熔断器状态，与 CircuitChanged.state 的取值一致"""
+    CLOSED = "closed"  # 正常放行
+    OPEN = "open"  # 快速失败
+    HALF_OPEN = "half_open"  # 放行一个探测请求
+
+
+class CircuitOpenError(httpx.TransportError):
+    """上游处于熔断状态，请求未发出"""
+
+    def __init__(self, origin: str, retry_in: float, request: Optional[httpx.Request] = None):
+        detail = f"{math.ceil(retry_in)} 秒后重试" if retry_in > 0 else "正在探测是否恢复"
+        super().__init__(f"上游 {origin} 熔断中，{detail}", request=request)
+        self.origin = origin
+        self.retry_in = retry_in
+
+
+# 状态变化监听函数：(origin, 新状态)，只在本进程判定的状态变化时调用
+StateListener = Callable[[str, CircuitState], Any]
+
+
+def origin_of(url: httpx.URL) -> str:
+    """与连接池一致，以 scheme://host:port 区分上游"""
+    return f"{url.scheme}://{url.host}:{url.port or (443 if url.scheme == 'https' else 80)}"
+
+
+class _LatencyWindow:
+    """最近一段时间的成功请求耗时，两个直方图轮换，统计覆盖 1~2 个窗口"""
+
+    def __init__(self, window: float):
+        self.window = window
+        self.current = LatencyHistogram()
+        self.previous = LatencyHistogram()
+        self.rotated_at = time.monotonic()
+
+    def observe(self, seconds: float) -> None:
+        now = time.monotonic()
+        if now - self.rotated_at >= self.window:
+            self.previous, self.current = self.current, LatencyHistogram()
+            self.rotated_at = now
+        self.current.observe(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        merged = LatencyHistogram()
+        merged.merge(self.previous)
+        merged.merge(self.current)
+        if merged.count < min_samples:
+            return None
+        return merged.quantile(q)
+
+
+class CircuitBreaker:
+    """
+    单个上游的熔断器
+
+    统计最近 HTTP_BREAKER_WINDOW 次请求，请求数不少于 HTTP_BREAKER_MIN_REQUESTS 且失败比例
+    达到 HTTP_BREAKER_FAILURE_RATIO 时打开，打开期间的请求直接抛出 CircuitOpenError。
+    打开时间到后进入半开状态，只放行一个探测请求：成功则关闭，失败则重新打开并加倍打开时间
+    （不超过 HTTP_BREAKER_MAX_OPEN_SECONDS）。连接错误、超时和 5xx 记为失败。
+    """
+
+    def __init__(self, registry: "CircuitBreakerRegistry", origin: str):
+        self.registry = registry
+        self.origin = origin
+        self.state = CircuitState.CLOSED
+        self.open_seconds = settings.HTTP_BREAKER_OPEN_SECONDS
+        self.opened_until = 0.0
+        self.opened_count = 0
+        self.rejected = 0
+        self._outcomes: Deque[bool] = deque(maxlen=settings.HTTP_BREAKER_WINDOW)
+        self._probe_started: Optional[float] = None
+        self._latency: Dict[str, _LatencyWindow] = {}
+
+    def before_request(self, request: Optional[httpx.Request] = None) -> None:
+        """发送前检查，熔断中抛出 CircuitOpenError"""
+        if self.state == CircuitState.CLOSED:
+            return
+        now = time.monotonic()
+        if self.state == CircuitState.OPEN:
+            if now < self.opened_until:
+                self.rejected += 1
+                raise CircuitOpenError(self.origin, self.opened_until - now, request)
+            self.state = CircuitState.HALF_OPEN
+            self._probe_started = None
+        # 半开：同一时间只放行一个探测请求，探测请求没有结果（如被取消）时超时后再放行下一个
+        if self._probe_started is not None and now - self._probe_started < settings.HTTP_BREAKER_OPEN_SECONDS:
+            self.rejected += 1
+            raise CircuitOpenError(self.origin, 0, request)
+        self._probe_started = now
+
+    def record(self, ok: bool, seconds: Optional[float] = None, route: Optional[str] = None) -> None:
+        """记录一次请求结果，成功请求的耗时用于计算自适应超时"""
+        if ok and seconds is not None and route is not None:
+            window = self._latency.get(route)
+            if window is None:
+                window = self._latency[route] = _LatencyWindow(settings.HTTP_ADAPTIVE_TIMEOUT_WINDOW)
+            window.observe(seconds)
+
+        if self.state == CircuitState.HALF_OPEN:
+            self._probe_started = None
+            if ok:
+                self._close()
+            else:
+                self._open(min(self.open_seconds * 2, settings.HTTP_BREAKER_MAX_OPEN_SECONDS))
+            return
+        if self.state == CircuitState.OPEN:
+            # 打开前已经发出的请求
+            return
+
+        self._outcomes.append(ok)
+        failures = self._outcomes.count(False)
+        if (
+            len(self._outcomes) >= settings.HTTP_BREAKER_MIN_REQUESTS
+            and failures / len(self._outcomes) >= settings.HTTP_BREAKER_FAILURE_RATIO
+        ):
+            self._open(settings.HTTP_BREAKER_OPEN_SECONDS)
+
+    def timeout(self, route: str, default: float) -> float:
+        """
+        根据最近成功请求的耗时计算超时：p99 乘以 HTTP_ADAPTIVE_TIMEOUT_MULTIPLIER，
+        不低于 HTTP_ADAPTIVE_TIMEOUT_MIN，不超过 default；样本不足时使用 default
+        """
+        window = self._latency.get(route)
+        p99 = window.quantile(0.99, settings.HTTP_ADAPTIVE_TIMEOUT_MIN_SAMPLES) if window else None
+        if p99 is None:
+            return default
+        return min(max(p99 * settings.HTTP_ADAPTIVE_TIMEOUT_MULTIPLIER, settings.HTTP_ADAPTIVE_TIMEOUT_MIN), default)
+
+    def _open(self, seconds: float, notify: bool = True) -> None:
+        self.state = CircuitState.OPEN
+        self.open_seconds = seconds
+        self.opened_until = time.monotonic() + seconds
+        self.opened_count += 1
+        self._outcomes.clear()
+        logger.warning(f"上游 {self.origin} 熔断 {seconds:.0f} 秒")
+        if notify:
+            self.registry._changed(self, CircuitState.OPEN)
+
+    def _close(self, notify: bool = True) -> None:
+        self.state = CircuitState.CLOSED
+        self.open_seconds = settings.HTTP_BREAKER_OPEN_SECONDS
+        self._outcomes.clear()
+        logger.info(f"上游 {self.origin} 恢复")
+        if notify:
+            self.registry._changed(self, CircuitState.CLOSED)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "retry_in": round(max(self.opened_until - time.monotonic(), 0), 1) if self.state == CircuitState.OPEN else None,
+            "open_seconds": self.open_seconds,
+            "recent_requests": len(self._outcomes),
+            "recent_failures": self._outcomes.count(False),
+            "opened_count": self.opened_count,
+            "rejected": self.rejected,
+            "adaptive_timeouts": {
+                route: timeout for route in self._latency
+                if (timeout := self.timeout(route, math.inf)) != math.inf
+            },
+        }
+
+
+class CircuitBreakerRegistry:
+    """
+    进程级熔断器注册表，每个上游一个熔断器
+
+    本进程判定的打开/关闭通过 pubsub 通知其他进程同步状态，所有进程一起快速失败；
+    同时调用 add_listener 注册的函数（如回写工作节点状态），其他进程同步过来的变化不调用。
+    """
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._listeners: List[StateListener] = []
+
+    def get(self, origin: str) -> CircuitBreaker:
+        breaker = self._breakers.get(origin)
+        if breaker is None:
+            breaker = self._breakers[origin] = CircuitBreaker(self, origin)
+        return breaker
+
+    def is_open(self, origin: str) -> bool:
+        breaker = self._breakers.get(origin)
+        return breaker is not None and breaker.state != CircuitState.CLOSED
+
+    def add_listener(self, fn: StateListener) -> StateListener:
+        """装饰器：注册状态变化监听函数"""
+        self._listeners.append(fn)
+        return fn
+
+    def _changed(self, breaker: CircuitBreaker, state: CircuitState) -> None:
+        for fn in self._listeners:
+            try:
+                fn(breaker.origin, state)
+            except Exception as e:
+                logger.error(f"熔断状态监听函数 {getattr(fn, '__name__', fn)} 执行失败: {e}")
+        pubsub.publish_nowait(
+            CIRCUIT_CHANGED, CircuitChanged(origin=breaker.origin, state=state, open_seconds=breaker.open_seconds)
+        )
+
+    def apply(self, payload: CircuitChanged) -> None:
+        """同步其他进程的状态变化"""
+        breaker = self.get(payload.origin)
+        if payload.state == CircuitState.OPEN and breaker.state == CircuitState.CLOSED:
+            breaker._open(payload.open_seconds, notify=False)
+        elif payload.state == CircuitState.CLOSED and breaker.state != CircuitState.CLOSED:
+            breaker._close(notify=False)
+
+    def clear(self) -> None:
+        self._breakers.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {origin: breaker.stats() for origin, breaker in sorted(self._breakers.items())}
+
+
+circuit_breakers = CircuitBreakerRegistry()
+
+
+@pubsub.subscribe(CIRCUIT_CHANGED)
+def _on_circuit_changed(payload: CircuitChanged) -> None:
+    # 本进程发布时已经是目标状态，apply 不会重复处理
+    circuit_breakers.apply(payload)
@@ -1,5 +1,5 @@
 import asyncio
-import json
+import time
 from enum import Enum
 from types import TracebackType
 from typing import Any, Callable, Dict, List, Optional, Type, Union, TypeVar, cast
@@ -10,7 +10,13 @@ import orjson
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from shared.core.config import settings
 from shared.db.session import get_db
+from shared.utils.circuit_breaker import circuit_breakers, origin_of
+from shared.utils.http_body import BodyCapture
+from shared.utils.http_metrics import ConnectionTrace, classify, http_metrics
+from shared.utils.http_pool import http_pool
+from shared.utils.retry_policy import NO_RETRY, RetryPolicy, retry_budget
 from shared.models.log import LogCategory, LogLevel
 from shared.utils.logger import DBLogger, get_logger
 
@@ -42,7 +48,12 @@ class HttpLogLevel(str, Enum):
 
 
 class AsyncHttpClient:
-    """异步HTTP客户端封装"""
+    """
+    异步HTTP客户端封装
+    
+    连接池启动后，实例只是共享连接池上的轻量视图：底层连接按上游复用，
+    实例本身只保存Cookie、日志工具和拦截器，用完即可丢弃。
+    """
     
     def __init__(
         self,
@@ -50,37 +61,37 @@ class AsyncHttpClient:
         timeout: float = 30.0,
         max_retries: int = 3,
         retry_delay: float = 0.5,
-        retry_backoff: float = 1.5,
+        retry_policy: Optional[RetryPolicy] = None,
         logger: Optional[DBLogger] = None,
         db: Optional[AsyncSession] = None,
         log_level: HttpLogLevel = HttpLogLevel.BASIC,
         headers: Optional[Dict[str, str]] = None,
         cookies: Optional[Dict[str, str]] = None,
         follow_redirects: bool = True,
-        http2: bool = False,
+        http2: Optional[bool] = None,
     ):
         """
         初始化HTTP客户端
         
         Args:
             base_url: 基础URL，所有请求都会基于此URL
-            timeout: 请求超时时间（秒）
-            max_retries: 最大重试次数
-            retry_delay: 初始重试延迟（秒）
-            retry_backoff: 重试延迟的指数增长因子
+            timeout: 请求超时时间（秒），启用熔断时按上游最近的耗时自动缩短
+            max_retries: 最大重试次数（未指定 retry_policy 时使用）
+            retry_delay: 初始重试延迟（秒，未指定 retry_policy 时使用）
+            retry_policy: 重试策略，默认只重试幂等请求
             logger: 日志工具实例
             db: 数据库会话（如果没有提供logger）
             log_level: HTTP日志详细程度
             headers: 默认请求头
             cookies: 默认Cookie
             follow_redirects: 是否自动跟随重定向
-            http2: 是否启用HTTP/2
+            http2: 是否启用HTTP/2，为 None 时使用连接池的设置（未启用连接池时为 HTTP/1.1）
         """
         self.base_url = base_url
         self.timeout = timeout
         self.max_retries = max_retries
         self.retry_delay = retry_delay
-        self.retry_backoff = retry_backoff
+        self.retry_policy = retry_policy or RetryPolicy(max_retries=max_retries, base_delay=retry_delay)
         self.logger = logger
         self.db = db
         self.log_level = log_level
@@ -93,8 +104,7 @@ class AsyncHttpClient:
         self.request_hooks: List[RequestHook] = []
         self.response_hooks: List[ResponseHook] = []
         
-        # 重试条件
-        self.retry_on_status_codes = [500, 502, 503, 504]
+        # 自定义重试条件，满足时按 retry_policy 重试（仍只重试幂等请求）
         self.retry_predicates: List[RetryPredicate] = []
         
         # 客户端实例
@@ -103,14 +113,7 @@ class AsyncHttpClient:
     async def __aenter__(self) -> "AsyncHttpClient":
         """异步上下文管理器入口"""
         if not self.client:
-            self.client = httpx.AsyncClient(
-                base_url=self.base_url,
-                timeout=self.timeout,
-                headers=self.headers,
-                cookies=self.cookies,
-                follow_redirects=self.follow_redirects,
-                http2=self.http2
-            )
+            self.client = self._create_client()
         return self
     
     async def __aexit__(
@@ -124,6 +127,23 @@ class AsyncHttpClient:
             await self.client.aclose()
             self.client = None
     
+    def _create_client(
+        self,
+        timeout: Optional[float] = None,
+        follow_redirects: Optional[bool] = None
+    ) -> httpx.AsyncClient:
+        """创建底层客户端，连接池运行时复用共享连接，HTTP 版本由连接池按 http2 选择"""
+        pooled = http_pool.running
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=timeout or self.timeout,
+            headers=self.headers,
+            cookies=self.cookies,
+            follow_redirects=follow_redirects if follow_redirects is not None else self.follow_redirects,
+            http2=False if pooled else bool(self.http2),
+            transport=http_pool.transport(self.http2) if pooled else None
+        )
+    
     def add_request_hook(self, hook: RequestHook) -> None:
         """添加请求拦截器"""
         self.request_hooks.append(hook)
@@ -148,31 +168,14 @@ class AsyncHttpClient:
             response = hook(response)
         return response
     
-    def _should_retry(self, response: httpx.Response, attempt: int) -> bool:
-        """判断是否应该重试请求"""
-        # 如果已经达到最大重试次数，不再重试
-        if attempt >= self.max_retries:
-            return False
-        
-        # 检查状态码
-        if response.status_code in self.retry_on_status_codes:
-            return True
-        
-        # 执行自定义重试条件
-        for predicate in self.retry_predicates:
-            if predicate(response):
-                return True
-        
-        return False
-    
     async def _log_request(
         self, 
         method: str, 
         url: str, 
         headers: Dict[str, str], 
-        data: Any = None
+        body: Optional[BodyCapture] = None
     ) -> None:
-        """记录请求日志"""
+        """记录请求日志，请求体由日志写入器在写库前解码"""
         if self.log_level == HttpLogLevel.NONE or not self.logger:
             return
         
@@ -182,17 +185,8 @@ class AsyncHttpClient:
         if self.log_level in [HttpLogLevel.HEADERS, HttpLogLevel.BODY]:
             details["headers"] = dict(headers)
         
-        if self.log_level == HttpLogLevel.BODY and data:
-            try:
-                # 尝试将请求体作为JSON或字符串记录
-                if isinstance(data, bytes):
-                    details["body"] = data.decode("utf-8")
-                elif isinstance(data, dict):
-                    details["body"] = data
-                else:
-                    details["body"] = str(data)
-            except Exception:
-                details["body"] = "<无法序列化的请求体>"
+        if self.log_level == HttpLogLevel.BODY and body is not None:
+            details["body"] = body
         
         await self.logger.debug(
             message=log_message,
@@ -207,9 +201,9 @@ class AsyncHttpClient:
         status_code: int, 
         elapsed: float, 
         headers: Dict[str, str], 
-        body: Any = None
+        body: Optional[BodyCapture] = None
     ) -> None:
-        """记录响应日志"""
+        """记录响应日志，响应体由日志写入器在写库前解码"""
         if self.log_level == HttpLogLevel.NONE or not self.logger:
             return
         
@@ -230,20 +224,7 @@ class AsyncHttpClient:
             details["headers"] = dict(headers)
         
         if self.log_level == HttpLogLevel.BODY and body is not None:
-            try:
-                # 尝试将响应体解析为JSON或保存为字符串
-                if isinstance(body, bytes):
-                    body_str = body.decode("utf-8")
-                    try:
-                        details["body"] = json.loads(body_str)
-                    except json.JSONDecodeError:
-                        details["body"] = body_str
-                elif isinstance(body, dict):
-                    details["body"] = body
-                else:
-                    details["body"] = str(body)
-            except Exception:
-                details["body"] = "<无法序列化的响应体>"
+            details["body"] = body
         
         await self.logger.log(
             message=log_message,
@@ -259,12 +240,14 @@ class AsyncHttpClient:
         params: Optional[Dict[str, Any]] = None,
         data: Any = None,
         json: Any = None,
+        content: Optional[Union[str, bytes]] = None,
         headers: Optional[Dict[str, str]] = None,
         cookies: Optional[Dict[str, str]] = None,
         timeout: Optional[float] = None,
         follow_redirects: Optional[bool] = None,
         ignore_retries: bool = False,
-        raise_for_status: bool = True
+        raise_for_status: bool = True,
+        retry_policy: Optional[RetryPolicy] = None,
     ) -> httpx.Response:
         """
         发送HTTP请求
@@ -275,29 +258,27 @@ class AsyncHttpClient:
             params: URL查询参数
             data: 请求体数据
             json: JSON请求体
+            content: 原始请求体（字符串或字节）
             headers: 请求头
             cookies: 请求Cookie
-            timeout: 超时时间（秒）
+            timeout: 超时时间（秒），不指定时使用客户端的超时（可能按最近耗时缩短）
             follow_redirects: 是否跟随重定向
             ignore_retries: 是否忽略重试配置
             raise_for_status: 是否在响应状态错误时抛出异常
+            retry_policy: 本次请求的重试策略，不指定时使用客户端的策略
             
         Returns:
             httpx.Response: HTTP响应对象
+        
+        Raises:
+            CircuitOpenError: 上游熔断中，请求未发出
         """
         if isinstance(method, HttpMethod):
             method = method.value
         
         # 确保客户端已初始化
         if not self.client:
-            self.client = httpx.AsyncClient(
-                base_url=self.base_url,
-                timeout=timeout or self.timeout,
-                headers=self.headers,
-                cookies=self.cookies,
-                follow_redirects=follow_redirects if follow_redirects is not None else self.follow_redirects,
-                http2=self.http2
-            )
+            self.client = self._create_client(timeout, follow_redirects)
         
         # 合并请求头和Cookie
         merged_headers = {**self.headers, **(headers or {})}
@@ -305,47 +286,72 @@ class AsyncHttpClient:
         
         merged_headers["User-Agent"] = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
-        # 记录请求日志
-        if self.logger:
-            await self._log_request(
-                method=method,
-                url=str(httpx.URL(url, params=params)),
-                headers=merged_headers,
-                data=json if json is not None else data
-            )
-        
         if isinstance(json, BaseModel):
             json = json.model_dump(by_alias=False)
 
         if json is not None:
-            # 用 orjson 编码 json 字典为字节流
-            data = orjson.dumps(json)
-            json = None
-            headers = headers or {}
-            headers["Content-Type"] = "application/json"
+            # 用 orjson 编码 json 字典为字节流，请求体日志直接引用编码结果
+            content = orjson.dumps(json)
+            data = None
+            merged_headers.setdefault("Content-Type", "application/json")
         
         # 创建请求对象
         request = self.client.build_request(
             method=method,
             url=url,
             params=params,
+            content=content,
             data=data,
-            json=json,
             headers=merged_headers,
             cookies=merged_cookies,
-            timeout=timeout
+            timeout=timeout if timeout is not None else self.timeout
         )
         
         # 应用请求拦截器
         request = self._apply_request_hooks(request)
         
+        # 记录请求日志
+        if self.logger:
+            await self._log_request(
+                method=method,
+                url=str(request.url),
+                headers=merged_headers,
+                body=BodyCapture.from_request(request, json) if self.log_level == HttpLogLevel.BODY else None
+            )
+        
+        # 按上游熔断；未指定超时时按该路由最近的耗时调整，建立连接的超时单独限制
+        breaker = circuit_breakers.get(origin_of(request.url)) if settings.HTTP_BREAKER_ENABLED else None
+        route = classify(request.url.host, request.url.path)[1]
+        if timeout is None:
+            send_timeout = breaker.timeout(route, self.timeout) if breaker else self.timeout
+            request.extensions["timeout"] = httpx.Timeout(
+                send_timeout, connect=min(send_timeout, settings.HTTP_CONNECT_TIMEOUT)
+            ).as_dict()
+        
+        # 记录每次发送是否复用了连接
+        trace = ConnectionTrace()
+        request.extensions["trace"] = trace
+        
+        policy = NO_RETRY if ignore_retries else (retry_policy or self.retry_policy)
+        retry_budget.record_request()
+        
         response = None
         attempt = 0
+        delay: Optional[float] = None
         start_time = asyncio.get_event_loop().time()
         
         while True:
+            # 熔断中直接抛出 CircuitOpenError，不再重试
+            if breaker:
+                breaker.before_request(request)
+            trace.reset()
+            send_start = time.perf_counter()
             try:
                 response = await self.client.send(request)
+                seconds = time.perf_counter() - send_start
+                http_metrics.observe(request.url, method, str(response.status_code), seconds, reused=not trace.connected)
+                if breaker:
+                    breaker.record(response.status_code < 500, seconds, route)
                 
                 # 应用响应拦截器
                 response = self._apply_response_hooks(response)
@@ -353,31 +359,34 @@ class AsyncHttpClient:
                 # 特殊处理422错误
                 if response.status_code == 422 and self.logger:
                     await self.logger.error(
-                        f"422 Validation Error: {response.text}",
+                        f"422 Validation Error: {method} {url}",
                         category=LogCategory.API,
                         details={
                             "status_code": response.status_code,
                             "method": method,
                             "url": url,
-                            "response": response.json() if response.json() else response.text if response.text else response.content
+                            "response": BodyCapture.from_response(response)
                         }
                     )
                     # 如果不需要重试422错误，直接返回
                     if ignore_retries:
                         break
                 
-                # 判断是否需要重试
+                # 判断是否需要重试：策略允许、Retry-After 不超过上限且重试预算未用完
                 if (
-                    not ignore_retries
-                    and response is not None
-                    and self._should_retry(response, attempt)
+                    policy.retry_response(
+                        request, response, attempt,
+                        force=any(predicate(response) for predicate in self.retry_predicates),
+                    )
+                    and (delay := policy.next_delay(delay, response)) is not None
+                    and policy.spend()
                 ):
                     attempt += 1
-                    delay = self.retry_delay * (self.retry_backoff ** (attempt - 1))
+                    http_metrics.retry(request.url)
                     
                     if self.logger:
                         await self.logger.warning(
-                            f"HTTP请求失败，正在重试({attempt}/{self.max_retries}): {method} {url}",
+                            f"HTTP请求失败，正在重试({attempt}/{policy.max_retries}): {method} {url}",
                             category=LogCategory.API,
                             details={
                                 "status_code": response.status_code,
@@ -391,14 +400,21 @@ class AsyncHttpClient:
                 
                 break
             except httpx.RequestError as e:
-                # 处理请求异常
-                if not ignore_retries and attempt < self.max_retries:
+                http_metrics.observe(request.url, method, type(e).__name__, time.perf_counter() - send_start)
+                if breaker:
+                    breaker.record(False)
+                # 处理请求异常：非幂等请求只在请求没有发出时重试
+                if (
+                    policy.retry_error(request, e, attempt)
+                    and (delay := policy.next_delay(delay)) is not None
+                    and policy.spend()
+                ):
                     attempt += 1
-                    delay = self.retry_delay * (self.retry_backoff ** (attempt - 1))
+                    http_metrics.retry(request.url)
                     
                     if self.logger:
                         await self.logger.error(
-                            f"HTTP请求错误，正在重试({attempt}/{self.max_retries}): {method} {url}",
+                            f"HTTP请求错误，正在重试({attempt}/{policy.max_retries}): {method} {url}",
                             category=LogCategory.API,
                             details={
                                 "error": str(e),
@@ -429,7 +445,7 @@ class AsyncHttpClient:
                 status_code=response.status_code,
                 elapsed=elapsed,
                 headers=dict(response.headers),
-                body=response.content
+                body=BodyCapture.from_response(response) if self.log_level == HttpLogLevel.BODY else None
             )
         
         # 如果需要，检查响应状态
@@ -0,0 +1,126 @@
+from typing import Any, Dict, Mapping, Optional, Union
+
+import httpx
+import orjson
+
+from shared.core.config import settings
+
+# 已解析的响应 JSON 缓存在 response.extensions 中的键
+PARSED_JSON_KEY = "parsed_json"
+
+_MISSING = object()
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def _is_text(content_type: str) -> bool:
+    content_type = content_type.lower()
+    return (
+        not content_type
+        or content_type.startswith("text/")
+        or "json" in content_type
+        or "xml" in content_type
+        or "x-www-form-urlencoded" in content_type
+    )
+
+
+class BodyCapture:
+    """
+    延迟解码的 HTTP 请求/响应体，放在日志 details 中
+
+    只保存对已有字节或已解析对象的引用，不复制、不解析；日志写入器写库前调用 resolve，
+    被日志策略过滤或被缓冲区丢弃的日志完全不做解码。resolve 时：
+
+    - 不超过 max_bytes 且已经解析过（请求的 json 参数、parse_json 缓存的响应）时直接使用解析结果
+    - 不超过 max_bytes 的 JSON 用 orjson 解析一次，其余文本按 max_bytes 截断后解码
+    - 二进制内容（如图片）只记录大小
+    """
+
+    __slots__ = ("content", "content_type", "max_bytes", "_parsed", "_extensions")
+
+    def __init__(
+        self,
+        content: Buffer = b"",
+        content_type: str = "",
+        parsed: Any = _MISSING,
+        extensions: Optional[Mapping[str, Any]] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.content = content
+        self.content_type = content_type
+        self.max_bytes = max_bytes if max_bytes is not None else settings.HTTP_LOG_BODY_MAX_BYTES
+        self._parsed = parsed
+        self._extensions = extensions
+
+    @classmethod
+    def from_request(cls, request: httpx.Request, parsed: Any = None) -> Optional["BodyCapture"]:
+        """请求体，parsed 为调用方传入的 json 对象；流式请求体不记录"""
+        try:
+            content = request.content
+        except httpx.RequestNotRead:
+            return cls("<流式请求体>".encode(), "text/plain")
+        if not content:
+            return None
+        return cls(content, request.headers.get("Content-Type", ""), _MISSING if parsed is None else parsed)
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> Optional["BodyCapture"]:
+        """响应体（需要已读取），resolve 时复用 parse_json 缓存的解析结果"""
+        content = response.content
+        if not content:
+            return None
+        return cls(content, response.headers.get("Content-Type", ""), extensions=response.extensions)
+
+    @property
+    def size(self) -> int:
+        return len(self.content)
+
+    def parsed(self) -> Any:
+        if self._parsed is not _MISSING:
+            return self._parsed
+        if self._extensions is not None:
+            return self._extensions.get(PARSED_JSON_KEY, _MISSING)
+        return _MISSING
+
+    def resolve(self) -> Any:
+        """转换为可以写入 JSON 列的值"""
+        size = self.size
+        if not _is_text(self.content_type):
+            return f"<{self.content_type} {size} 字节>"
+        if size <= self.max_bytes:
+            parsed = self.parsed()
+            if parsed is not _MISSING:
+                return parsed
+            if "json" in self.content_type.lower():
+                try:
+                    return orjson.loads(self.content)
+                except orjson.JSONDecodeError:
+                    pass
+            return str(self.content, "utf-8", "replace")
+        # 按字节截断，只解码前 max_bytes 字节，末尾不完整的字符丢弃
+        preview = str(memoryview(self.content)[:self.max_bytes], "utf-8", "ignore")
+        return f"{preview}...<已截断，共 {size} 字节>"
+
+
+def resolve_details(details: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """把 details 中的 BodyCapture 原地替换为解码后的值"""
+    if details:
+        for key, value in details.items():
+            if isinstance(value, BodyCapture):
+                try:
+                    details[key] = value.resolve()
+                except Exception:
+                    details[key] = f"<无法解码的内容 {value.size} 字节>"
+    return details
+
+
+def parse_json(response: httpx.Response) -> Any:
+    """
+    用 orjson 解析响应 JSON 并缓存在 response.extensions 中，
+    同一响应多次解析（包括记录响应体日志）只解析一次
+    """
+    parsed = response.extensions.get(PARSED_JSON_KEY, _MISSING)
+    if parsed is _MISSING:
+        parsed = orjson.loads(response.content)
+        response.extensions[PARSED_JSON_KEY] = parsed
+    return parsed
@@ -0,0 +1,439 @@
+import asyncio
+import fcntl
+import fnmatch
+import functools
+import json
+import logging
+import math
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+
+from shared.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 上游分组：(名称, 主机通配, 路径模板)，路径模板为 None 时按规则规整路径
+UPSTREAMS: List[Tuple[str, str, Optional[str]]] = [
+    ("worker", "*.xiusmo.com", None),
+    ("bark", "api.day.app", "/{key}/{title}/{message}"),
+    ("ntfy", "ntfy.sh", "/{topic}"),
+    ("turnstile", "challenges.cloudflare.com", None),
+    ("chaoxing", "passport2.chaoxing.com", None),
+]
+
+# 路径中像 ID 的片段（数字、UUID、长十六进制串、过长的片段）替换为 {id}
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F-]{16,}|.{40,})$")
+
+# 延迟直方图：0.5ms 起每翻倍分 8 个桶（相对误差约 9%），最后一个桶收集超出范围的值。
+# 桶边界固定，不同进程的直方图可以直接相加
+_MIN_SECONDS = 0.0005
+_SUB_BUCKETS = 8
+_BUCKETS = 18 * _SUB_BUCKETS + 1
+
+SeriesKey = Tuple[str, str, str, str, str]  # upstream, host, route, method, status
+HostKey = Tuple[str, str]  # upstream, host
+
+# 已退出进程的累计值，保证汇总的计数器只增不减
+RETIRED_SNAPSHOT = "retired.json"
+_RETIRED_LOCK = "retired.lock"
+
+
+def _bucket_bound(index: int) -> float:
+    return _MIN_SECONDS * 2 ** (index / _SUB_BUCKETS)
+
+
+def _bucket_index(seconds: float) -> int:
+    if seconds <= _MIN_SECONDS:
+        return 0
+    return min(math.ceil(math.log2(seconds / _MIN_SECONDS) * _SUB_BUCKETS), _BUCKETS - 1)
+
+
+class LatencyHistogram:
+    """对数线性分桶的延迟直方图（HDR 风格），记录为 O(1)，分位数误差不超过一个桶宽"""
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[_bucket_index(seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantile(self, q: float) -> Optional[float]:
+        """分位数（所在桶的上界），没有数据时返回 None"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return _bucket_bound(index)
+        return _bucket_bound(_BUCKETS - 1)
+
+    def cumulative(self) -> Iterable[Tuple[float, int]]:
+        """Prometheus 桶：每翻倍一个边界，(le, 不超过 le 的数量)"""
+        seen = 0
+        for index, count in enumerate(self.counts[:-1]):
+            seen += count
+            if index % _SUB_BUCKETS == 0:
+                yield _bucket_bound(index), seen
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "buckets": {str(index): count for index, count in enumerate(self.counts) if count},
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls()
+        for index, count in data["buckets"].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data["count"]
+        histogram.sum = data["sum"]
+        return histogram
+
+
+def _merge(snapshots: Iterable[Dict[str, Any]]) -> Tuple[
+    Dict[SeriesKey, LatencyHistogram], Dict[Tuple[str, str, str], int], Dict[HostKey, List[int]]
+]:
+    """把多个快照相加"""
+    histograms: Dict[SeriesKey, LatencyHistogram] = {}
+    retries: Dict[Tuple[str, str, str], int] = defaultdict(int)
+    connections: Dict[HostKey, List[int]] = {}
+    for snapshot in snapshots:
+        for *key, data in snapshot["series"]:
+            histograms.setdefault(tuple(key), LatencyHistogram()).merge(LatencyHistogram.from_dict(data))
+        for *key, count in snapshot["retries"]:
+            retries[tuple(key)] += count
+        for upstream, host, new, reused in snapshot["connections"]:
+            counts = connections.setdefault((upstream, host), [0, 0])
+            counts[0] += new
+            counts[1] += reused
+    return histograms, retries, connections
+
+
+def _dump(
+    histograms: Dict[SeriesKey, LatencyHistogram],
+    retries: Dict[Tuple[str, str, str], int],
+    connections: Dict[HostKey, List[int]],
+) -> Dict[str, Any]:
+    return {
+        "series": [[*key, histogram.to_dict()] for key, histogram in histograms.items()],
+        "retries": [[*key, count] for key, count in retries.items()],
+        "connections": [[*key, new, reused] for key, (new, reused) in connections.items()],
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def classify(host: str, path: str) -> Tuple[str, str]:
+    """把请求归类为 (上游名称, 路由模板)，避免路径中的 key、消息内容等产生大量时间序列"""
+    for name, pattern, template in UPSTREAMS:
+        if fnmatch.fnmatch(host, pattern):
+            return name, template or _normalize_path(path)
+    return "other", _normalize_path(path)
+
+
+def _normalize_path(path: str) -> str:
+    segments = ["{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/")]
+    return "/".join(segments) or "/"
+
+
+class ConnectionTrace:
+    """
+    httpx 的 trace 扩展，记录一次请求是否新建了连接
+
+    httpcore 只在建立新连接时触发 connect_tcp 事件，没有触发说明复用了连接池中的长连接
+    （或 HTTP/2 多路复用）。
+    """
+
+    def __init__(self):
+        self.connected = False
+
+    def reset(self) -> None:
+        self.connected = False
+
+    async def __call__(self, event: str, info: Dict[str, Any]) -> None:
+        if event.endswith("connect_tcp.started"):
+            self.connected = True
+
+
+class HttpMetrics:
+    """
+    HTTP 客户端指标聚合
+
+    AsyncHttpClient 每次发送（包括重试）记录一次：按 上游/主机/路由模板/方法/状态 统计次数和延迟直方图，
+    按主机统计重试次数和连接复用情况，全部在进程内存中累加。
+    gunicorn 多进程时，每个进程每隔 flush_interval 秒把快照写入 directory，
+    /metrics 汇总目录中所有进程的快照，抓取到任何一个进程结果都一致。
+    已退出进程的快照在删除前累加到 retired.json，汇总的 _total 计数器不会因为进程退出而变小，
+    Prometheus 不会把它当成计数器重置。
+    """
+
+    def __init__(self, directory: Optional[str], flush_interval: float = 15.0, max_series: int = 2000):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_series = max_series
+
+        self._histograms: Dict[SeriesKey, LatencyHistogram] = {}
+        self._retries: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self._connections: Dict[HostKey, List[int]] = {}
+        self.dropped_series = 0
+
+        self._task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def _snapshot_path(self) -> str:
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def observe(
+        self,
+        url: httpx.URL,
+        method: str,
+        status: str,
+        seconds: float,
+        reused: Optional[bool] = None,
+    ) -> None:
+        """
+        记录一次发送
+
+        Args:
+            status: 状态码，请求异常时为异常类型名称（如 ConnectTimeout）
+            reused: 是否复用了已有连接，未知时为 None
+        """
+        upstream, route = classify(url.host, url.path)
+        key = (upstream, url.host, route, method, status)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            if len(self._histograms) >= self.max_series:
+                # 超出上限的新序列合并到一个路由中
+                self.dropped_series += 1
+                key = (upstream, url.host, "{other}", method, status)
+                histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+        histogram.observe(seconds)
+        if reused is not None:
+            counts = self._connections.setdefault((upstream, url.host), [0, 0])
+            counts[1 if reused else 0] += 1
+
+    def retry(self, url: httpx.URL) -> None:
+        """记录一次重试"""
+        upstream, route = classify(url.host, url.path)
+        self._retries[(upstream, url.host, route)] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """本进程的指标快照，可序列化为 JSON"""
+        return _dump(self._histograms, self._retries, self._connections)
+
+    def start(self) -> None:
+        """启动定期写入快照的后台任务，需要在事件循环中调用；未配置目录时只统计本进程"""
+        if self.running or not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self._snapshot_path):
+            # PID 被复用：旧进程的快照会被本进程覆盖，先累加到 retired.json
+            self._retire(self._snapshot_path)
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="http-metrics")
+        logger.info(f"HTTP 指标快照已启动，目录: {self.directory}")
+
+    async def stop(self) -> None:
+        """停止后台任务并写入最后一次快照"""
+        if not self._task:
+            return
+        self._closing.set()
+        await self._task
+        self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while not self._closing.is_set():
+            try:
+                await asyncio.wait_for(self._closing.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if not self._closing.is_set():
+                await self.flush()
+
+    async def flush(self) -> None:
+        try:
+            await asyncio.to_thread(self._write, self.snapshot())
+        except Exception as e:
+            logger.warning(f"写入 HTTP 指标快照失败: {e}")
+
+    def _write(self, snapshot: Dict[str, Any], path: Optional[str] = None) -> None:
+        path = path or self._snapshot_path
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(snapshot, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _retire(self, path: str) -> None:
+        """把已退出进程的快照累加到 retired.json 后删除，多个进程同时处理时用文件锁保证只累加一次"""
+        retired_path = os.path.join(self.directory, RETIRED_SNAPSHOT)
+        with open(os.path.join(self.directory, _RETIRED_LOCK), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(path):
+                # 其他进程已经处理
+                return
+            snapshots = []
+            for source in (retired_path, path):
+                try:
+                    with open(source) as f:
+                        snapshots.append(json.load(f))
+                except FileNotFoundError:
+                    pass
+                except ValueError as e:
+                    logger.warning(f"HTTP 指标快照 {os.path.basename(source)} 已损坏，丢弃: {e}")
+            self._write(_dump(*_merge(snapshots)), retired_path)
+            os.remove(path)
+
+    def _read_all(self) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """读取其他进程的快照和已退出进程的累计值，长时间未更新的快照（进程已退出）转入累计值"""
+        snapshots = []
+        if not self.directory or not os.path.isdir(self.directory):
+            return snapshots, None
+        own = self._snapshot_path
+        retired_path = os.path.join(self.directory, RETIRED_SNAPSHOT)
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if not name.endswith(".json") or path in (own, retired_path):
+                continue
+            try:
+                if now - os.path.getmtime(path) > settings.HTTP_METRICS_STALE_SECONDS:
+                    self._retire(path)
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except FileNotFoundError:
+                # 读取前被其他进程转入累计值，由下面读取 retired.json 统计
+                pass
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取 HTTP 指标快照 {name} 失败: {e}")
+        retired = None
+        try:
+            with open(retired_path) as f:
+                retired = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取 HTTP 指标快照 {RETIRED_SNAPSHOT} 失败: {e}")
+        return snapshots, retired
+
+    async def collect(self) -> Dict[str, Any]:
+        """汇总所有进程的指标，本进程使用内存中的最新值"""
+        snapshots, retired = await asyncio.to_thread(self._read_all)
+        snapshots.append(self.snapshot())
+        processes = len(snapshots)
+        if retired is not None:
+            snapshots.append(retired)
+
+        histograms, retries, connections = _merge(snapshots)
+        return {"histograms": histograms, "retries": retries, "connections": connections, "processes": processes}
+
+    async def summary(self) -> Dict[str, Any]:
+        """按上游和主机汇总的请求数、错误数、重试数、连接复用率和延迟分位数"""
+        collected = await self.collect()
+        hosts: Dict[HostKey, Dict[str, Any]] = {}
+        merged: Dict[HostKey, LatencyHistogram] = {}
+        for (upstream, host, route, method, status), histogram in collected["histograms"].items():
+            entry = hosts.setdefault((upstream, host), {"requests": 0, "errors": 0, "statuses": defaultdict(int), "retries": 0})
+            entry["requests"] += histogram.count
+            entry["statuses"][status] += histogram.count
+            if not status.isdigit() or int(status) >= 500:
+                entry["errors"] += histogram.count
+            merged.setdefault((upstream, host), LatencyHistogram()).merge(histogram)
+        for (upstream, host, route), count in collected["retries"].items():
+            if (upstream, host) in hosts:
+                hosts[(upstream, host)]["retries"] += count
+        result = []
+        for key, entry in hosts.items():
+            histogram = merged[key]
+            new, reused = collected["connections"].get(key, (0, 0))
+            result.append({
+                "upstream": key[0],
+                "host": key[1],
+                **entry,
+                "statuses": dict(entry["statuses"]),
+                "connection_reuse_ratio": round(reused / (new + reused), 3) if new + reused else None,
+                "p50_seconds": histogram.quantile(0.5),
+                "p90_seconds": histogram.quantile(0.9),
+                "p99_seconds": histogram.quantile(0.99),
+                "mean_seconds": histogram.sum / histogram.count,
+            })
+        result.sort(key=lambda item: (item["upstream"], item["host"]))
+        return {"processes": collected["processes"], "dropped_series": self.dropped_series, "hosts": result}
+
+    async def render_prometheus(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        collected = await self.collect()
+        lines = [
+            "# HELP fleet_http_client_request_duration_seconds 上游 HTTP 请求耗时（每次发送，包括重试）",
+            "# TYPE fleet_http_client_request_duration_seconds histogram",
+        ]
+        for key, histogram in sorted(collected["histograms"].items()):
+            labels = _labels(zip(("upstream", "host", "route", "method", "status"), key))
+            for bound, count in histogram.cumulative():
+                lines.append(f'fleet_http_client_request_duration_seconds_bucket{{{labels},le="{bound:g}"}} {count}')
+            lines.append(f'fleet_http_client_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"fleet_http_client_request_duration_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+            lines.append(f"fleet_http_client_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+        lines += [
+            "# HELP fleet_http_client_retries_total 上游 HTTP 请求重试次数",
+            "# TYPE fleet_http_client_retries_total counter",
+        ]
+        for key, count in sorted(collected["retries"].items()):
+            lines.append(f"fleet_http_client_retries_total{{{_labels(zip(('upstream', 'host', 'route'), key))}}} {count}")
+
+        lines += [
+            "# HELP fleet_http_client_connections_total 上游 HTTP 请求使用的连接，reused 表示复用长连接",
+            "# TYPE fleet_http_client_connections_total counter",
+        ]
+        for (upstream, host), (new, reused) in sorted(collected["connections"].items()):
+            labels = _labels((("upstream", upstream), ("host", host)))
+            lines.append(f'fleet_http_client_connections_total{{{labels},reused="false"}} {new}')
+            lines.append(f'fleet_http_client_connections_total{{{labels},reused="true"}} {reused}')
+
+        lines += [
+            "# HELP fleet_http_client_metrics_processes 汇总了快照的进程数",
+            "# TYPE fleet_http_client_metrics_processes gauge",
+            f"fleet_http_client_metrics_processes {collected['processes']}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+http_metrics = HttpMetrics(
+    directory=settings.HTTP_METRICS_DIR,
+    flush_interval=settings.HTTP_METRICS_FLUSH_INTERVAL,
+    max_series=settings.HTTP_METRICS_MAX_SERIES,
+)
@@ -0,0 +1,164 @@
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+from shared.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 连接池以 (scheme, host, port) 区分上游
+Origin = Tuple[str, str, int]
+# 同一上游的 HTTP/1.1 和 HTTP/2 连接池分开
+PoolKey = Tuple[Origin, bool]
+
+
+class _OriginStats:
+    """单个上游的请求计数"""
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.errors = 0
+
+
+class HttpClientRegistry(httpx.AsyncBaseTransport):
+    """
+    应用级 HTTP 连接池注册表
+
+    为每个上游（如 {subdomain}.xiusmo.com）维护一个保持长连接的连接池。
+    AsyncHttpClient 只是挂在注册表上的轻量视图，自己保存 Cookie、日志和拦截器，
+    底层连接在所有视图之间复用。默认使用 http2 参数的协议，AsyncHttpClient 指定了 http2 时
+    通过 transport(http2) 取得对应协议的视图，同一上游按协议分别维护连接池。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.running = False
+
+        self._transports: Dict[PoolKey, httpx.AsyncHTTPTransport] = {}
+        self._stats: Dict[PoolKey, _OriginStats] = {}
+        self._views: Dict[bool, "_PoolView"] = {}
+        self._h2_available: Optional[bool] = None
+
+    def _supports_h2(self) -> bool:
+        if self._h2_available is None:
+            try:
+                import h2  # noqa: F401
+                self._h2_available = True
+            except ImportError:
+                logger.warning("未安装 h2，HTTP 连接池将使用 HTTP/1.1")
+                self._h2_available = False
+        return self._h2_available
+
+    def start(self) -> None:
+        """启用连接池，之后创建的 AsyncHttpClient 都会复用连接"""
+        if self.http2 and not self._supports_h2():
+            self.http2 = False
+        self.running = True
+        logger.info(f"HTTP 连接池已启动，HTTP/2: {self.http2}")
+
+    async def close(self) -> None:
+        """关闭所有上游连接池"""
+        self.running = False
+        for transport in self._transports.values():
+            await transport.aclose()
+        self._transports.clear()
+        logger.info("HTTP 连接池已关闭")
+
+    async def aclose(self) -> None:
+        # 视图关闭时不应关闭共享连接池，统一由 close() 释放
+        pass
+
+    def transport(self, http2: Optional[bool] = None) -> httpx.AsyncBaseTransport:
+        """指定协议的连接池视图，http2 为 None 时使用连接池默认协议；未安装 h2 时退回 HTTP/1.1"""
+        if http2 and not self._supports_h2():
+            http2 = False
+        if http2 is None or http2 == self.http2:
+            return self
+        view = self._views.get(http2)
+        if view is None:
+            view = self._views[http2] = _PoolView(self, http2)
+        return view
+
+    def _get_transport(self, key: PoolKey) -> httpx.AsyncHTTPTransport:
+        transport = self._transports.get(key)
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(limits=self.limits, http2=key[1])
+            self._transports[key] = transport
+            self._stats[key] = _OriginStats()
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request, http2: Optional[bool] = None) -> httpx.Response:
+        origin = (request.url.scheme, request.url.host, request.url.port or (443 if request.url.scheme == "https" else 80))
+        key = (origin, self.http2 if http2 is None else http2)
+        transport = self._get_transport(key)
+        stats = self._stats[key]
+        stats.requests += 1
+        stats.in_flight += 1
+        try:
+            return await transport.handle_async_request(request)
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """获取各上游连接池的使用情况"""
+        origins = {}
+        for (origin, http2), transport in self._transports.items():
+            stats = self._stats[(origin, http2)]
+            # httpcore 连接池的连接列表，用于统计空闲/活跃连接
+            connections = getattr(getattr(transport, "_pool", None), "connections", [])
+            idle = sum(1 for conn in connections if conn.is_idle())
+            scheme, host, port = origin
+            origins[f"{scheme}://{host}:{port}" + (" (HTTP/2)" if http2 != self.http2 else "")] = {
+                "requests": stats.requests,
+                "in_flight": stats.in_flight,
+                "errors": stats.errors,
+                "connections": len(connections),
+                "idle_connections": idle,
+                "active_connections": len(connections) - idle,
+            }
+        return {
+            "running": self.running,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "origins": origins,
+        }
+
+
+class _PoolView(httpx.AsyncBaseTransport):
+    """使用非默认协议的连接池视图，连接仍由注册表管理"""
+
+    def __init__(self, pool: HttpClientRegistry, http2: bool):
+        self.pool = pool
+        self.http2 = http2
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.pool.handle_async_request(request, http2=self.http2)
+
+    async def aclose(self) -> None:
+        pass
+
+
+http_pool = HttpClientRegistry(
+    max_connections=settings.HTTP_POOL_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.HTTP_POOL_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.HTTP_POOL_KEEPALIVE_EXPIRY,
+    http2=settings.HTTP_POOL_HTTP2,
+)
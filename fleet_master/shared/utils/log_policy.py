@@ -0,0 +1,143 @@
+import logging
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from shared.core.config import Settings, settings
+from shared.models.log import LogCategory, LogLevel
+from shared.schemas.log import LogPolicyConfig, LogRateLimit
+from shared.utils.pubsub import LOG_POLICY_CHANGED, LogPolicyChanged, pubsub
+
+logger = logging.getLogger(__name__)
+
+LEVEL_ORDER = {level: index for index, level in enumerate(LogLevel)}
+
+
+class _TokenBucket:
+    def __init__(self, limit: LogRateLimit):
+        self.limit = limit
+        self.tokens = float(limit.burst)
+        self.updated_at = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.limit.burst, self.tokens + (now - self.updated_at) * self.limit.rate)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class LogPolicy:
+    """
+    数据库日志写入策略
+
+    DBLogger 写库前调用 allow 判断是否写入，依次检查：
+    1. 级别不低于 keep_level 的日志（错误）总是写入
+    2. 低于类别最低级别的丢弃
+    3. 按类别抽样，只写入一部分成功路径的日志
+    4. 按 source 令牌桶限速，避免单个调用点刷屏
+    签到结果、安全审计等 exempt_categories 中的类别只受最低级别限制，不抽样也不限速。
+    被丢弃的日志按原因、类别和 source 计数。控制台输出不受影响。
+    策略在进程内存中，通过 pubsub 广播给所有进程热更新，进程重启后恢复为配置中的 LOG_POLICY。
+    """
+
+    def __init__(self, config: LogPolicyConfig):
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self.suppressed: Counter = Counter()
+        self.suppressed_sources: Counter = Counter()
+        self.kept = 0
+        self.apply(config)
+
+    def apply(self, config: LogPolicyConfig) -> None:
+        """替换当前策略，限速状态重新开始"""
+        self.config = config
+        self._keep_level = LEVEL_ORDER[config.keep_level]
+        self._min_levels = {category: LEVEL_ORDER[level] for category, level in config.min_levels.items()}
+        self._default_min_level = LEVEL_ORDER[config.default_min_level]
+        self._exempt = frozenset(config.exempt_categories)
+        # 最长前缀优先
+        self._source_rates: List[Tuple[str, LogRateLimit]] = sorted(
+            config.source_rates.items(), key=lambda item: len(item[0]), reverse=True
+        )
+        self._buckets.clear()
+        self.updated_at = time.time()
+
+    def _rate_limit(self, source: str) -> Optional[LogRateLimit]:
+        for prefix, limit in self._source_rates:
+            if source.startswith(prefix):
+                return limit
+        return self.config.source_rate
+
+    def allow(self, level: LogLevel, category: LogCategory, source: Optional[str]) -> bool:
+        """判断日志是否写入数据库"""
+        rank = LEVEL_ORDER[level]
+        if rank >= self._keep_level:
+            self.kept += 1
+            return True
+
+        reason = None
+        if rank < self._min_levels.get(category, self._default_min_level):
+            reason = "level"
+        elif category in self._exempt:
+            pass
+        else:
+            rate = self.config.sample_rates.get(category)
+            if rate is not None and random.random() >= rate:
+                reason = "sampled"
+            else:
+                source = source or ""
+                limit = self._rate_limit(source)
+                if limit is not None:
+                    bucket = self._buckets.get(source)
+                    if bucket is None:
+                        bucket = self._buckets[source] = _TokenBucket(limit)
+                    if not bucket.take():
+                        reason = "rate_limited"
+
+        if reason is None:
+            self.kept += 1
+            return True
+        self.suppressed[(reason, category.value)] += 1
+        self.suppressed_sources[source or ""] += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        by_reason: Counter = Counter()
+        by_category: Counter = Counter()
+        for (reason, category), count in self.suppressed.items():
+            by_reason[reason] += count
+            by_category[category] += count
+        return {
+            "policy": self.config.model_dump(mode="json"),
+            "updated_at": self.updated_at,
+            "kept": self.kept,
+            "suppressed": sum(by_reason.values()),
+            "suppressed_by_reason": dict(by_reason),
+            "suppressed_by_category": dict(by_category),
+            "top_suppressed_sources": dict(self.suppressed_sources.most_common(20)),
+        }
+
+
+log_policy = LogPolicy(LogPolicyConfig.model_validate(settings.LOG_POLICY))
+
+
+def reload_from_settings() -> LogPolicyConfig:
+    """重新读取配置（环境变量和 .env 文件）中的 LOG_POLICY"""
+    return LogPolicyConfig.model_validate(Settings().LOG_POLICY)
+
+
+async def update_log_policy(config: LogPolicyConfig) -> None:
+    """更新本进程的策略并通知其他进程"""
+    await pubsub.publish(LOG_POLICY_CHANGED, LogPolicyChanged(policy=config.model_dump(mode="json")))
+
+
+@pubsub.subscribe(LOG_POLICY_CHANGED)
+def _on_log_policy_changed(payload: LogPolicyChanged) -> None:
+    try:
+        log_policy.apply(LogPolicyConfig.model_validate(payload.policy))
+        logger.info("日志写入策略已更新")
+    except Exception as e:
+        logger.error(f"无法应用日志写入策略: {e}")
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+
+from shared.core.config import settings
+from shared.db.session import async_session
+from shared.models.log import Log
+from shared.utils.http_body import resolve_details
+
+logger = logging.getLogger(__name__)
+
+
+class OverflowPolicy:
+    """缓冲区满时的处理策略"""
+    DROP_NEWEST = "drop_newest"  # 丢弃新到的日志
+    DROP_OLDEST = "drop_oldest"  # 丢弃队列中最旧的日志
+
+
+class LogSink:
+    """
+    进程级日志写入器
+
+    调用方只负责把日志行放入有界队列，后台任务按批量大小或时间阈值
+    将日志以多行 INSERT 的方式一次性写入数据库，日志写入不再占用调用方的会话和事务。
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        overflow_policy: str = OverflowPolicy.DROP_NEWEST,
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+
+        self.queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+
+        # 统计计数
+        self.queued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.last_flush_at: Optional[float] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """启动后台写入任务，需要在事件循环中调用"""
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="log-sink")
+        logger.info(f"日志写入器已启动，缓冲区大小 {self.max_size}，批量大小 {self.batch_size}")
+
+    async def stop(self) -> None:
+        """停止后台任务，并把缓冲区中剩余的日志全部写入"""
+        if not self._task:
+            return
+        self._closing.set()
+        await self._task
+        self._task = None
+
+        while not self.queue.empty():
+            await self._flush(self._drain(self.batch_size))
+        logger.info(f"日志写入器已停止，累计写入 {self.flushed} 条，丢弃 {self.dropped} 条")
+
+    def put(self, row: Dict[str, Any]) -> bool:
+        """
+        非阻塞地放入一条日志
+
+        Returns:
+            bool: 日志是否进入缓冲区
+        """
+        row.setdefault("created_at", datetime.now(timezone.utc))
+        row.setdefault("updated_at", row["created_at"])
+        try:
+            self.queue.put_nowait(row)
+        except asyncio.QueueFull:
+            if self.overflow_policy != OverflowPolicy.DROP_OLDEST:
+                self.dropped += 1
+                return False
+            # 丢弃最旧的一条，为新日志腾出位置
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.queue.put_nowait(row)
+        self.queued += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """获取写入器状态"""
+        return {
+            "running": self.running,
+            "pending": self.queue.qsize() if self.queue else 0,
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+            "overflow_policy": self.overflow_policy,
+            "queued": self.queued,
+            "dropped": self.dropped,
+            "flushed": self.flushed,
+            "failed": self.failed,
+            "last_flush_at": self.last_flush_at,
+        }
+
+    def _drain(self, limit: int) -> List[Dict[str, Any]]:
+        """从队列中取出至多 limit 条日志"""
+        rows = []
+        while len(rows) < limit and not self.queue.empty():
+            rows.append(self.queue.get_nowait())
+        return rows
+
+    async def _run(self) -> None:
+        while not self._closing.is_set():
+            # 等待第一条日志，然后在时间窗口内尽量攒满一批
+            try:
+                rows = [await asyncio.wait_for(self.queue.get(), self.flush_interval)]
+            except asyncio.TimeoutError:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                rows.extend(self._drain(self.batch_size - len(rows)))
+                if len(rows) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(rows)
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        """批量写入一组日志，失败时丢弃该批次以免阻塞后续日志"""
+        if not rows:
+            return
+        # 调用方放入的请求/响应体（BodyCapture）在这里才解码
+        for row in rows:
+            resolve_details(row.get("details"))
+        try:
+            async with async_session() as db:
+                await db.execute(insert(Log), rows)
+                await db.commit()
+            self.flushed += len(rows)
+            self.last_flush_at = time.time()
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"批量写入 {len(rows)} 条日志失败: {e}")
+
+
+log_sink = LogSink(
+    max_size=settings.LOG_SINK_MAX_SIZE,
+    batch_size=settings.LOG_SINK_BATCH_SIZE,
+    flush_interval=settings.LOG_SINK_FLUSH_INTERVAL,
+    overflow_policy=settings.LOG_SINK_OVERFLOW_POLICY,
+)
@@ -1,6 +1,6 @@
 import logging
 import functools
-import inspect
+import reprlib
 from typing import Dict, Any, Optional, Callable, TypeVar, Awaitable
 
 from fastapi import Depends
@@ -8,27 +8,63 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from shared.db.session import get_db
 from shared.models.log import LogLevel, LogCategory
-from app.services.log import add_log, log_exception
+from app.services.log import add_log, caller_source, log_exception
+from shared.utils.log_policy import log_policy
 
 # 标准logger，用于控制台输出
 logger = logging.getLogger("app")
 
+# 记录函数参数时限制长度，避免大对象写入日志
+_repr = reprlib.Repr()
+_repr.maxstring = 200
+_repr.maxother = 200
+
 # 类型定义
 T = TypeVar("T")
 AsyncFunc = Callable[..., Awaitable[T]]
 
 
+# 日志级别对应的标准logger级别
+_STD_LEVELS = {
+    LogLevel.DEBUG: logging.DEBUG,
+    LogLevel.INFO: logging.INFO,
+    LogLevel.WARNING: logging.WARNING,
+    LogLevel.ERROR: logging.ERROR,
+    LogLevel.CRITICAL: logging.CRITICAL,
+}
+
+# bind 可以绑定的字段
+_BIND_FIELDS = frozenset({"source", "category", "user_id", "task_id", "worker_id"})
+
+
 class DBLogger:
-    """数据库日志工具类"""
+    """
+    数据库日志工具类
+
+    写库前按 log_policy 过滤（最低级别、抽样、限速），被过滤的日志只输出到控制台，log 返回 None。
+    未指定 source 时使用调用者位置（按调用点缓存），同一上下文多次记录日志时用 bind 绑定
+    source、user_id 等字段，省去每次查找调用者：
+
+        logger = DBLogger(db).bind(source="app.services.sign", user_id=user.id)
+        await logger.info("签到成功", category=LogCategory.TASK)
+    """
     
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, **context):
         self.db = db
+        self.context = context
+    
+    def bind(self, **context) -> "DBLogger":
+        """返回绑定了默认字段的子 logger，调用时显式传入的参数优先"""
+        unknown = set(context) - _BIND_FIELDS
+        if unknown:
+            raise TypeError(f"不支持绑定的字段: {', '.join(sorted(unknown))}")
+        return DBLogger(self.db, **{**self.context, **context})
     
     async def log(
         self,
         message: str,
         level: LogLevel = LogLevel.INFO,
-        category: LogCategory = LogCategory.OTHER,
+        category: LogCategory = None,
         details: Dict[str, Any] = None,
         source: str = None,
         user_id: Optional[int] = None,
@@ -36,29 +72,28 @@ class DBLogger:
         worker_id: Optional[int] = None
     ):
         """记录日志到数据库"""
-        # 如果没有指定source，尝试自动获取调用者信息
+        context = self.context
+        if context:
+            source = source or context.get("source")
+            category = category or context.get("category")
+            user_id = user_id or context.get("user_id")
+            task_id = task_id or context.get("task_id")
+            worker_id = worker_id or context.get("worker_id")
+        category = category or LogCategory.OTHER
+        # 如果没有指定source，使用调用者信息
         if not source:
-            frame = inspect.currentframe().f_back
-            if frame:
-                module = frame.f_globals.get('__name__', '')
-                func = frame.f_code.co_name
-                source = f"{module}.{func}"
+            source = caller_source()
         
-        # 同时输出到控制台
-        log_msg = f"[{level}] {message}"
-        if category != LogCategory.OTHER:
-            log_msg = f"[{category}] {log_msg}"
+        # 同时输出到控制台，级别未启用时不拼接消息
+        std_level = _STD_LEVELS[level]
+        if logger.isEnabledFor(std_level):
+            log_msg = f"[{level}] {message}"
+            if category != LogCategory.OTHER:
+                log_msg = f"[{category}] {log_msg}"
+            logger.log(std_level, log_msg)
         
-        if level == LogLevel.DEBUG:
-            logger.debug(log_msg)
-        elif level == LogLevel.INFO:
-            logger.info(log_msg)
-        elif level == LogLevel.WARNING:
-            logger.warning(log_msg)
-        elif level == LogLevel.ERROR:
-            logger.error(log_msg)
-        elif level == LogLevel.CRITICAL:
-            logger.critical(log_msg)
+        if not log_policy.allow(level, category, source):
+            return None
         
         # 记录到数据库
         return await add_log(
@@ -95,6 +130,9 @@ class DBLogger:
     
     async def exception(self, exc: Exception, message: str = None, **kwargs):
         """记录异常"""
+        for field, value in self.context.items():
+            if kwargs.get(field) is None:
+                kwargs[field] = value
         return await log_exception(
             db=self.db,
             exception=exc,
@@ -122,6 +160,10 @@ def log_operation(
         ...
     """
     def decorator(func: AsyncFunc) -> AsyncFunc:
+        # 获取函数信息
+        func_name = func.__name__
+        source = f"{func.__module__}.{func_name}"
+        
         @functools.wraps(func)
         async def wrapper(*args, **kwargs):
             # 尝试从参数中获取db会话
@@ -144,11 +186,6 @@ def log_operation(
             # 创建日志工具
             db_logger = DBLogger(db)
             
-            # 获取函数信息
-            func_name = func.__name__
-            module_name = func.__module__
-            source = f"{module_name}.{func_name}"
-            
             # 构建日志消息
             log_message = message or f"执行函数 {func_name}"
             
@@ -170,7 +207,7 @@ def log_operation(
                     user_id=user_id,
                     task_id=task_id,
                     worker_id=worker_id,
-                    details={"args": str(args), "kwargs": str(kwargs)}
+                    details={"args": _repr.repr(args), "kwargs": _repr.repr(kwargs)}
                 )
                 
                 # 执行原函数
@@ -195,6 +232,7 @@ def log_operation(
                     exc=e,
                     message=f"{log_message} - 失败",
                     category=category,
+                    source=source,
                     user_id=user_id,
                     task_id=task_id,
                     worker_id=worker_id
@@ -0,0 +1,272 @@
+import asyncio
+import inspect
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Generic, List, Optional, Set, Type, TypeVar, Union
+
+import asyncpg
+from pydantic import BaseModel
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+
+from shared.core.config import settings
+from shared.db.session import engine
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T", bound=BaseModel)
+Handler = Callable[[Any], Union[None, Awaitable[None]]]
+
+
+class Channel(Generic[T]):
+    """
+    带类型的通知频道
+
+    payload 使用 pydantic 模型序列化为 JSON，Postgres 限制单条通知不超过 8000 字节，
+    只适合传递 ID 等少量数据。
+    """
+
+    def __init__(self, name: str, payload_type: Type[T]):
+        self.name = name
+        self.payload_type = payload_type
+
+    def __repr__(self):
+        return f"<Channel {self.name}>"
+
+
+class PubSub:
+    """
+    基于 Postgres LISTEN/NOTIFY 的进程间发布/订阅
+
+    每个进程使用一条独立的 asyncpg 连接监听所有已订阅的频道，连接断开后按指数退避自动重连。
+    发布时先在本进程内同步调用订阅函数，再通过 pg_notify 通知其他进程，
+    各进程忽略自己发出的通知。重连期间的通知会丢失，重连成功后调用 on_reconnect 注册的函数
+    （通常是清空整个缓存）。
+    """
+
+    def __init__(self, health_check_interval: float = 30.0):
+        self.health_check_interval = health_check_interval
+        self.origin = uuid.uuid4().hex
+        self._channels: Dict[str, Channel] = {}
+        self._handlers: Dict[str, List[Handler]] = defaultdict(list)
+        self._reconnect_handlers: List[Callable[[], Any]] = []
+        self._pending: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+        self.connected = False
+
+        # 统计计数
+        self.published = 0
+        self.received = 0
+        self.handler_errors = 0
+        self.publish_errors = 0
+        self.reconnects = 0
+        self.connected_at: Optional[float] = None
+
+    def subscribe(self, channel: Channel[T]) -> Callable[[Handler], Handler]:
+        """
+        装饰器：注册频道的处理函数，本进程和其他进程发布的消息都会调用
+
+        处理函数接收 payload 模型实例，可以是普通函数或协程函数。
+        需要在 start 之前注册（通常在模块导入时），之后新增的频道要等重连后才会监听。
+        """
+        def decorator(fn: Handler) -> Handler:
+            self._channels[channel.name] = channel
+            self._handlers[channel.name].append(fn)
+            return fn
+        return decorator
+
+    def on_reconnect(self, fn: Callable[[], Any]) -> Callable[[], Any]:
+        """装饰器：注册监听连接（重新）建立后调用的函数，用于丢弃可能错过失效通知的缓存"""
+        self._reconnect_handlers.append(fn)
+        return fn
+
+    async def publish(self, channel: Channel[T], payload: T) -> None:
+        """在本进程内分发消息并通知其他进程，通知失败只记录日志"""
+        self._dispatch(channel.name, payload)
+        await self._notify(channel, payload)
+
+    def publish_nowait(self, channel: Channel[T], payload: T) -> None:
+        """
+        同步版本的 publish：本进程内立即分发，通知其他进程在后台完成
+
+        用于不方便 await 的缓存失效函数。
+        """
+        self._dispatch(channel.name, payload)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._notify(channel, payload))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _notify(self, channel: Channel[T], payload: T) -> None:
+        self.published += 1
+        if engine.dialect.name != "postgresql":
+            return
+        message = json.dumps({"origin": self.origin, "payload": payload.model_dump(mode="json")})
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(select(func.pg_notify(channel.name, message)))
+                await conn.commit()
+        except Exception as e:
+            self.publish_errors += 1
+            logger.warning(f"发送 {channel.name} 通知失败: {e}")
+
+    def _dispatch(self, name: str, payload: BaseModel) -> None:
+        for handler in self._handlers.get(name, ()):
+            try:
+                result = handler(payload)
+                if inspect.isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._pending.add(task)
+                    task.add_done_callback(self._on_handler_done)
+            except Exception as e:
+                self.handler_errors += 1
+                logger.error(f"{name} 处理函数 {getattr(handler, '__name__', handler)} 执行失败: {e}")
+
+    def _on_handler_done(self, task: asyncio.Task) -> None:
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self.handler_errors += 1
+            logger.error(f"通知处理函数执行失败: {task.exception()}")
+
+    def _on_notify(self, connection, pid, channel_name, data) -> None:
+        channel = self._channels.get(channel_name)
+        if channel is None:
+            return
+        try:
+            message = json.loads(data)
+            if message.get("origin") == self.origin:
+                return
+            payload = channel.payload_type.model_validate(message["payload"])
+        except Exception as e:
+            logger.warning(f"无法解析 {channel_name} 通知: {e}")
+            return
+        self.received += 1
+        self._dispatch(channel_name, payload)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """启动监听任务，需要在事件循环中调用；非 Postgres 数据库时只做进程内分发"""
+        if self.running or engine.dialect.name != "postgresql":
+            return
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._listen(), name="pubsub-listener")
+
+    async def stop(self) -> None:
+        """停止监听，并等待已发出的通知完成"""
+        if self._task:
+            self._closing.set()
+            await self._task
+            self._task = None
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "connected": self.connected,
+            "connected_at": self.connected_at,
+            "channels": sorted(self._channels),
+            "published": self.published,
+            "received": self.received,
+            "handler_errors": self.handler_errors,
+            "publish_errors": self.publish_errors,
+            "reconnects": self.reconnects,
+        }
+
+    async def _listen(self) -> None:
+        dsn = make_url(str(settings.DATABASE_URL)).set(drivername="postgresql").render_as_string(hide_password=False)
+        delay = 1.0
+        while not self._closing.is_set():
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                lost = asyncio.Event()
+                connection.add_termination_listener(lambda _: lost.set())
+                for name in self._channels:
+                    await connection.add_listener(name, self._on_notify)
+                if self.connected_at is not None:
+                    self.reconnects += 1
+                self.connected = True
+                self.connected_at = time.time()
+                delay = 1.0
+                logger.info(f"通知监听已连接，频道: {', '.join(sorted(self._channels))}")
+                # 断开期间可能错过通知
+                for fn in self._reconnect_handlers:
+                    try:
+                        result = fn()
+                        if inspect.isawaitable(result):
+                            await result
+                    except Exception as e:
+                        logger.error(f"重连处理函数 {getattr(fn, '__name__', fn)} 执行失败: {e}")
+
+                # 连接被动断开时 asyncpg 不一定能察觉，定期检查
+                while not self._closing.is_set() and not lost.is_set():
+                    try:
+                        await asyncio.wait_for(self._closing.wait(), self.health_check_interval)
+                    except asyncio.TimeoutError:
+                        await asyncio.wait_for(connection.execute("SELECT 1"), 10)
+            except Exception as e:
+                logger.warning(f"通知监听连接失败，{delay:.0f} 秒后重试: {e}")
+            finally:
+                self.connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            if not self._closing.is_set():
+                try:
+                    await asyncio.wait_for(self._closing.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                delay = min(delay * 2, 30.0)
+
+
+pubsub = PubSub()
+
+
+# 缓存失效频道
+class UserChanged(BaseModel):
+    user_id: int
+
+
+class WorkerChanged(BaseModel):
+    worker_name: str
+
+
+class ActivityChanged(BaseModel):
+    activity_id: str
+
+
+class SignConfigChanged(BaseModel):
+    user_id: int
+
+
+class NodeKeyChanged(BaseModel):
+    node_name: str
+
+
+class LogPolicyChanged(BaseModel):
+    policy: Dict[str, Any]
+
+
+class CircuitChanged(BaseModel):
+    origin: str
+    state: str
+    open_seconds: float = 0.0
+
+
+USER_CHANGED = Channel("user_changed", UserChanged)
+WORKER_CHANGED = Channel("worker_changed", WorkerChanged)
+ACTIVITY_CHANGED = Channel("activity_changed", ActivityChanged)
+SIGN_CONFIG_CHANGED = Channel("sign_config_changed", SignConfigChanged)
+NODE_KEY_CHANGED = Channel("node_key_changed", NodeKeyChanged)
+LOG_POLICY_CHANGED = Channel("log_policy_changed", LogPolicyChanged)
+CIRCUIT_CHANGED = Channel("circuit_changed", CircuitChanged)
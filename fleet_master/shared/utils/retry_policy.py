@@ -0,0 +1,163 @@
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Tuple
+
+import httpx
+
+from shared.core.config import settings
+
+# 重复执行结果相同的方法，失败后可以安全重试
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+
+# 请求一定没有发到上游的错误，任何方法都可以重试
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class RetryBudget:
+    """
+    进程级重试预算
+
+    最近 window 秒内的重试次数不超过 min_per_second * window + ratio * 请求数，
+    上游故障时重试最多给它增加 ratio 比例的额外负载，而不是每个请求都重试 max_retries 次。
+    按秒分桶计数，判断为 O(window)。
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, window: int = 10):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self._seconds = [0] * window
+        self._requests = [0] * window
+        self._retries = [0] * window
+        self.exhausted = 0
+
+    def _slot(self) -> int:
+        second = int(time.monotonic())
+        slot = second % self.window
+        if self._seconds[slot] != second:
+            self._seconds[slot] = second
+            self._requests[slot] = 0
+            self._retries[slot] = 0
+        return slot
+
+    def _totals(self) -> Tuple[int, int]:
+        oldest = int(time.monotonic()) - self.window
+        requests = retries = 0
+        for second, request_count, retry_count in zip(self._seconds, self._requests, self._retries):
+            if second > oldest:
+                requests += request_count
+                retries += retry_count
+        return requests, retries
+
+    def record_request(self) -> None:
+        """记录一次新请求（不包括重试）"""
+        self._requests[self._slot()] += 1
+
+    def try_spend(self) -> bool:
+        """预算允许时记录一次重试并返回 True"""
+        slot = self._slot()
+        requests, retries = self._totals()
+        if retries >= self.min_per_second * self.window + self.ratio * requests:
+            self.exhausted += 1
+            return False
+        self._retries[slot] += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        requests, retries = self._totals()
+        return {
+            "ratio": self.ratio,
+            "window": self.window,
+            "requests": requests,
+            "retries": retries,
+            "exhausted": self.exhausted,
+        }
+
+
+retry_budget = RetryBudget(
+    ratio=settings.HTTP_RETRY_BUDGET_RATIO,
+    min_per_second=settings.HTTP_RETRY_BUDGET_MIN_PER_SECOND,
+    window=settings.HTTP_RETRY_BUDGET_WINDOW,
+)
+
+
+class RetryPolicy:
+    """
+    HTTP 请求重试策略，可以按调用点传给 AsyncHttpClient 或单次请求
+
+    - 只重试幂等方法；带幂等键请求头（idempotency_header）的请求视为幂等，
+      非幂等请求只在请求没有发出（连接失败）时重试
+    - 延迟使用去相关抖动（decorrelated jitter）：在 [base_delay, 上一次延迟 * 3] 之间随机，
+      不超过 max_delay，多个进程不会同时重试
+    - 响应带 Retry-After 时按它等待，超过 max_retry_after 时不再重试
+    - 每次重试消耗进程级重试预算，预算用完时直接返回失败结果
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: Optional[float] = None,
+        retry_on_status: Iterable[int] = (429, 500, 502, 503, 504),
+        methods: FrozenSet[str] = IDEMPOTENT_METHODS,
+        idempotency_header: Optional[str] = "Idempotency-Key",
+        max_retry_after: Optional[float] = None,
+        use_budget: bool = True,
+    ):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay if max_delay is not None else settings.HTTP_RETRY_MAX_DELAY
+        self.retry_on_status = frozenset(retry_on_status)
+        self.methods = methods
+        self.idempotency_header = idempotency_header
+        self.max_retry_after = max_retry_after if max_retry_after is not None else settings.HTTP_RETRY_MAX_RETRY_AFTER
+        self.use_budget = use_budget
+
+    def is_idempotent(self, request: httpx.Request) -> bool:
+        return request.method in self.methods or (
+            self.idempotency_header is not None and self.idempotency_header in request.headers
+        )
+
+    def retry_response(self, request: httpx.Request, response: httpx.Response, attempt: int, force: bool = False) -> bool:
+        """响应是否需要重试，force 为调用方自定义条件的结果"""
+        if attempt >= self.max_retries or not self.is_idempotent(request):
+            return False
+        return force or response.status_code in self.retry_on_status
+
+    def retry_error(self, request: httpx.Request, error: httpx.RequestError, attempt: int) -> bool:
+        """请求异常是否需要重试"""
+        if attempt >= self.max_retries:
+            return False
+        return isinstance(error, NOT_SENT_ERRORS) or self.is_idempotent(request)
+
+    def next_delay(self, previous: Optional[float], response: Optional[httpx.Response] = None) -> Optional[float]:
+        """下一次重试前的等待时间，Retry-After 超过上限时返回 None 表示放弃"""
+        retry_after = _retry_after(response) if response is not None else None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_retry_after else None
+        upper = max((previous or self.base_delay) * 3, self.base_delay)
+        return min(self.max_delay, random.uniform(self.base_delay, upper))
+
+    def spend(self) -> bool:
+        """消耗一次重试预算"""
+        return not self.use_budget or retry_budget.try_spend()
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期）"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+NO_RETRY = RetryPolicy(max_retries=0)